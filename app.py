@@ -1,22 +1,37 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import google.generativeai as genai
-from gtts import gTTS
-import json
-import io
-import threading
-import random
-import os
+import numpy as np
 import pandas as pd
 from datetime import datetime
+import hmac
 import time
-import gspread
-from google.oauth2.service_account import Credentials
+
+from gsheet_writer import get_sheet_writer
+from history_log import get_history_log
+from history_store import get_history_store
+from srs import SRSEngine
+from schedulers import DEFAULT_SCHEDULER, SCHEDULERS, get_scheduler
+from question_bank import get_question_bank
+from tts_cache import PREWARM_COUNT, get_tts_cache
+from audio_store import get_audio_store
+from audio_preprocess import preprocess_audio
+from audio_preprocess import stats as audio_preprocess_stats
+from eval_cache import audio_digest, get_eval_cache
+from evaluation import evaluation_key, get_evaluation_service
+from evaluators import evaluate_meaning_en, evaluate_meaning_jp, evaluate_pronunciation
+from gemini_client import generate, get_gemini_registry
+from instrumentation import get_profiler, start_metrics_server
+from rate_limiter import get_rate_limiter
+from similarity import get_similarity_index
+from word_index import get_word_index
 
 # --- 🛠️ 設定: モデル名はサイドバーで選択します --- 
 
 # --- ページ設定 ---
 st.set_page_config(page_title="AI英会話コーチ", page_icon="🎙️", layout="wide")
+# アプリ全体の実行時間の計測用 (フラグメント単独の再実行ではここは実行されない)
+RUN_STARTED = time.perf_counter()
+st.session_state.fragments_run = set()
 
 # --- 自動スクロール用JS (次へ進んだ時にトップに戻る) ---
 if st.session_state.get('scroll_to_top'):
@@ -86,6 +101,28 @@ def check_password():
 if not check_password():
     st.stop()
 
+def check_admin_password():
+    """
+    管理者パスワード (secrets の ADMIN_PASSWORD) の認証が済んでいれば True を返す。
+    ユーザー名は誰でも入力できるので、管理者かどうかはパスワードだけで判定する。
+    ADMIN_PASSWORD が未設定のときは管理者パネルを出さない。
+    """
+    admin_password = st.secrets.get("ADMIN_PASSWORD")
+    if not admin_password:
+        return False
+    if st.session_state.get("profiling_admin"):
+        return True
+
+    with st.expander("🔑 管理者"):
+        password = st.text_input("管理者パスワード", type="password", key="admin_password_input")
+        if st.button("認証", key="admin_login"):
+            if hmac.compare_digest(password.encode('utf-8'), str(admin_password).encode('utf-8')):
+                st.session_state.profiling_admin = True
+                st.rerun()
+            else:
+                st.error("パスワードが違います")
+    return False
+
 # --- CSS (スマホで見やすくするためのデザイン) ---
 st.markdown("""
     <style>
@@ -99,112 +136,49 @@ st.markdown("""
 
 # --- 履歴管理用の関数 ---
 # --- 🛠️ 高速化のためのキャッシュ関数 ---
-@st.cache_data
 def get_tts_audio_bytes(text):
-    """TTS音声を生成してバイト列で返す（キャッシュ対応・高速化）"""
+    """TTS音声をバイト列で返す（事前生成ストア → ディスクキャッシュ → gTTS の順）"""
     try:
-        if not text:
-            return None
-        tts = gTTS(text, lang='en')
-        mp3_fp = io.BytesIO()
-        tts.write_to_fp(mp3_fp)
-        return mp3_fp.getvalue()
+        # tts_pregen.py で事前生成済みなら mmap から読むだけ
+        store = get_audio_store()
+        data = store.get(text, lang='en') if store and text else None
+        if data is not None:
+            return data
+        return get_tts_cache().get(text, lang='en')
     except Exception:
         return None
 
+def prewarm_upcoming_audio():
+    """次に出題されそうな問題の模範音声をバックグラウンドで先に生成しておく"""
+    engine = st.session_state.get('srs_engine')
+    if engine is None:
+        return
+    bank = get_question_bank()
+    positions = (bank.position(w) for w in engine.upcoming(PREWARM_COUNT))
+    texts = [bank[b]['en'] for b in positions if b is not None]
+    get_tts_cache().prewarm(texts)
+
 # --- 履歴管理用の関数 (Google Sheets対応版) ---
-HISTORY_FILE = 'history.json'
 SHEET_NAME = 'EnglishCoach_Data' # ユーザーに作成してもらうスプレッドシート名
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive"
-]
-
-def get_gsheet_client():
-    """st.secretsから認証情報を読み込んでgspreadクライアントを返す"""
-    if "gcp_service_account" not in st.secrets:
-        return None
-    try:
-        creds_dict = dict(st.secrets["gcp_service_account"])
-        creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-        return gspread.authorize(creds)
-    except Exception as e:
-        st.error(f"Google Sheets認証エラー: {e}")
-        return None
 
-def load_history(force_reload=False):
+def get_store():
+    """プロセス共有の履歴ストアを返す (初回のみGSheet/ローカルから読み込む)"""
+    sa_info = dict(st.secrets["gcp_service_account"]) if "gcp_service_account" in st.secrets else None
+    return get_history_store(sa_info, SHEET_NAME)
+
+def load_history(user_name, force_reload=False):
     """
-    履歴を読み込む (Google Sheets優先)。
-    パフォーマンス向上のため、st.session_stateにキャッシュする。
-    force_reload=True の場合のみGSheetから再取得する。
+    指定ユーザーの履歴を返す。
+    履歴はプロセス内で1回だけ読み込み、全セッションで共有する (コピーしない)。
+    force_reload=True の場合のみ全件を再取得する。
     """
-    # キャッシュがあればそれを使う
-    if not force_reload and 'history_df' in st.session_state and st.session_state.history_df is not None:
-        return st.session_state.history_df
-
-    expected_headers = ["timestamp", "user", "word", "action", "score", "is_correct", "detail"]
-    df = pd.DataFrame(columns=expected_headers)
-    
-    client = get_gsheet_client()
-    if client:
-        try:
-            sheet = client.open(SHEET_NAME).sheet1
-            all_values = sheet.get_all_values()
-            
-            if all_values:
-                # 1行目がヘッダーかどうか確認
-                if all_values[0] == expected_headers:
-                    # 1行目がヘッダーなら、2行目以降をデータとして作成
-                    df = pd.DataFrame(all_values[1:], columns=expected_headers)
-                else:
-                    # 1行目がヘッダーでない（データ）なら、全行をデータとして使い、ヘッダーを付与
-                    df = pd.DataFrame(all_values, columns=expected_headers)
-        except gspread.exceptions.SpreadsheetNotFound:
-            pass # シートがない、設定されていない場合はスルー
-        except Exception:
-            pass
-
-    # フォールバック: ローカルJSON (GSheetが空、または失敗時かつローカルがある場合)
-    if df.empty and os.path.exists(HISTORY_FILE):
-        try:
-            local_df = pd.read_json(HISTORY_FILE, orient='records', convert_dates=['timestamp'])
-            if not local_df.empty:
-                df = local_df
-        except ValueError:
-            pass
-
-    # 型変換と整形
-    if not df.empty:
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-        if 'score' in df.columns:
-            df['score'] = pd.to_numeric(df['score'], errors='coerce').fillna(0)
-    else:
-        # 空の場合でもカラム定義は保持
-        df = pd.DataFrame(columns=expected_headers)
-
-    # セッションステートに保存
-    st.session_state.history_df = df
-    st.session_state.history_df = df
-    return df
-
-def write_gsheet_background(new_data, service_account_info):
-    """バックグラウンドレッドでGSheetに書き込む（UIブロック回避）"""
-    try:
-        # スコープはグローバル定義のSCOPESを使用
-        creds = Credentials.from_service_account_info(service_account_info, scopes=SCOPES)
-        client = gspread.authorize(creds)
-        sheet = client.open(SHEET_NAME).sheet1
-        
-        # データの書き込み (append)
-        save_values = list(new_data.values())
-        sheet.append_row(save_values)
-    except Exception as e:
-        # バックグラウンドでの失敗はコンソールに出力のみ
-        print(f"Background GSheet save failed: {e}")
+    store = get_store()
+    if force_reload:
+        store.refresh(force=True)
+    return store.user_view(user_name)
 
 def save_log(user_name, word, action_type, score=None, is_correct=None, detail=""):
-    """学習履歴を保存する (Google Sheets優先 + セッションステート更新)"""
+    """学習履歴を保存する (Google Sheets優先 + 共有ストア更新)"""
     new_data = {
         "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         "user": user_name,
@@ -215,176 +189,138 @@ def save_log(user_name, word, action_type, score=None, is_correct=None, detail="
         "detail": detail
     }
     
-    # 0. メモリ上のキャッシュ(history_df)を即時更新 (リロード回避)
-    if 'history_df' not in st.session_state:
-        load_history() # 初期化されてなければロード
-    
-    # DataFrameに追加するための形式変換
-    new_row_df = pd.DataFrame([new_data])
-    # timestampをdatetime型に変換しておくとソートで有利
-    new_row_df['timestamp'] = pd.to_datetime(new_row_df['timestamp'])
-    
-    if st.session_state.history_df.empty:
-        st.session_state.history_df = new_row_df
-    else:
-        st.session_state.history_df = pd.concat([st.session_state.history_df, new_row_df], ignore_index=True)
+    # 0. プロセス共有の履歴ストアを即時更新 (リロード回避)
+    get_store().append(new_data)
 
-    # 1. Google Sheets (非同期バックグラウンド書き込み)
+    # SRSの状態は記録された単語だけを更新する
+    engine = st.session_state.get('srs_engine')
+    if engine is not None and engine.user_name == user_name:
+        engine.record(word, action_type, new_data['score'], new_data['is_correct'], detail,
+                      datetime.strptime(new_data['timestamp'], '%Y-%m-%d %H:%M:%S'))
+
+    # 1. Google Sheets (常駐ライターのキューに積み、まとめて書き込む)
     if "gcp_service_account" in st.secrets:
         try:
             # st.secretsはスレッドセーフでない場合があるため、dictに変換して渡す
             sa_info = dict(st.secrets["gcp_service_account"])
-            t = threading.Thread(target=write_gsheet_background, args=(new_data, sa_info))
-            t.start()
+            get_sheet_writer(sa_info, SHEET_NAME).append(new_data.values())
         except Exception as e:
-            print(f"Failed to start background thread: {e}")
+            print(f"Failed to queue GSheet row: {e}")
 
     # 2. ローカル (フォールバック & バックアップ)
-    # ここはコスト削減のため、頻繁には読み書きしない設計もアリだが、
-    # 念のため追記しておく（ただし全量読み出しではなく追記モードが望ましいがJSONなので無理）
-    # 簡易的にセッションのDFをダンプする
+    # 追記専用ログに1行足すだけなので、履歴の量に関係なく一定コスト
     try:
-         st.session_state.history_df.to_json(HISTORY_FILE, orient='records', force_ascii=False, indent=4, date_format='iso')
-    except Exception:
-         pass
-
-# --- 関数: スマート出題順ソート (SRS + 関連語) ---
-def smart_sort_questions(questions, history_df, user_name, next_recommended_word=None):
+        get_history_log().append(new_data)
+    except Exception as e:
+        print(f"Local history append failed: {e}")
+
+# --- 関数: 出題順 (共有の問題バンク内の位置の配列。問題そのものはセッションにコピーしない) ---
+def set_question_order(order):
+    """出題順を設定し、バンク内の位置 -> 出題順の位置 の逆引きも作り直す"""
+    order = np.asarray(order, dtype=np.int32)
+    pos = np.empty_like(order)
+    pos[order] = np.arange(len(order), dtype=np.int32)
+    st.session_state.question_order = order
+    st.session_state.question_pos = pos
+
+def current_question():
+    return get_question_bank()[int(st.session_state.question_order[st.session_state.q_index])]
+
+# --- 関数: 次の問題へ (SRSエンジンのヒープから取り出す) ---
+def advance_to_next_question(recommended_word=None):
     """
-    学習履歴とおすすめ単語に基づいて問題をソートする。
-    優先順位:
-    1. AIおすすめ単語 (関連語チェイン)
-    2. 新規・忘却・失敗した単語 (SRS Review Due)
-    3. まだ先の単語
+    SRSエンジンから次の単語を取り出し、問題リストの先頭と入れ替える。
+    全件の再ソートは行わないため、履歴の量に関係なく O(log N) で済む。
     """
-    now = datetime.now()
-    scored_questions = []
+    engine = st.session_state.get('srs_engine')
+    order = st.session_state.question_order
+    pos = st.session_state.question_pos
+    word = engine.next_word(recommended_word) if engine else None
+    b = get_question_bank().position(word) if word is not None else None
+    if b is not None:
+        i, first = pos[b], order[0]
+        order[0], order[i] = b, first
+        pos[b], pos[first] = 0, i
+    st.session_state.q_index = 0
+    cancel_evaluations()
+    prewarm_upcoming_audio()
 
-    # 履歴データを辞書化して高速化 (O(N)対策)
-    # word -> list of history records
-    word_history_map = {}
-    
-    if not history_df.empty and 'user' in history_df.columns:
-        user_history = history_df[history_df['user'] == user_name]
-        for record in user_history.to_dict('records'):
-            w = record['word']
-            if w not in word_history_map:
-                word_history_map[w] = []
-            word_history_map[w].append(record)
-    
-    for q in questions:
-        word = q['word']
-        priority = 0
-        
-        # 0. AIおすすめ単語ブースト
-        if next_recommended_word and word.lower() == next_recommended_word.lower():
-            priority += 999999 # 最優先
-            
-        else:
-            # SRSロジック
-            # 辞書から履歴を取得 (高速)
-            records = word_history_map.get(word, [])
-            
-            streak = 0
-            last_review = None
-            
-            if records:
-                # 日付降順に並び替え (辞書化してるのでここでソートが必要だが、レコード数は少ないはず)
-                # stringのtimestampをdatetimeに変換してソート
-                for r in records:
-                    if not isinstance(r['timestamp'], datetime):
-                         try:
-                             r['timestamp'] = pd.to_datetime(r['timestamp'])
-                         except:
-                             pass
-                
-                # timestampを持つものだけでソート
-                valid_records = [r for r in records if isinstance(r['timestamp'], datetime)]
-                valid_records.sort(key=lambda x: x['timestamp'], reverse=True)
-                
-                if valid_records:
-                    last_review = valid_records[0]['timestamp']
-                    
-                    # ストリーク計算
-                    for row in valid_records:
-                        is_pass = row['is_correct']
-                        
-                        # 自己評価や発音スコアの考慮
-                        if row['action'] == 'Pronunciation' and row['score'] < 80:
-                            is_pass = False
-                        if row['action'] == 'SelfRating' and row['detail'] == 'Hard':
-                            is_pass = False
-                            
-                        if is_pass:
-                            streak += 1
-                        else:
-                            break # 連続正解ストップ
-            
-            # 間隔（日数）の決定
-            if streak == 0: interval = 0
-            elif streak == 1: interval = 1
-            elif streak == 2: interval = 3
-            elif streak == 3: interval = 7
-            elif streak == 4: interval = 14
-            else: interval = 30
-            
-            # 優先度（どれくらい期限を過ぎているか）
-            if last_review is None:
-                # 未学習: 優先度高めだが、おすすめよりは下
-                priority = 1000 + random.random()
-            else:
-                try:
-                     days_since = (now - last_review).total_seconds() / 86400
-                     # (経過日数 - 間隔) がプラスなら復習時期
-                     priority = days_since - interval
-                except:
-                     priority = 1000 # エラー時は未学習扱い
-        
-        q['priority'] = priority
-        scored_questions.append(q)
-        
-    # 優先度が高い順にソート
-    scored_questions.sort(key=lambda x: x['priority'], reverse=True)
-    return scored_questions
+# 関連語チェインの候補にする、字面の近い単語の数
+CHAIN_NEIGHBORS = 5
+
+def related_candidates(word):
+    """関連語チェインの候補: 事前計算した類義語・反意語、続いて字面の近い単語 (どちらもネットワーク不要)"""
+    candidates = get_word_index().related_words(word)
+    for neighbor in get_similarity_index().similar_words(word, CHAIN_NEIGHBORS):
+        if neighbor not in candidates:
+            candidates.append(neighbor)
+    return candidates
+
+# --- 関数: 判定の非同期実行 (評価サービス) ---
+# 判定待ちがある間、結果を確認するために再実行する間隔 (秒)
+EVAL_POLL_INTERVAL = 0.5
+
+def get_prepared_audio(audio_file):
+    """
+    録音を前処理 (モノラル化・16kHz化・無音削除) し、(音声, MIMEタイプ, ダイジェスト) を返す。
+    同じ録音を再実行のたびに処理・ハッシュし直さないよう file_id ごとに覚えておく。
+    """
+    prepared = st.session_state.setdefault('prepared_audio', {})
+    entry = prepared.get(audio_file.file_id)
+    if entry is None:
+        data, mime_type = preprocess_audio(audio_file.getvalue(), codec="flac")
+        entry = prepared[audio_file.file_id] = (data, mime_type, audio_digest(data))
+    return entry
+
+def request_evaluation(section, fn, audio_file, targets, api_key, model_name):
+    """
+    判定を評価サービスに投入し (投入済み・キャッシュ済みなら何もしない)、(キー, 結果) を返す。
+    結果が未完了なら None。section (Practice のセクション名) ごとに直近の判定のキーを覚えておく。
+    """
+    service = get_evaluation_service()
+    data, mime_type, digest = get_prepared_audio(audio_file)
+    key = evaluation_key(fn, digest, targets, model_name)
+    service.submit(key, fn, data, *targets, api_key, model_name, mime_type=mime_type, stream=True)
+    st.session_state.setdefault('eval_keys', set()).add(key)
+    st.session_state.setdefault('section_evals', {})[section] = key
+    return key, service.poll(key)
+
+def show_partial_transcription(key, waiting_message):
+    """判定待ちの間、ストリーミングで先に届いた聞き取り結果を表示する"""
+    partial = get_evaluation_service().partial(key)
+    if 'transcription' in partial:
+        st.info(f"{waiting_message}\n\n(聞き取り: {partial['transcription']})")
+    else:
+        st.info(waiting_message)
+
+def log_once(key):
+    """判定結果の履歴保存は1回だけ (結果待ちの再実行のたびに保存しない)"""
+    logged = st.session_state.setdefault('logged_eval_keys', set())
+    if key in logged:
+        return False
+    logged.add(key)
+    return True
+
+def cancel_evaluations():
+    """前の問題の未完了の判定を取り消す"""
+    service = get_evaluation_service()
+    for key in st.session_state.get('eval_keys', ()):
+        if service.is_pending(key):
+            service.cancel(key)
+    st.session_state.eval_keys = set()
+    st.session_state.section_evals = {}
+    st.session_state.logged_eval_keys = set()
+    st.session_state.prepared_audio = {}
 
 # --- セッション状態の初期化 ---
-if 'questions' not in st.session_state:
-    questions_data = []
-    
-    # questions.jsonが存在すれば読み込む
-    if os.path.exists('questions.json'):
-        try:
-            with open('questions.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # 英文(en)が入っているデータのみを抽出
-                questions_data = [q for q in data if q.get('en')]
-        except Exception as e:
-            st.error(f"問題ファイルの読み込みに失敗しました: {e}")
-    
-    # ファイルがない、または読み込み失敗時のデフォルト問題
-    if not questions_data:
-        questions_data = [
-            {
-                "word": "Photography", 
-                "word_jp": "写真撮影", 
-                "word_en": "the art or practice of taking and processing photographs",
-                "en": "I am interested in photography.", 
-                "jp": "私は写真に興味があります。"
-            },
-            {
-                "word": "Appointment", 
-                "word_jp": "予約", 
-                "word_en": "an arrangement to meet someone at a particular time and place",
-                "en": "I'd like to make an appointment.", 
-                "jp": "予約を取りたいのですが。"
-            }
-        ]
-    
-    st.session_state.questions = questions_data
-    # 初回はランダムではなく、スマートソート（履歴なし=ランダムに近い）
-    # ユーザー名がまだ決まっていない(sidebar前)なので、後で再ソートするフラグを立てるか、デフォルトでやる
-    # ここでは仮に空履歴でソート
-    st.session_state.questions = smart_sort_questions(st.session_state.questions, pd.DataFrame(), "Guest")
+if 'question_order' not in st.session_state:
+    # 問題バンクはプロセス内で1回だけ読み込み、全セッションで共有する
+    bank = get_question_bank()
+    if bank.load_error:
+        st.error(f"問題ファイルの読み込みに失敗しました: {bank.load_error}")
+    # ユーザー名がまだ決まっていない(sidebar前)ので、ここでは仮に空履歴で並べる
+    # (履歴なし=ランダムに近い。ユーザーが決まったらサイドバーで並べ直す)
+    set_question_order(SRSEngine("Guest").order(bank.words))
 
 if 'q_index' not in st.session_state:
     st.session_state.q_index = 0
@@ -393,183 +329,14 @@ if 'current_user' not in st.session_state:
     st.session_state.current_user = None
 
 
-# --- 関数: Geminiによる判定 (英語発音 - 英文) ---
-@st.cache_data(show_spinner=False)
-def evaluate_pronunciation(audio_bytes, target_sentence, api_key, model_name):
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        
-        prompt = f"""
-        Role: Strict English Coach.
-        Task: Evaluate pronunciation of the audio against the target sentence.
-        Target: "{target_sentence}"
-        
-        Output JSON only:
-        {{
-            "transcription": "Transcribed speech",
-            "score": 0-100 (Integer, Strict),
-            "advice": "Brief advice in Japanese (max 2 sentences) focusing on improvement."
-        }}
-        """
-        response = model.generate_content([
-            prompt,
-            {"mime_type": "audio/wav", "data": audio_bytes}
-        ])
-        
-        text_resp = response.text.strip()
-        if text_resp.startswith("```json"):
-            text_resp = text_resp.replace("```json", "").replace("```", "")
-        return json.loads(text_resp)
-        
-    except Exception as e:
-        return {"error": str(e)}
-
-# --- 関数: Geminiによる意味判定 (日本語回答) ---
-@st.cache_data(show_spinner=False)
-def evaluate_meaning_jp(audio_bytes, target_word, target_meaning, api_key, model_name):
-    try:
-        prompt = f"""
-        Role: Supportive Teacher.
-        Task: 
-        1. Transcribe the user's Japanese audio accurately.
-        2. Check if the meaning matches the English word "{target_word}".
-        
-        Expected Meaning: "{target_meaning}"
-        Criteria: 
-        - Transcription: Strict and accurate.
-        - Meaning Evaluation: Lenient. If the meaning is generally correct, mark it as correct even if the wording is different.
-        
-        Output JSON only:
-        {{
-            "transcription": "The exact transcription of what the user said",
-            "is_correct": boolean,
-            "comment": "Brief encouragement and feedback in Japanese (max 1-2 sentences)."
-        }}
-        """
-
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content([
-            prompt,
-            {"mime_type": "audio/wav", "data": audio_bytes}
-        ])
-        
-        text_resp = response.text.strip()
-        if text_resp.startswith("```json"):
-            text_resp = text_resp.replace("```json", "").replace("```", "")
-        return json.loads(text_resp)
-        
-    except Exception as e:
-        return {"error": str(e)}
-
-# --- 関数: Geminiによる英英定義判定 (英語回答) ---
-@st.cache_data(show_spinner=False)
-def evaluate_meaning_en(audio_bytes, target_word, target_def_en, api_key, model_name):
-    try:
-        prompt = f"""
-        Role: Supportive Teacher.
-        Task: 
-        1. Transcribe the user's English audio accurately.
-        2. Check if the explanation matches the meaning of "{target_word}".
-        
-        Definition: "{target_def_en}"
-        Criteria: 
-        - Transcription: Strict and accurate.
-        - Meaning Evaluation: Lenient. Accept simple explanations or keywords if the core idea is conveyed.
-        
-        Output JSON only:
-        {{
-            "transcription": "The exact transcription of what the user said",
-            "is_correct": boolean,
-            "comment": "Brief encouragement and feedback in Japanese (max 2 sentences)."
-        }}
-        """
-
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content([
-            prompt,
-            {"mime_type": "audio/wav", "data": audio_bytes}
-        ])
-        
-        text_resp = response.text.strip()
-        if text_resp.startswith("```json"):
-            text_resp = text_resp.replace("```json", "").replace("```", "")
-        return json.loads(text_resp)
-        
-    except Exception as e:
-        return {"error": str(e)}
-
-
-# --- 関数: AIヒント生成 ---
-@st.cache_data(show_spinner=False)
-def generate_ai_hint(target_word, target_def, api_key, model_name):
-    try:
-        prompt = f"""
-        Word: "{target_word}"
-        Definition: "{target_def}"
-        
-        Task: Provide 3 simple English keywords or concepts that are related to this word, to help someone explain it. 
-        Do not use the word itself or its direct derivatives.
-        For example, if the word is 'Apple', keywords could be 'Fruit, Red, Pie'.
-        Output format: Keyword1, Keyword2, Keyword3
-        """
-        
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt)
-
-        return response.text.strip()
-    except Exception as e:
-        return "Hint not available"
-
-# --- 関数: 関連語の取得 (AI) ---
-@st.cache_data(show_spinner=False)
-def get_related_words_ai(target_word, api_key, model_name):
-    """
-    指定された単語の類義語・反意語をAIにリストアップさせる。
-    返り値: リスト ["word1", "word2", ...]
-    """
-    try:
-        prompt = f"""
-        Task: List 5 synonyms and 5 antonyms for the word "{target_word}".
-        Output ONLY the words, separated by commas. No labels like 'Synonyms:'.
-        Simple format: word1, word2, word3...
-        """
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt)
-        
-        text = response.text.strip()
-        words = [w.strip().lower() for w in text.split(',')]
-        return words
-    except:
-        return []
-
-
-
 # --- サイドバー: ユーザー設定 ---
 with st.sidebar:
     st.header("👤 ユーザー設定")
     
     # 履歴からユーザーリストを取得
-    df_history = load_history()
-    existing_users = []
-    if not df_history.empty and 'user' in df_history.columns:
-        # ユーザーごとの最終アクティビティ時刻を取得してソート
-        # これにより、最後に使った人がデフォルトで選択されるようになる
-        if 'timestamp' in df_history.columns:
-            # timestampがdatetime型であることを保証
-            df_history['timestamp'] = pd.to_datetime(df_history['timestamp'], errors='coerce')
-            
-            # ユーザーごとに最新のタイムスタンプを取得
-            last_active = df_history.groupby('user')['timestamp'].max().reset_index()
-            # 最新順にソート
-            last_active = last_active.sort_values('timestamp', ascending=False)
-            existing_users = last_active['user'].tolist()
-        else:
-            existing_users = df_history['user'].dropna().unique().tolist()
+    # ユーザーごとの最終アクティビティ時刻の新しい順
+    # これにより、最後に使った人がデフォルトで選択されるようになる
+    existing_users = get_store().users_by_last_active()
     
     # ユーザー選択のUI
     if existing_users:
@@ -611,16 +378,29 @@ with st.sidebar:
              st.query_params["user"] = user_name
 
     st.info(f"現在のユーザー: **{user_name}** さん")
+
+    # 復習スケジュールのアルゴリズム (固定間隔 / SM-2 / FSRS)
+    scheduler_name = st.selectbox(
+        "復習スケジュール",
+        list(SCHEDULERS),
+        index=list(SCHEDULERS).index(DEFAULT_SCHEDULER),
+        format_func=lambda name: SCHEDULERS[name].label,
+    )
     
-    # ユーザーが切り替わったら問題を再ソート
-    if st.session_state.current_user != user_name:
+    # ユーザー・アルゴリズムが切り替わったら問題を再ソート
+    if st.session_state.current_user != user_name or st.session_state.get('scheduler_name') != scheduler_name:
         st.session_state.current_user = user_name
-        history_df = load_history()
+        st.session_state.scheduler_name = scheduler_name
+        history_df = load_history(user_name)
         # 次の単語のリセット
         if 'next_recommended_word' in st.session_state:
             del st.session_state['next_recommended_word']
             
-        st.session_state.questions = smart_sort_questions(st.session_state.questions, history_df, user_name)
+        # ユーザーのSRS状態を1回だけ構築し、以降はログごとに差分更新する
+        engine = SRSEngine.from_history(history_df, user_name, get_scheduler(scheduler_name))
+        st.session_state.srs_engine = engine
+        set_question_order(engine.order(get_question_bank().words))
+        prewarm_upcoming_audio()
         st.session_state.q_index = 0
         if 'q_turn' not in st.session_state: st.session_state.q_turn = 0
         st.session_state.q_turn += 1 # ターンを進めてキーを一新
@@ -643,9 +423,7 @@ with st.sidebar:
             st.error("APIキーが設定されていません")
         else:
             try:
-                genai.configure(api_key=api_key_test)
-                model_test = genai.GenerativeModel(model_name)
-                response_test = model_test.generate_content("Hello")
+                response_test = generate(api_key_test, model_name, "Hello")
                 st.success(f"[AI Studio] 接続成功！\nResponse: {response_test.text}")
             except Exception as e:
                 st.error(f"接続エラー: {e}")
@@ -659,10 +437,40 @@ with st.sidebar:
             st.error("⚠️ APIキーが必要です")
             st.stop()
 
+    # Gemini の利用状況 (モデルごとの呼び出し回数・エラー・レイテンシ・トークン数)
+    gemini_stats = get_gemini_registry().stats()
+    if gemini_stats:
+        with st.expander("📈 Gemini 利用状況"):
+            st.dataframe(pd.DataFrame.from_dict(gemini_stats, orient='index'), use_container_width=True)
+            cache_stats = get_eval_cache().stats()
+            st.caption(f"判定キャッシュ: ヒット {cache_stats['hits']} / ミス {cache_stats['misses']} / "
+                       f"{cache_stats['entries']} 件 ({cache_stats['bytes'] / 1024:.0f} KB)")
+            for limited_model, limit_stats in get_rate_limiter().stats().items():
+                st.caption(f"{limited_model}: 待ち {limit_stats['queued']} 件 "
+                           f"(判定 {limit_stats['queued_interactive']} / バックグラウンド {limit_stats['queued_background']}) / "
+                           f"混雑で待機 {limit_stats['throttled']} 回 / 残り {limit_stats['rpm_available']} RPM")
+            prep_stats = audio_preprocess_stats.as_dict()
+            st.caption(f"音声前処理: {prep_stats['count']} 件 / "
+                       f"{prep_stats['bytes_saved'] / 1024:.0f} KB 削減 "
+                       f"({prep_stats['bytes_in'] / 1024:.0f} KB → {prep_stats['bytes_out'] / 1024:.0f} KB)")
+
     st.divider()
     with st.expander("☁️ データ保存設定 (Google Sheets)"):
         if "gcp_service_account" in st.secrets:
             st.success("✅ 連携済み (Google Sheets)")
+            writer_stats = get_sheet_writer(dict(st.secrets["gcp_service_account"]), SHEET_NAME).stats()
+            st.caption(f"送信待ち: {writer_stats['pending']} 行 / 送信失敗: {writer_stats['failed']} 行")
+            if writer_stats['retryable']:
+                st.caption("送信に失敗した行はアプリの再起動で破棄されます (ローカルログには保存済み)")
+                if st.button(f"失敗した {writer_stats['retryable']} 行を再送", key="sheet_retry_failed"):
+                    get_sheet_writer(dict(st.secrets["gcp_service_account"]), SHEET_NAME).retry_failed()
+                    st.rerun()
+            if writer_stats['dropped']:
+                st.caption(f"再送できずに破棄: {writer_stats['dropped']} 行 (ローカルログには保存済み)")
+            if writer_stats['last_error']:
+                st.warning(f"直近の書き込みエラー: {writer_stats['last_error']}")
+            if get_store().last_error:
+                st.error(f"Google Sheets読み込みエラー: {get_store().last_error}")
         else:
             st.warning("⚠️ 未連携 (データは一時保存のみ)")
             st.markdown("""
@@ -684,41 +492,64 @@ client_email = "..."
 ...
             """, language="toml")
 
-# --- メイン画面 ---
-st.title("🎙️ AI English Coach")
-
-# タブの作成
-tab_practice, tab_history = st.tabs(["🔥 トレーニング (Practice)", "📊 学習履歴 (History)"])
-
-# ==========================================
-# タブ1: トレーニング (Practice)
-# ==========================================
-with tab_practice:
-    # ターン数の初期化（キーの重複回避用）
-    if 'q_turn' not in st.session_state:
-        st.session_state.q_turn = 0
+        # 共有履歴ストアのメモリ使用量
+        # (メモリ量は全件の走査になるので、ボタンを押したときだけ計算する)
+        store_usage = get_store().memory_usage()
+        st.caption(f"履歴ストア: {store_usage['users']} ユーザー / {store_usage['rows']} 行")
+        if st.button("メモリ使用量を計算", key="store_memory_bytes"):
+            st.caption(f"履歴ストアのメモリ: {get_store().memory_bytes() / 1024 / 1024:.1f} MB")
+
+    # 処理時間の計測 (secrets の ADMIN_PASSWORD を入力したセッションのみ表示)
+    if check_admin_password():
+        profiler = get_profiler()
+        with st.expander("🩺 処理時間の計測 (管理者)"):
+            profiler.enabled = st.toggle("計測する", value=profiler.enabled, key="profiling_enabled")
+            span_stats = profiler.summary()
+            if span_stats:
+                st.dataframe(pd.DataFrame.from_dict(span_stats, orient='index')[
+                    ['count', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'mean_ms']], use_container_width=True)
+                col_d1, col_d2, col_d3 = st.columns(3)
+                col_d1.download_button("JSON", profiler.to_json(), "metrics.json", "application/json")
+                col_d2.download_button("Prometheus", profiler.to_prometheus(), "metrics.prom", "text/plain")
+                if col_d3.button("リセット", key="profiling_reset"):
+                    profiler.reset()
+            else:
+                st.caption("まだ計測結果がありません")
 
-    # 全問終了チェック
-    if st.session_state.q_index >= len(st.session_state.questions):
-        st.balloons()
-        st.success("🎉 すべてのトレーニングが完了しました！")
-        if st.button("もう一度最初から"):
-            st.session_state.q_index = 0
-            random.shuffle(st.session_state.questions)
-            st.session_state.q_turn += 1
-            st.rerun()
-        st.stop()
+# 計測結果の HTTP エクスポート (環境変数 COACH_METRICS_PORT を指定した場合のみ)
+start_metrics_server()
 
-    # 現在の問題を取得
-    q = st.session_state.questions[st.session_state.q_index]
+# --- フラグメント: Practice の各セクション ---
+# 録音・再生ボタンの操作ではそのセクションだけを再実行し、ページ全体 (サイドバー等) は再実行しない
+def fragment_rerun(name):
+    """
+    フラグメントの先頭で呼ぶ。アプリ全体の実行のあと、このフラグメントだけが再実行されていれば True。
+    (アプリ全体の実行では、各フラグメントは1回ずつしか実行されない)
+    """
+    seen = st.session_state.fragments_run
+    if name in seen:
+        return True
+    seen.add(name)
+    return False
 
-    # --- UI表示 ---
-    st.progress((st.session_state.q_index) / len(st.session_state.questions))
-    st.caption(f"Question {st.session_state.q_index + 1} / {len(st.session_state.questions)}")
+def wait_in_fragment(key):
+    """判定待ちの間、少し待ってからこのフラグメントだけを再実行する (フラグメント単独の再実行中のみ)"""
+    get_evaluation_service().wait_any([key], timeout=EVAL_POLL_INTERVAL)
+    st.rerun(scope="fragment")
 
-    # 1. 単語表示
-    st.markdown(f"<p class='word-font'>Word: {q.get('word', '')}</p>", unsafe_allow_html=True)
+def eval_section(section, name, *args):
+    """
+    判定を含むセクションをフラグメントとして実行する。
+    アプリ全体の実行中は st.rerun(scope="fragment") を使えないので、このセクションの判定が
+    未完了のまま全体が再実行された場合は run_every でフラグメントだけを定期的に再実行して結果を待つ
+    (タイマーは次のアプリ全体の実行で止まる)。
+    """
+    key = st.session_state.get('section_evals', {}).get(name)
+    polling = key is not None and get_evaluation_service().is_pending(key)
+    st.fragment(section, run_every=EVAL_POLL_INTERVAL if polling else None)(*args, polling=polling)
 
+def meaning_jp_section(q, user_name, api_key, model_name, polling=False):
+    rerun = fragment_rerun("meaning_jp")
     # --- A. 単語の意味チェック (日本語) ---
     if q.get('word_jp'):
         st.write("🇯🇵 **意味を「日本語」で答えてみよう**")
@@ -731,31 +562,38 @@ with tab_practice:
         meaning_jp_audio = st.audio_input("録音ボタンを押して、日本語で意味を話してください", key=meaning_jp_key)
 
         if meaning_jp_audio:
-            st.spinner("日本語の意味を判定中... 🤔")
-            res_jp = evaluate_meaning_jp(meaning_jp_audio.read(), q.get('word'), q.get('word_jp'), api_key, model_name)
+            # 録音が届いた時点で投入し、他の判定と並列に実行する
+            jp_key, res_jp = request_evaluation("meaning_jp", evaluate_meaning_jp, meaning_jp_audio, (q.get('word'), q.get('word_jp')), api_key, model_name)
             
-            if "error" in res_jp:
+            if res_jp is None:
+                show_partial_transcription(jp_key, "日本語の意味を判定中... 🤔")
+                if rerun and not polling:
+                    wait_in_fragment(jp_key)
+            elif "error" in res_jp:
                 st.error(f"エラー: {res_jp['error']}")
             elif res_jp:
                 if res_jp.get('is_correct'):
                     st.success(f"⭕ **正解！** (聞き取り: {res_jp['transcription']})\n\n{res_jp['comment']}")
                     # 履歴保存 (正解のみ、または常に保存も可。今回は実施時に保存)
-                    save_log(user_name, q['word'], "Japanese Meaning", score=100, is_correct=True, detail=res_jp['transcription'])
+                    if log_once(jp_key):
+                        save_log(user_name, q['word'], "Japanese Meaning", score=100, is_correct=True, detail=res_jp['transcription'])
                 else:
                     st.error(f"❌ **不正解...** (聞き取り: {res_jp['transcription']})\n\n{res_jp['comment']}")
-                    save_log(user_name, q['word'], "Japanese Meaning", score=0, is_correct=False, detail=res_jp['transcription'])
-                
-
-
-    st.markdown("---")
+                    if log_once(jp_key):
+                        save_log(user_name, q['word'], "Japanese Meaning", score=0, is_correct=False, detail=res_jp['transcription'])
 
+def meaning_en_section(q, user_name, api_key, model_name, polling=False):
+    rerun = fragment_rerun("meaning_en")
     # --- B. 単語の意味チェック (英語) ---
-    # word_enがある場合のみ表示
-
     # word_enがある場合のみ表示
     if q.get('word_en'):
         st.write("🇺🇸 **意味を「英語」で説明してみよう**")
         
+        hint = get_word_index().hint(q['word'])
+        if hint:
+            with st.expander("💡 ヒント (Hint)"):
+                st.write(hint)
+
         with st.expander("正解を表示 (Show Answer)"):
             st.write(q.get('word_en'))
         
@@ -763,26 +601,30 @@ with tab_practice:
         meaning_en_audio = st.audio_input("録音ボタンを押して、英語で意味を説明してください", key=meaning_en_key)
 
         if meaning_en_audio:
-            st.spinner("英語の説明を判定中... 🤔")
-            res_en = evaluate_meaning_en(meaning_en_audio.read(), q.get('word'), q.get('word_en'), api_key, model_name)
+            en_key, res_en = request_evaluation("meaning_en", evaluate_meaning_en, meaning_en_audio, (q.get('word'), q.get('word_en')), api_key, model_name)
             
-            if "error" in res_en:
+            if res_en is None:
+                show_partial_transcription(en_key, "英語の説明を判定中... 🤔")
+                if rerun and not polling:
+                    wait_in_fragment(en_key)
+            elif "error" in res_en:
                 st.error(f"エラー: {res_en['error']}")
             elif res_en:
                 if res_en.get('is_correct'):
                     st.success(f"⭕ **Great!** (You said: \"{res_en['transcription']}\")\n\n{res_en['comment']}")
-                    save_log(user_name, q['word'], "English Definition", score=100, is_correct=True, detail=res_en['transcription'])
+                    if log_once(en_key):
+                        save_log(user_name, q['word'], "English Definition", score=100, is_correct=True, detail=res_en['transcription'])
                 else:
                     st.error(f"❌ **Not quite...** (You said: \"{res_en['transcription']}\")\n\n{res_en['comment']}")
-                    save_log(user_name, q['word'], "English Definition", score=0, is_correct=False, detail=res_en['transcription'])
+                    if log_once(en_key):
+                        save_log(user_name, q['word'], "English Definition", score=0, is_correct=False, detail=res_en['transcription'])
 
 
 
         st.markdown("---")
 
-    # 2. 英文表示
-    st.markdown(f"<p class='big-font'>{q['en']}</p>", unsafe_allow_html=True)
-
+@st.fragment
+def model_audio_section(q):
     # 模範音声
     with st.expander("🎧 英文の模範音声を聞く"):
         if q.get('en'):
@@ -795,8 +637,10 @@ with tab_practice:
             else:
                 if st.button("🔊 音声を生成・再生", key=f"btn_load_audio_{st.session_state.q_turn}"):
                     st.session_state[audio_loaded_key] = True
-                    st.rerun()
+                    st.rerun(scope="fragment")
 
+def pronunciation_section(q, user_name, api_key, model_name, polling=False):
+    rerun = fragment_rerun("pronunciation")
     # 3. 英文録音ボタン
     st.write("🗣️ **この英文を音読してください**")
     
@@ -808,11 +652,26 @@ with tab_practice:
     audio_value = st.audio_input("録音ボタンを押して、英文を読んでください", key=audio_key)
 
     if audio_value:
-        st.write("発音判定中... 🤖")
-        
-        result = evaluate_pronunciation(audio_value.read(), q['en'], api_key, model_name)
+        pron_key, result = request_evaluation("pronunciation", evaluate_pronunciation, audio_value, (q['en'],), api_key, model_name)
         
-        if "error" in result:
+        if result is None:
+            # ストリーミングで届いたスコア・聞き取りを、アドバイスより先に表示する
+            partial = get_evaluation_service().partial(pron_key)
+            if 'score' in partial or 'transcription' in partial:
+                st.subheader("診断結果")
+                col1, col2 = st.columns([1, 2])
+                with col1:
+                    if 'score' in partial:
+                        st.metric("Score", f"{partial['score']} / 100")
+                with col2:
+                    if 'transcription' in partial:
+                        st.write(f"**聞き取り:** {partial['transcription']}")
+                st.write("アドバイスを生成中... 🤖")
+            else:
+                st.write("発音判定中... 🤖")
+            if rerun and not polling:
+                wait_in_fragment(pron_key)
+        elif "error" in result:
             st.error(f"エラー: {result['error']}")
         elif result:
             # --- UI表示 (判定結果) ---
@@ -826,7 +685,8 @@ with tab_practice:
                 st.write(f"**聞き取り:** {result['transcription']}")
             
             # 履歴保存
-            save_log(user_name, q['word'], "Pronunciation", score=result['score'], is_correct=(result['score'] >= 80), detail=f"Transcription: {result['transcription']}")
+            if log_once(pron_key):
+                save_log(user_name, q['word'], "Pronunciation", score=result['score'], is_correct=(result['score'] >= 80), detail=f"Transcription: {result['transcription']}")
 
 
 
@@ -838,6 +698,64 @@ with tab_practice:
             else:
                 st.error(f"**Try Again...**\n{result['advice']}")
 
+# --- メイン画面 ---
+st.title("🎙️ AI English Coach")
+
+# 表示の切り替え (st.tabs と違い、選ばれていない方は実行しない)
+VIEWS = {"practice": "🔥 トレーニング (Practice)", "history": "📊 学習履歴 (History)"}
+main_view = st.segmented_control(
+    "表示", list(VIEWS), format_func=VIEWS.get, default="practice",
+    key="main_view", label_visibility="collapsed",
+) or "practice"
+
+# ==========================================
+# タブ1: トレーニング (Practice)
+# ==========================================
+if main_view == "practice":
+    # ターン数の初期化（キーの重複回避用）
+    if 'q_turn' not in st.session_state:
+        st.session_state.q_turn = 0
+
+    # 全問終了チェック
+    if st.session_state.q_index >= len(st.session_state.question_order):
+        st.balloons()
+        st.success("🎉 すべてのトレーニングが完了しました！")
+        if st.button("もう一度最初から"):
+            st.session_state.q_index = 0
+            order = st.session_state.question_order.copy()
+            np.random.shuffle(order)
+            set_question_order(order)
+            st.session_state.q_turn += 1
+            st.rerun()
+        st.stop()
+
+    # 現在の問題を取得
+    q = current_question()
+
+    # --- UI表示 ---
+    st.progress((st.session_state.q_index) / len(st.session_state.question_order))
+    st.caption(f"Question {st.session_state.q_index + 1} / {len(st.session_state.question_order)}")
+
+    # 1. 単語表示
+    st.markdown(f"<p class='word-font'>Word: {q.get('word', '')}</p>", unsafe_allow_html=True)
+
+    # --- A. 単語の意味チェック (日本語) ---
+    eval_section(meaning_jp_section, "meaning_jp", q, user_name, api_key, model_name)
+
+    st.markdown("---")
+
+    # --- B. 単語の意味チェック (英語) ---
+    eval_section(meaning_en_section, "meaning_en", q, user_name, api_key, model_name)
+
+    # 2. 英文表示
+    st.markdown(f"<p class='big-font'>{q['en']}</p>", unsafe_allow_html=True)
+
+    # 模範音声
+    model_audio_section(q)
+
+    # 3. 英文録音と発音判定
+    eval_section(pronunciation_section, "pronunciation", q, user_name, api_key, model_name)
+
     # アドバイスと次へ (自己評価付き)
     st.subheader("自己評価 & 次へ")
     
@@ -851,10 +769,8 @@ with tab_practice:
             save_log(user_name, q['word'], "SelfRating", score=0, is_correct=False, detail="Hard")
             
             # 関連語検索はスキップ（苦手克服を優先）
-            # 再ソートして次へ
-            history_df = load_history()
-            st.session_state.questions = smart_sort_questions(st.session_state.questions, history_df, user_name, None)
-            st.session_state.q_index = 0
+            # SRSヒープから次の問題へ
+            advance_to_next_question()
             st.session_state.q_turn += 1
             st.session_state.scroll_to_top = True
             st.rerun()
@@ -865,87 +781,89 @@ with tab_practice:
         if st.button("😎 覚えた！ (Easy/Next)", key=f"btn_easy_turn{st.session_state.q_turn}", type="primary"):
             save_log(user_name, q['word'], "SelfRating", score=100, is_correct=True, detail="Easy")
             
-            # 関連語検索 (Dynamic Chaining) は動作高速化のためにスキップ
-            st.session_state.next_recommended_word = None
+            # 関連語チェイン: 関連語・近い単語のうち、復習期限の来たものを次に出す
+            engine = st.session_state.get('srs_engine')
+            related = related_candidates(q['word'])
+            st.session_state.next_recommended_word = engine.pick_recommended(related) if engine else None
             
-            # 再ソート
-            history_df = load_history()
-            st.session_state.questions = smart_sort_questions(st.session_state.questions, history_df, user_name, st.session_state.next_recommended_word)
-            st.session_state.q_index = 0
+            # SRSヒープから次の問題へ
+            advance_to_next_question(st.session_state.next_recommended_word)
             st.session_state.q_turn += 1
             st.session_state.scroll_to_top = True
             st.rerun()
 
+# 詳細データテーブルの1ページあたりの件数
+HISTORY_PAGE_SIZES = [50, 100, 500]
+
 # ==========================================
 # タブ2: 学習履歴 (History)
 # ==========================================
-with tab_history:
+if main_view == "history":
     st.header(f"📊 {user_name}さんの学習履歴")
     
-    df = load_history()
+    # 集計はストアが差分で更新しているので、ここでは読むだけ
+    analytics = get_store().user_analytics(user_name)
     
-    if not df.empty:
-        # ユーザーでフィルタリング
-        if 'user' not in df.columns:
-            st.error("⚠️ 履歴データの形式が正しくありません。")
-            st.warning("Googleスプレッドシートの1行目に不要なテキストが入っている可能性があります。シートの **1行目(A1)** をすべて削除して、空の状態にしてください。")
-            st.write("現在のヘッダー:", df.columns.tolist())
-        else:
-            user_df = df[df['user'] == user_name].copy()
+    if analytics.events:
+        # 習熟度集計 (単語ごとの最新の SelfRating をもとに計算)
+        mastered_count = analytics.mastered
+        review_count = analytics.review
+
+        total_q = len(get_question_bank())
+        # 未学習 = 全体 - (覚えた + 不安)
+        unlearned_count = max(0, total_q - (mastered_count + review_count))
+
+        # 概要メトリクス表示
+        col_m1, col_m2, col_m3 = st.columns(3)
+        with col_m1:
+            st.metric("✅ 覚えた単語 (Mastered)", f"{mastered_count}", delta=f"{(mastered_count/total_q*100):.1f}%" if total_q else None)
+        with col_m2:
+            st.metric("🔥 不安な単語 (Review)", f"{review_count}", delta_color="inverse")
+        with col_m3:
+            st.metric("⬜ 未学習 (Unlearned)", f"{unlearned_count}")
+
+        # グラフ表示 1: 日付ごとの活動量 (Actions per Day)
+        st.subheader("📅 Daily Activity")
+        daily_counts = analytics.daily_frame()
+        if not daily_counts.empty:
+            st.bar_chart(daily_counts, x='date', y='count')
+
+        # グラフ表示 2: 発音スコアの推移
+        chart_df = analytics.score_frame()
+        if not chart_df.empty:
+            st.subheader("📈 Pronunciation Score Progress")
+            st.line_chart(chart_df, x='timestamp', y='score')
         
-        if not user_df.empty:
-            # 最新順に並び替え
-            user_df = user_df.sort_values('timestamp', ascending=False)
-            
-            # 習熟度集計 (SelfRatingの最新状態をもとに計算)
-            status_df = user_df[user_df['action'] == 'SelfRating'].sort_values('timestamp')
-            
-            mastered_count = 0
-            review_count = 0
-            
-            if not status_df.empty:
-                # 単語ごとの最新ステータスを取得
-                latest_status = status_df.drop_duplicates('word', keep='last')
-                mastered_count = len(latest_status[latest_status['detail'] == 'Easy'])
-                review_count = len(latest_status[latest_status['detail'] == 'Hard'])
-
-            total_q = len(st.session_state.questions) if 'questions' in st.session_state else 0
-            # 未学習 = 全体 - (覚えた + 不安)
-            unlearned_count = max(0, total_q - (mastered_count + review_count))
-
-            # 概要メトリクス表示
-            col_m1, col_m2, col_m3 = st.columns(3)
-            with col_m1:
-                st.metric("✅ 覚えた単語 (Mastered)", f"{mastered_count}", delta=f"{(mastered_count/total_q*100):.1f}%" if total_q else None)
-            with col_m2:
-                st.metric("🔥 不安な単語 (Review)", f"{review_count}", delta_color="inverse")
-            with col_m3:
-                st.metric("⬜ 未学習 (Unlearned)", f"{unlearned_count}")
-
-            # グラフ表示 1: 日付ごとの活動量 (Actions per Day)
-            st.subheader("📅 Daily Activity")
-            if 'timestamp' in user_df.columns:
-                # 日付カラムを作成
-                user_df['date'] = user_df['timestamp'].dt.date
-                daily_counts = user_df.groupby('date').size().reset_index(name='count')
-                st.bar_chart(daily_counts, x='date', y='count')
-
-            # グラフ表示 2: 発音スコアの推移
-            pron_df = user_df[user_df['action'] == 'Pronunciation']
-            if not pron_df.empty:
-                st.subheader("📈 Pronunciation Score Progress")
-                # 日時でソートしてグラフ化
-                chart_df = pron_df.sort_values('timestamp')
-                st.line_chart(chart_df, x='timestamp', y='score')
-            
-            # 詳細データテーブル
-            st.subheader("📋 Detailed History")
-            st.dataframe(
-                user_df[['timestamp', 'word', 'action', 'score', 'is_correct', 'detail']],
-                hide_index=True,
-                use_container_width=True
-            )
-        else:
-            st.info(f"{user_name}さんの履歴はまだありません。")
+        # 詳細データテーブル (新しい順。表示するページの行だけを切り出す)
+        st.subheader("📋 Detailed History")
+        col_p1, col_p2 = st.columns([1, 3])
+        with col_p1:
+            page_size = st.selectbox("表示件数", HISTORY_PAGE_SIZES, key="history_page_size")
+        n_pages = max(1, -(-analytics.events // page_size))
+        # ページ番号は session_state で持つ (value= と併用すると警告が出るので、初期値はここで入れる)
+        if 'history_page' not in st.session_state:
+            st.session_state.history_page = 1
+        elif st.session_state.history_page > n_pages:
+            # 表示件数を増やしてページ数が減った場合
+            st.session_state.history_page = n_pages
+        with col_p2:
+            page = st.number_input(f"ページ (全 {n_pages} ページ)", min_value=1, max_value=n_pages, step=1,
+                                   key="history_page") - 1
+        page_df, total_rows = get_store().user_page(user_name, page, page_size)
+        st.dataframe(
+            page_df[['timestamp', 'word', 'action', 'score', 'is_correct', 'detail']],
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption(f"{page * page_size + 1}〜{min(total_rows, (page + 1) * page_size)} 件目 / 全 {total_rows} 件")
+    elif existing_users:
+        st.info(f"{user_name}さんの履歴はまだありません。")
     else:
         st.info("履歴データはまだありません。")
+
+# --- 実行時間 (表示中のビューごとの直近の値) ---
+run_times = st.session_state.setdefault('run_times', {})
+run_times[main_view] = (time.perf_counter() - RUN_STARTED) * 1000
+get_profiler().record(f"rerun.{main_view}", run_times[main_view] / 1000)
+st.sidebar.caption("⏱️ 直近の実行時間: " + " / ".join(
+    f"{VIEWS[view].split()[-1]} {ms:.0f} ms" for view, ms in run_times.items()))
@@ -0,0 +1,144 @@
+"""
+録音をGeminiに送る前の前処理 (NumPyのみ)。
+
+1. モノラルにダウンミックス
+2. 16kHz にリサンプリング
+3. 前後の無音をエネルギーベースのVADで削除
+4. FLAC にエンコード (requirements.txt の soundfile を使う。入っていなければ WAV のまま)
+
+どこかで失敗した場合は元の音声をそのまま返すので、判定自体は止まらない。
+"""
+import io
+import threading
+import wave
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:  # soundfile (libsndfile) がない環境では WAV のまま送る
+    soundfile = None
+
+TARGET_RATE = 16000
+
+# VAD の設定
+VAD_FRAME_SEC = 0.02
+VAD_MIN_RMS = 0.01  # これ未満は常に無音 (約 -40 dBFS)
+VAD_PEAK_RATIO = 0.05  # 最大フレームエネルギーに対するしきい値の割合
+VAD_PADDING_SEC = 0.2  # 発話の前後に残す余白
+
+
+class PreprocessStats:
+    """プロセス全体の累計 (削減できたバイト数など)"""
+
+    def __init__(self):
+        self.count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+
+    def add(self, bytes_in, bytes_out):
+        with self._lock:
+            self.count += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+        }
+
+
+stats = PreprocessStats()
+
+
+def _read_wav(wav_bytes):
+    """WAV を読み込み、(float32 の [-1, 1] 配列 (frames, channels), サンプルレート) を返す"""
+    with wave.open(io.BytesIO(wav_bytes), 'rb') as w:
+        channels = w.getnchannels()
+        width = w.getsampwidth()
+        rate = w.getframerate()
+        raw = w.readframes(w.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"unsupported sample width: {width}")
+    return samples.reshape(-1, channels), rate
+
+
+def _write_wav(samples, rate):
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def downmix(samples):
+    return samples.mean(axis=1) if samples.ndim == 2 else samples
+
+
+def resample(samples, rate, target_rate=TARGET_RATE):
+    """線形補間でリサンプリングする (ダウンサンプリング時は移動平均で簡易ローパス)"""
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    ratio = rate / target_rate
+    if ratio > 1:
+        width = int(np.ceil(ratio))
+        samples = np.convolve(samples, np.ones(width, dtype=np.float32) / width, mode='same')
+    n_out = int(len(samples) / ratio)
+    positions = np.arange(n_out, dtype=np.float64) * ratio
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def trim_silence(samples, rate):
+    """前後の無音を削る。発話が見つからなければそのまま返す"""
+    frame = max(1, int(rate * VAD_FRAME_SEC))
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return samples
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt((frames ** 2).mean(axis=1))
+    threshold = max(VAD_MIN_RMS, rms.max() * VAD_PEAK_RATIO)
+    voiced = np.nonzero(rms >= threshold)[0]
+    if len(voiced) == 0:
+        return samples
+    pad = int(rate * VAD_PADDING_SEC)
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(samples), (voiced[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+def preprocess_audio(wav_bytes, target_rate=TARGET_RATE, trim=True, codec=None):
+    """
+    前処理した音声を (bytes, mime_type) で返す。
+    codec="flac" を指定すると、soundfile があれば FLAC にする。
+    """
+    try:
+        samples, rate = _read_wav(wav_bytes)
+        mono = resample(downmix(samples), rate, target_rate)
+        if trim:
+            mono = trim_silence(mono, target_rate)
+        if codec == "flac" and soundfile is not None:
+            buf = io.BytesIO()
+            soundfile.write(buf, mono, target_rate, format='FLAC')
+            data, mime_type = buf.getvalue(), "audio/flac"
+        else:
+            data, mime_type = _write_wav(mono, target_rate), "audio/wav"
+    except Exception:
+        return wav_bytes, "audio/wav"
+    if len(data) >= len(wav_bytes):
+        # 小さくならなければ元の音声を送る
+        data, mime_type = wav_bytes, "audio/wav"
+    stats.add(len(wav_bytes), len(data))
+    return data, mime_type
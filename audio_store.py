@@ -0,0 +1,126 @@
+"""
+事前生成した音声をまとめて格納するパック形式のストア。
+
+<prefix>.bin  : MP3 を連結したデータ本体
+<prefix>.idx  : 1行1クリップのインデックス (JSON Lines: key, offset, length)
+
+読み込みは mmap で行い、キーからオフセットを引いてスライスを返すだけなので、
+リクエスト時に gTTS を呼ぶ必要がない。
+"""
+import json
+import mmap
+import os
+import threading
+
+from tts_cache import cache_key
+
+AUDIO_STORE_PREFIX = 'tts_store'
+
+
+def _paths(prefix):
+    return prefix + '.bin', prefix + '.idx'
+
+
+def read_index(prefix):
+    """インデックスを読み込んで {key: (offset, length)} を返す"""
+    _, idx_path = _paths(prefix)
+    index = {}
+    if not os.path.exists(idx_path):
+        return index
+    with open(idx_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # 書き込み途中の行は無視
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            index[entry['key']] = (entry['offset'], entry['length'])
+    return index
+
+
+class AudioStoreWriter:
+    """
+    追記専用のライター。既存のインデックスを読み込むので、途中で止めても続きから再開できる。
+    """
+
+    def __init__(self, prefix=AUDIO_STORE_PREFIX):
+        self.prefix = prefix
+        bin_path, idx_path = _paths(prefix)
+        self.index = read_index(prefix)
+
+        # インデックスに載っていない末尾 (書き込み途中で止まった分) は切り捨てる
+        end = max((o + n for o, n in self.index.values()), default=0)
+        mode = 'r+b' if os.path.exists(bin_path) else 'w+b'
+        self._bin = open(bin_path, mode)
+        self._bin.truncate(end)
+        self._bin.seek(end)
+        self._idx = open(idx_path, 'a', encoding='utf-8')
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def add(self, key, data):
+        """クリップを1件追加する (データ本体を書いてからインデックスを書く)"""
+        offset = self._bin.tell()
+        self._bin.write(data)
+        self._bin.flush()
+        os.fsync(self._bin.fileno())
+        self._idx.write(json.dumps({"key": key, "offset": offset, "length": len(data)}) + '\n')
+        self._idx.flush()
+        self.index[key] = (offset, len(data))
+
+    def close(self):
+        self._bin.close()
+        self._idx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AudioStore:
+    """mmap で開いた読み取り専用ストア"""
+
+    def __init__(self, prefix=AUDIO_STORE_PREFIX):
+        bin_path, _ = _paths(prefix)
+        self.index = read_index(prefix)
+        self._file = open(bin_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def __len__(self):
+        return len(self.index)
+
+    def contains(self, text, lang='en'):
+        return cache_key(text, lang) in self.index
+
+    def get(self, text, lang='en'):
+        """テキストの音声を返す (なければNone)"""
+        entry = self.index.get(cache_key(text, lang))
+        if entry is None or self._mm is None:
+            return None
+        offset, length = entry
+        return self._mm[offset:offset + length]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_audio_store(prefix=AUDIO_STORE_PREFIX):
+    """プロセス内で共有するストアを返す (事前生成されていなければNone)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if not all(os.path.exists(p) for p in _paths(prefix)):
+                return None
+            _store = AudioStore(prefix)
+        return _store
@@ -0,0 +1,597 @@
+"""
+主要な処理のベンチマーク (ネットワーク不要)。
+
+Gemini (google.generativeai)・gTTS・Google Sheets (gspread) を、遅延を指定できる
+ローカルの擬似バックエンドに差し替えて、次の処理の所要時間を計測する。
+- sort:      履歴からのSRS状態の再構築と出題順の並べ替え (1ユーザー 1k〜1M 件)
+- history:   履歴の保存 (save_log 相当) と読み込み (ローカルログ / シート)
+- questions: 問題ファイルの読み込み (JSON / スナップショット)
+- analytics: History タブの集計・ページ表示・ユーザー一覧
+- sidebar:   再実行ごとのサイドバーの集計 (ユーザー一覧・メモリ・利用状況・計測結果)
+- tts:       模範音声の取得 (合成 / キャッシュ)
+- eval:      判定の並列実行 (通常 / ストリーミング)
+
+結果は JSON で出力する。--compare で以前の結果と比べ、遅くなった項目を表示する。
+
+使い方:
+    python benchmark.py --out bench.json
+    python benchmark.py --quick --only sort,eval
+    python benchmark.py --out new.json --compare bench.json
+    python benchmark.py --gemini-latency 0.5 --tts-latency 0.1 --sheets-latency 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+QUICK_SIZES = [1_000, 10_000, 100_000]
+BENCHMARKS = ["sort", "history", "questions", "analytics", "sidebar", "tts", "eval"]
+FAKE_MODEL = "fake-gemini"
+ACTIONS = ["Pronunciation", "Japanese Meaning", "English Definition", "SelfRating"]
+# --compare で「遅くなった」とみなす比率
+REGRESSION_RATIO = 1.10
+
+
+# --- 擬似バックエンド ---
+class Latency:
+    """擬似バックエンドの1呼び出しあたりの遅延 (秒)"""
+    gemini = 0.2
+    tts = 0.05
+    sheets = 0.1
+
+
+class _FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class _FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeResponse:
+    """generate_content の応答 (ストリーミングではチャンクを順に返す)"""
+
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = _FakeUsage(len(text) // 4, len(text) // 4)
+
+    def __iter__(self):
+        for i in range(0, len(self.text), 16):
+            yield _FakeChunk(self.text[i:i + 16])
+
+
+class FakeGenerativeModel:
+    """判定・ヒントのどちらにも使える応答を返す GenerativeModel"""
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        time.sleep(Latency.gemini)
+        text = json.dumps({"transcription": "benchmark", "score": 85, "advice": "いい調子です。",
+                           "is_correct": True, "comment": "正解です。"}, ensure_ascii=False)
+        return _FakeResponse(text)
+
+
+class FakeGTTS:
+    def __init__(self, text, lang='en', **kwargs):
+        self.text = text
+
+    def write_to_fp(self, fp):
+        time.sleep(Latency.tts)
+        fp.write(b'\xff\xfb' + self.text.encode('utf-8') * 8)
+
+
+class FakeWorksheet:
+    """行をメモリに持つワークシート (読み書きのたびに Latency.sheets だけ待つ)"""
+
+    def __init__(self, rows=None):
+        self.rows = [list(r) for r in rows or []]
+
+    def get_all_values(self):
+        time.sleep(Latency.sheets)
+        return [list(r) for r in self.rows]
+
+    def batch_get(self, ranges):
+        time.sleep(Latency.sheets)
+        result = []
+        for r in ranges:
+            start, end = r.split(':')
+            first = int(start[1:]) - 1
+            last = int(end[1:]) if end[1:] else len(self.rows)
+            result.append([list(row) for row in self.rows[first:last]])
+        return result
+
+    def append_rows(self, rows):
+        time.sleep(Latency.sheets)
+        self.rows.extend([str(v) for v in row] for row in rows)
+
+
+class _FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.sheet1 = worksheet
+
+
+class FakeSheetsClient:
+    sheets = {}  # シート名 -> FakeWorksheet
+
+    def open(self, name):
+        return _FakeSpreadsheet(self.sheets.setdefault(name, FakeWorksheet()))
+
+
+class _FakeCredentials:
+    @classmethod
+    def from_service_account_info(cls, info, scopes=None):
+        return cls()
+
+
+def _fake_module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition('.')
+    if parent in sys.modules:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+def install_fakes():
+    """genai / gTTS / gspread を擬似バックエンドに差し替える (アプリのモジュールを読み込む前に呼ぶ)"""
+    if 'google' not in sys.modules:
+        try:
+            import google  # noqa: F401
+        except ImportError:
+            _fake_module('google', __path__=[])
+    _fake_module('google.generativeai', GenerativeModel=FakeGenerativeModel, configure=lambda **kwargs: None)
+    # APIキーごとのクライアントは使わず、GenerativeModel だけで呼び出させる
+    sys.modules['google.ai.generativelanguage'] = None
+    _fake_module('google.oauth2', __path__=[])
+    _fake_module('google.oauth2.service_account', Credentials=_FakeCredentials)
+    _fake_module('gtts', gTTS=FakeGTTS)
+    _fake_module('gspread', authorize=lambda creds: FakeSheetsClient())
+
+
+# --- 計測 ---
+def measure(fn, repeat, setup=None):
+    """fn() を repeat 回実行し、最小・中央値 (秒) を返す。setup() の戻り値を fn に渡す"""
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg) if setup else fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {"min_s": round(times[0], 6), "median_s": round(times[len(times) // 2], 6), "repeat": repeat}
+
+
+def _result(name, params, timing, items=None):
+    result = {"name": name, "params": params}
+    result.update(timing)
+    if items:
+        result["per_sec"] = round(items / timing["median_s"]) if timing["median_s"] > 0 else None
+    return result
+
+
+# --- 合成データ ---
+def question_words(path='questions.json'):
+    from question_bank import QuestionBank
+    return QuestionBank.from_json(path).words
+
+
+def synthetic_frame(n, words, users=("bench",), seed=0):
+    """history_schema の形式の履歴 DataFrame を直接作る (大きな件数用)"""
+    rng = np.random.default_rng(seed)
+    words = list(dict.fromkeys(words))
+    start = np.datetime64('2025-01-01T00:00:00', 's')
+    seconds = np.sort(rng.integers(0, 365 * 86400, n))
+    action = rng.integers(0, len(ACTIONS), n)
+    score = np.where(action == 0, rng.integers(0, 101, n), 0).astype(np.int8)
+    detail = np.where(rng.random(n) < 0.7, 'Easy', 'Hard').astype(object)
+    detail[action != 3] = ''
+    return pd.DataFrame({
+        'timestamp': (start + seconds.astype('timedelta64[s]')).astype('datetime64[ns]'),
+        'user': pd.Categorical.from_codes(rng.integers(0, len(users), n), list(users)),
+        'word': pd.Categorical.from_codes(rng.integers(0, len(words), n), words),
+        'action': pd.Categorical.from_codes(action, ACTIONS),
+        'score': score,
+        'is_correct': rng.random(n) < 0.75,
+        'detail': detail,
+    })
+
+
+def synthetic_records(n, words, users=("bench",), seed=0):
+    """save_log と同じ形式のレコード (ログ・シート用)"""
+    rnd = random.Random(seed)
+    start = datetime(2025, 1, 1).timestamp()
+    records = []
+    for i in range(n):
+        action = rnd.choice(ACTIONS)
+        records.append({
+            "timestamp": datetime.fromtimestamp(start + i * 60).strftime('%Y-%m-%d %H:%M:%S'),
+            "user": rnd.choice(users),
+            "word": rnd.choice(words),
+            "action": action,
+            "score": rnd.randint(0, 100) if action == "Pronunciation" else 0,
+            "is_correct": rnd.random() < 0.75,
+            "detail": rnd.choice(["Easy", "Hard"]) if action == "SelfRating" else "",
+        })
+    return records
+
+
+# --- ベンチマーク ---
+def bench_sort(ctx):
+    """履歴からのSRS状態の再構築 (from_history) と出題順 (order)"""
+    from schedulers import SCHEDULERS, get_scheduler
+    from srs import SRSEngine
+    words = ctx.words
+    results = []
+    for n in ctx.sizes:
+        df = synthetic_frame(n, words)
+        for name in ctx.schedulers:
+            # ladder 以外は1件ずつの更新になるので、大きな件数は省く
+            if name != "ladder" and n > ctx.loop_limit:
+                continue
+            scheduler = get_scheduler(name)
+            timing = measure(lambda: SRSEngine.from_history(df, "bench", scheduler), ctx.repeat)
+            results.append(_result(f"sort.rebuild.{name}", {"events": n}, timing, n))
+        engine = SRSEngine.from_history(df, "bench", SCHEDULERS["ladder"])
+        timing = measure(lambda: engine.order(words), ctx.repeat)
+        results.append(_result("sort.order", {"events": n, "words": len(words)}, timing))
+    return results
+
+
+def bench_history(ctx):
+    """
+    save_log 相当の保存 (ストア・SRS・シートのキュー・ローカルログ) と、履歴全体の読み込み。
+    保存はシートへの送信をキューに積むところまでを計測する (送信は常駐スレッドが行う)。
+    """
+    from gsheet_writer import SheetWriter
+    from history_log import HistoryLog
+    from history_schema import HISTORY_COLUMNS
+    from history_store import HistoryStore
+    from srs import SRSEngine
+    results = []
+    users = tuple(f"user{i}" for i in range(10))
+    sa_info = {"client_email": "bench@example.com"}
+
+    n_save = ctx.save_events
+    records = synthetic_records(n_save, ctx.words, users, seed=1)
+
+    writers = []
+
+    def save(env):
+        store, log, writer, engine = env
+        for r in records:
+            store.append(r)
+            engine.record(r['word'], r['action'], r['score'], r['is_correct'], r['detail'],
+                          datetime.strptime(r['timestamp'], '%Y-%m-%d %H:%M:%S'))
+            writer.append(r.values())
+            log.append(r)
+        log.close()
+
+    def save_setup():
+        path = os.path.join(ctx.tmp, 'save.jsonl')
+        if os.path.exists(path):
+            os.remove(path)
+        log = HistoryLog(path)
+        store = HistoryStore(local_log=log)
+        store.load()
+        writer = SheetWriter(sa_info, f"bench-save-{len(writers)}")
+        writers.append(writer)
+        return store, log, writer, SRSEngine("bench")
+
+    timing = measure(save, ctx.repeat, setup=save_setup)
+    for writer in writers:
+        writer.close()
+    results.append(_result("history.save", {"events": n_save, "sheets_latency": Latency.sheets}, timing, n_save))
+
+    for n in ctx.load_sizes:
+        records = synthetic_records(n, ctx.words, users, seed=2)
+        path = os.path.join(ctx.tmp, f'load_{n}.jsonl')
+        log = HistoryLog(path)
+        for r in records:
+            log.append(r)
+        log.close()
+        timing = measure(lambda: HistoryStore(local_log=HistoryLog(path)).load(), ctx.repeat)
+        results.append(_result("history.load.local", {"events": n}, timing, n))
+
+        sheet_name = f"bench-load-{n}"
+        FakeSheetsClient.sheets[sheet_name] = FakeWorksheet(
+            [HISTORY_COLUMNS] + [[str(r[c]) for c in HISTORY_COLUMNS] for r in records])
+        timing = measure(lambda: HistoryStore(sa_info, sheet_name).load(), ctx.repeat)
+        results.append(_result("history.load.sheet", {"events": n, "sheets_latency": Latency.sheets}, timing, n))
+        del FakeSheetsClient.sheets[sheet_name]
+    return results
+
+
+def bench_questions(ctx):
+    """問題ファイルの読み込み (JSON の解析 / スナップショット)"""
+    from question_bank import QuestionBank, load_question_bank
+    results = []
+    # 問題ファイルを一時ディレクトリにコピーして使う (スナップショットをリポジトリに残さない)
+    repo_path = os.path.join(ctx.tmp, 'questions_repo.json')
+    shutil.copyfile(ctx.questions_path, repo_path)
+    with open(repo_path, encoding='utf-8') as f:
+        base = json.load(f)
+    scaled = [dict(base[i % len(base)], word=f"{base[i % len(base)].get('word')}{i}")
+              for i in range(ctx.question_count)]
+    scaled_path = os.path.join(ctx.tmp, 'questions_scaled.json')
+    with open(scaled_path, 'w', encoding='utf-8') as f:
+        json.dump(scaled, f, ensure_ascii=False)
+
+    for label, path in (("repo", repo_path), ("scaled", scaled_path)):
+        n = len(QuestionBank.from_json(path))
+        timing = measure(lambda: load_question_bank(path, use_snapshot=False), ctx.repeat)
+        results.append(_result("questions.load.json", {"source": label, "questions": n}, timing, n))
+        load_question_bank(path)  # スナップショットを作る
+        timing = measure(lambda: load_question_bank(path), ctx.repeat)
+        results.append(_result("questions.load.snapshot", {"source": label, "questions": n}, timing, n))
+    return results
+
+
+def bench_analytics(ctx):
+    """History タブの集計 (初回の集計、1件ずつの追加、ページ表示) とユーザー一覧"""
+    from history_analytics import UserAnalytics
+    from history_store import HistoryStore
+    results = []
+    users = tuple(f"user{i}" for i in range(50))
+    for n in ctx.sizes:
+        df = synthetic_frame(n, ctx.words, ("bench",))
+        timing = measure(lambda: UserAnalytics.from_frame(df), ctx.repeat)
+        results.append(_result("analytics.build", {"events": n}, timing, n))
+
+        analytics = UserAnalytics.from_frame(df)
+        adds = synthetic_records(1000, ctx.words, ("bench",), seed=3)
+
+        def add_and_render():
+            for r in adds:
+                analytics.add(r)
+            analytics.daily_frame()
+            analytics.score_frame()
+        timing = measure(add_and_render, ctx.repeat)
+        results.append(_result("analytics.add", {"events": n, "added": len(adds)}, timing, len(adds)))
+
+        # 大きな件数はログを経由せず、読み込み済みの DataFrame を直接持たせる
+        store = HistoryStore(local_log=_FrameLog())
+        store._set_frame(synthetic_frame(n, ctx.words, users, seed=4))
+        store.loaded_at = time.time()
+        store.user_page("user0", 0, 50)  # 並べ替えは初回だけ
+        timing = measure(lambda: store.user_page("user0", 1, 50), ctx.repeat)
+        results.append(_result("analytics.page", {"events": n, "users": len(users)}, timing))
+        timing = measure(store.users_by_last_active, ctx.repeat)
+        results.append(_result("analytics.users", {"events": n, "users": len(users)}, timing))
+    return results
+
+
+class _FrameLog:
+    """読み込み済みの DataFrame を直接渡すときの空のログ"""
+
+    def read_since(self, offset=0):
+        return [], offset
+
+
+def bench_sidebar(ctx):
+    """
+    再実行のたびにサイドバーで行う集計 (1件保存したあとの再実行を想定)。
+    メモリ量 (memory_bytes) はボタンを押したときだけ計算するので、別に計測する。
+    """
+    from eval_cache import EvalCache
+    from gemini_client import get_gemini_registry
+    from history_store import HistoryStore
+    from instrumentation import Profiler
+    from rate_limiter import get_rate_limiter
+    results = []
+    users = tuple(f"user{i}" for i in range(50))
+    eval_cache = EvalCache(path=os.path.join(ctx.tmp, 'sidebar_eval_cache.sqlite'))
+    profiler = Profiler(enabled=True)
+    for i in range(20):
+        for _ in range(100):
+            profiler.record(f"span{i}", random.random() / 100)
+    for n in ctx.sizes:
+        store = HistoryStore(local_log=_FrameLog())
+        store._set_frame(synthetic_frame(n, ctx.words, users, seed=5))
+        store.loaded_at = time.time()
+        store.users_by_last_active()
+        records = iter(synthetic_records(2 * ctx.repeat, ctx.words, users, seed=6))
+
+        def rerun():
+            store.append(next(records))
+            store.users_by_last_active()
+            store.memory_usage()
+            get_gemini_registry().stats()
+            eval_cache.stats()
+            get_rate_limiter().stats()
+            profiler.summary()
+        timing = measure(rerun, ctx.repeat)
+        results.append(_result("sidebar.rerun", {"events": n, "users": len(users)}, timing))
+        # 内容が変わるまでは使い回すので、毎回1件追加してから計算させる
+        timing = measure(lambda _: store.memory_bytes(), ctx.repeat,
+                         setup=lambda: store.append(next(records)))
+        results.append(_result("sidebar.memory_bytes", {"events": n, "users": len(users)}, timing))
+    return results
+
+
+def bench_tts(ctx):
+    """模範音声の取得 (初回は合成、2回目以降はディスクキャッシュ)"""
+    from question_bank import QuestionBank
+    from tts_cache import TTSCache
+    bank = QuestionBank.from_json(ctx.questions_path)
+    texts = [bank[i]['en'] for i in range(min(ctx.tts_texts, len(bank)))]
+    cache_dir = os.path.join(ctx.tmp, 'tts')
+
+    def cold(cache):
+        for t in texts:
+            cache.get(t)
+
+    def cold_setup():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return TTSCache(cache_dir=cache_dir, min_interval=0)
+
+    results = [_result("tts.synthesize", {"texts": len(texts), "tts_latency": Latency.tts},
+                       measure(cold, ctx.repeat, setup=cold_setup), len(texts))]
+    warm = TTSCache(cache_dir=cache_dir, min_interval=0)
+    timing = measure(lambda: cold(warm), ctx.repeat)
+    results.append(_result("tts.cached", {"texts": len(texts)}, timing, len(texts)))
+    return results
+
+
+def bench_eval(ctx):
+    """判定を同時に投入し、すべて終わるまでの時間 (ワーカー数・ストリーミングの有無ごと)"""
+    from concurrent.futures import wait
+    from evaluation import EvaluationService
+    from evaluators import evaluate_pronunciation
+    from rate_limiter import get_rate_limiter
+    # 擬似モデルはレート制限で待たせない
+    get_rate_limiter().limits[FAKE_MODEL] = (10 ** 9, 10 ** 12)
+    results = []
+    audio = b'RIFF' + bytes(32000)
+    n = ctx.eval_tasks
+    for workers in ctx.eval_workers:
+        for stream in (False, True):
+            def fan_out():
+                service = EvaluationService(max_workers=workers, cache=None)
+                tasks = [service.submit(("bench", i), evaluate_pronunciation, audio, "This is a benchmark.",
+                                        "fake-key", FAKE_MODEL, stream=stream) for i in range(n)]
+                wait([t.future for t in tasks])
+                errors = [t.future.result() for t in tasks if "error" in t.future.result()]
+                service._pool.shutdown()
+                if errors:
+                    raise RuntimeError(f"evaluation failed: {errors[0]['error']}")
+            timing = measure(fan_out, ctx.repeat)
+            results.append(_result("eval.fan_out", {"tasks": n, "workers": workers, "stream": stream,
+                                                    "gemini_latency": Latency.gemini}, timing, n))
+    return results
+
+
+BENCH_FUNCTIONS = {
+    "sort": bench_sort,
+    "history": bench_history,
+    "questions": bench_questions,
+    "analytics": bench_analytics,
+    "sidebar": bench_sidebar,
+    "tts": bench_tts,
+    "eval": bench_eval,
+}
+
+
+# --- 結果の比較 ---
+def _result_key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(results, baseline):
+    """baseline と共通の項目について、中央値の比 (新 / 旧) を返す"""
+    old = {_result_key(r): r for r in baseline}
+    rows = []
+    for r in results:
+        before = old.get(_result_key(r))
+        if before and before["median_s"] > 0:
+            rows.append({"name": r["name"], "params": r["params"], "before_s": before["median_s"],
+                         "after_s": r["median_s"], "ratio": round(r["median_s"] / before["median_s"], 3)})
+    return rows
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="主要な処理のベンチマーク (擬似バックエンドを使用)")
+    parser.add_argument("--only", help=f"実行するベンチマーク (カンマ区切り: {','.join(BENCHMARKS)})")
+    parser.add_argument("--quick", action="store_true", help="件数を減らして短時間で実行する")
+    parser.add_argument("--sizes", help="履歴の件数 (カンマ区切り。既定: 1000,10000,100000,1000000)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--schedulers", default="ladder,sm2,fsrs")
+    parser.add_argument("--questions", default="questions.json")
+    parser.add_argument("--gemini-latency", type=float, default=Latency.gemini)
+    parser.add_argument("--tts-latency", type=float, default=Latency.tts)
+    parser.add_argument("--sheets-latency", type=float, default=Latency.sheets)
+    parser.add_argument("--out", help="結果の JSON を書き出すファイル (省略時は標準出力)")
+    parser.add_argument("--compare", help="比較する以前の結果の JSON")
+    args = parser.parse_args(argv)
+
+    Latency.gemini, Latency.tts, Latency.sheets = args.gemini_latency, args.tts_latency, args.sheets_latency
+    install_fakes()
+
+    names = args.only.split(',') if args.only else BENCHMARKS
+    unknown = [n for n in names if n not in BENCH_FUNCTIONS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    sizes = [int(s) for s in args.sizes.split(',')] if args.sizes else (QUICK_SIZES if args.quick else SIZES)
+    ctx = types.SimpleNamespace(
+        sizes=sizes,
+        repeat=args.repeat,
+        schedulers=args.schedulers.split(','),
+        loop_limit=100_000,
+        questions_path=args.questions,
+        question_count=5_000 if args.quick else 50_000,
+        save_events=500 if args.quick else 2_000,
+        load_sizes=[s for s in sizes if s <= 100_000][-2:],
+        tts_texts=20,
+        eval_tasks=16 if args.quick else 32,
+        eval_workers=[1, 8],
+        tmp=tempfile.mkdtemp(prefix="coach-bench-"),
+    )
+    ctx.words = question_words(args.questions)
+
+    results = []
+    try:
+        for name in names:
+            start = time.perf_counter()
+            results.extend(BENCH_FUNCTIONS[name](ctx))
+            print(f"{name}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(ctx.tmp, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            report["comparison"] = compare(results, json.load(f)["results"])
+        for row in report["comparison"]:
+            mark = "  SLOWER" if row["ratio"] > REGRESSION_RATIO else ""
+            print(f"{row['name']:<28} {json.dumps(row['params'], ensure_ascii=False):<60} "
+                  f"{row['before_s'] * 1000:10.2f} ms -> {row['after_s'] * 1000:10.2f} ms  x{row['ratio']}{mark}",
+                  file=sys.stderr)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
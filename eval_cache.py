@@ -0,0 +1,97 @@
+"""
+判定結果のディスクキャッシュ (SQLite)。
+
+キーは「評価関数 + プロンプトのバージョン + モデル + 音声のダイジェスト + 正解データ」のハッシュで、
+音声そのものは保存しない。TTL を過ぎたもの、件数上限を超えた古いもの (LRU) は削除する。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+EVAL_CACHE_FILE = 'eval_cache.sqlite3'
+EVAL_CACHE_TTL = 30 * 86400  # 秒
+EVAL_CACHE_MAX_ENTRIES = 5000
+
+
+def audio_digest(audio_bytes):
+    """音声の短いダイジェスト (キャッシュキー用)"""
+    return hashlib.blake2b(audio_bytes, digest_size=16).hexdigest()
+
+
+class EvalCache:
+    """判定結果 (JSONにできるdict) を保存するキャッシュ。hits / misses を数える"""
+
+    def __init__(self, path=EVAL_CACHE_FILE, ttl=EVAL_CACHE_TTL, max_entries=EVAL_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, result TEXT NOT NULL,"
+                " created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON results(last_used)")
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha1(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT result, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._conn:
+                self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key, result):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, result, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result, ensure_ascii=False), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        # TTL切れを削除し、それでも多ければ最終使用が古いものから削除する
+        self._conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM results WHERE key IN"
+                " (SELECT key FROM results ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_eval_cache():
+    """プロセス内で共有するキャッシュを返す"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EvalCache()
+        return _cache
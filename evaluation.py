@@ -0,0 +1,142 @@
+"""
+録音の判定を並列に実行する評価サービス。
+
+録音が届いた時点でスレッドプールに投入し、UI側は再実行のたびに結果をポーリングする。
+日本語の意味・英語の定義・発音の3つを同時に判定できるので、待ち時間はほぼ1往復分になる。
+成功した結果はディスクキャッシュに保存し、同じ録音は再起動後も再判定しない。
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from eval_cache import EvalCache, get_eval_cache
+from evaluators import EVAL_TIMEOUT, PROMPT_VERSIONS
+
+MAX_WORKERS = 8
+# 保持しておく判定結果の件数 (古いものから捨てる)
+MAX_TASKS = 256
+# 待つのをやめるまでの猶予 (API側のタイムアウトより少し長く待つ)
+TIMEOUT_GRACE = 5
+
+
+def evaluation_key(fn, digest, targets, model_name):
+    """判定のキー: 関数名 + プロンプトのバージョン + モデル + 音声のダイジェスト + 正解データ"""
+    return EvalCache.make_key(fn.__name__, PROMPT_VERSIONS.get(fn.__name__, 0), model_name, digest, list(targets))
+
+
+class EvalTask:
+    __slots__ = ('future', 'submitted_at', 'timeout', 'partial')
+
+    def __init__(self, timeout):
+        self.future = None
+        self.submitted_at = time.monotonic()
+        self.timeout = timeout
+        self.partial = {}  # ストリーミング中に届いた項目
+
+    def update_partial(self, fields):
+        self.partial = fields
+
+
+class EvaluationService:
+    """
+    判定をキー単位で1回だけ実行するサービス。
+    submit() で投入し、poll() で結果 (未完了なら None) を受け取る。
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, timeout=EVAL_TIMEOUT, max_tasks=MAX_TASKS, cache=None):
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="Eval")
+        self._tasks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, stream=False, **kwargs):
+        """
+        未投入なら判定を投入する (同じキーは再投入しない)。
+        stream=True なら fn に on_partial を渡し、途中結果を partial() で読めるようにする。
+        """
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None:
+                self._tasks.move_to_end(key)
+                return task
+            kwargs.setdefault('timeout', self.timeout)
+            task = self._tasks[key] = EvalTask(kwargs['timeout'])
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                task.future = Future()
+                task.future.set_result(cached)
+            else:
+                if stream:
+                    kwargs['on_partial'] = task.update_partial
+                task.future = self._pool.submit(self._run, key, fn, *args, **kwargs)
+            while len(self._tasks) > self.max_tasks:
+                _, old = self._tasks.popitem(last=False)
+                old.future.cancel()
+            return task
+
+    def _run(self, key, fn, *args, **kwargs):
+        result = fn(*args, **kwargs)
+        # エラーはキャッシュしない (再録音・再試行で判定し直せるように)
+        if self.cache is not None and isinstance(result, dict) and "error" not in result:
+            self.cache.put(key, result)
+        return result
+
+    def poll(self, key):
+        """
+        結果を返す。未完了なら None、タイムアウト・取り消し時はエラーを返す。
+        実行中の呼び出しはここでは止められないので、タイムアウトは呼び出し側 (Gemini の
+        request_options の timeout と再試行の締め切り) で打ち切る。ここでは待つのをやめるだけ。
+        """
+        with self._lock:
+            task = self._tasks.get(key)
+        if task is None:
+            return None
+        if task.future.done():
+            try:
+                return task.future.result()
+            except Exception as e:
+                return {"error": str(e)}
+        if time.monotonic() - task.submitted_at > task.timeout + TIMEOUT_GRACE:
+            return {"error": "判定がタイムアウトしました。もう一度録音してください。"}
+        return None
+
+    def partial(self, key):
+        """ストリーミング中の途中結果 (まだ何も届いていなければ空のdict)"""
+        with self._lock:
+            task = self._tasks.get(key)
+        return dict(task.partial) if task is not None else {}
+
+    def is_pending(self, key):
+        with self._lock:
+            task = self._tasks.get(key)
+        return task is not None and self.poll(key) is None
+
+    def cancel(self, key):
+        """判定を取り消す (まだ開始していなければ実行されない)"""
+        with self._lock:
+            task = self._tasks.pop(key, None)
+        if task is not None:
+            task.future.cancel()
+
+    def wait_any(self, keys, timeout):
+        """いずれかの判定が終わるまで (最大 timeout 秒) 待つ"""
+        with self._lock:
+            futures = [self._tasks[k].future for k in keys if k in self._tasks]
+        if futures:
+            wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_evaluation_service():
+    """プロセス内で共有する評価サービスを返す"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EvaluationService(cache=get_eval_cache())
+        return _service
@@ -0,0 +1,266 @@
+"""
+Gemini による判定・生成の関数群。
+
+Streamlit に依存しないので、評価サービスのワーカースレッドからも呼び出せる。
+モデルは gemini_client のレジストリで共有する (genai.configure は呼ばない)。
+"""
+import functools
+import json
+
+from gemini_client import generate, generate_stream
+from rate_limiter import PRIORITY_BACKGROUND, RateLimitTimeout
+from history_schema import parse_bool
+from json_stream import IncrementalJSONParser, parse_json_object
+
+# 1回の判定リクエストのタイムアウト (秒)
+EVAL_TIMEOUT = 60
+
+# プロンプトを変更したら上げる (判定結果キャッシュのキーに含まれる)
+PROMPT_VERSIONS = {
+    "evaluate_pronunciation": 1,
+    "evaluate_meaning_jp": 1,
+    "evaluate_meaning_en": 1,
+    "evaluate_pronunciation_batch": 1,
+}
+
+# 判定応答は JSON モードで受け取り、必要な項目と型をこちらで検証する。
+# (response_schema を使うとプロパティがアルファベット順になり、advice が score より先に
+#  生成されてしまうため、ストリーミングでの早期表示にはプロンプトの順序を使う)
+JSON_RESPONSE_CONFIG = {"response_mime_type": "application/json"}
+PRONUNCIATION_FIELDS = {"transcription": str, "score": int, "advice": str}
+MEANING_FIELDS = {"transcription": str, "is_correct": parse_bool, "comment": str}
+
+# 1リクエストにまとめる録音の最大数
+MAX_BATCH_ITEMS = 10
+
+# まとめて判定する際の構造化出力スキーマ
+PRONUNCIATION_BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "index": {"type": "integer"},
+            "transcription": {"type": "string"},
+            "score": {"type": "integer"},
+            "advice": {"type": "string"},
+        },
+        "required": ["index", "transcription", "score", "advice"],
+    },
+}
+
+
+def _validate(result, fields):
+    """必要な項目がそろっているか確認し、型をそろえる"""
+    if not isinstance(result, dict):
+        raise ValueError("判定結果を読み取れませんでした")
+    missing = [k for k in fields if k not in result]
+    if missing:
+        raise ValueError(f"判定結果に項目がありません: {', '.join(missing)}")
+    validated = dict(result)
+    for key, convert in fields.items():
+        validated[key] = convert(result[key])
+    if 'score' in validated:
+        validated['score'] = max(0, min(100, validated['score']))
+    return validated
+
+def _evaluate_audio(prompt, audio_bytes, api_key, model_name, timeout, mime_type, fields, on_partial=None):
+    """
+    音声付きのプロンプトを送り、JSON の判定結果を返す。
+    on_partial を渡すとストリーミングで受け取り、項目がそろうたびに途中結果を渡す。
+    """
+    contents = [prompt, {"mime_type": mime_type, "data": audio_bytes}]
+    options = {"generation_config": JSON_RESPONSE_CONFIG, "request_options": {"timeout": timeout}}
+    if on_partial is None:
+        response = generate(api_key, model_name, contents, **options)
+        return _validate(parse_json_object(response.text), fields)
+
+    parser = IncrementalJSONParser()
+    for text in generate_stream(api_key, model_name, contents, **options):
+        if parser.feed(text):
+            on_partial(dict(parser.fields))
+    return _validate(parser.result(), fields)
+
+# --- 関数: Geminiによる判定 (英語発音 - 英文) ---
+def evaluate_pronunciation(audio_bytes, target_sentence, api_key, model_name, timeout=EVAL_TIMEOUT, mime_type="audio/wav", on_partial=None):
+    try:
+        prompt = f"""
+        Role: Strict English Coach.
+        Task: Evaluate pronunciation of the audio against the target sentence.
+        Target: "{target_sentence}"
+        
+        Output JSON only:
+        {{
+            "transcription": "Transcribed speech",
+            "score": 0-100 (Integer, Strict),
+            "advice": "Brief advice in Japanese (max 2 sentences) focusing on improvement."
+        }}
+        """
+        return _evaluate_audio(prompt, audio_bytes, api_key, model_name, timeout, mime_type,
+                               PRONUNCIATION_FIELDS, on_partial)
+        
+    except Exception as e:
+        return {"error": str(e)}
+
+# --- 関数: Geminiによる判定 (英語発音 - 複数の英文をまとめて) ---
+def evaluate_pronunciation_batch(items, api_key, model_name, timeout=EVAL_TIMEOUT):
+    """
+    複数の録音 (audio_bytes, target_sentence[, mime_type]) を1リクエストで判定する。
+    返り値は items と同じ順の結果リスト (各要素は evaluate_pronunciation と同じ形式)。
+    まとめての判定に失敗した分は、1件ずつ evaluate_pronunciation で判定し直す。
+    """
+    results = []
+    for start in range(0, len(items), MAX_BATCH_ITEMS):
+        results.extend(_evaluate_pronunciation_chunk(items[start:start + MAX_BATCH_ITEMS], api_key, model_name, timeout))
+    return results
+
+def _evaluate_pronunciation_chunk(items, api_key, model_name, timeout):
+    by_index = {}
+    try:
+        prompt = f"""
+        Role: Strict English Coach.
+        Task: Evaluate pronunciation of each numbered audio against its target sentence.
+        There are {len(items)} items. Evaluate each item independently.
+        
+        Output a JSON array with one object per item:
+        {{
+            "index": Item number,
+            "transcription": "Transcribed speech",
+            "score": 0-100 (Integer, Strict),
+            "advice": "Brief advice in Japanese (max 2 sentences) focusing on improvement."
+        }}
+        """
+        contents = [prompt]
+        for i, item in enumerate(items):
+            audio_bytes, target_sentence = item[0], item[1]
+            mime_type = item[2] if len(item) > 2 else "audio/wav"
+            contents.append(f'Item {i}: Target: "{target_sentence}"')
+            contents.append({"mime_type": mime_type, "data": audio_bytes})
+
+        response = generate(api_key, model_name, contents, generation_config={
+            "response_mime_type": "application/json",
+            "response_schema": PRONUNCIATION_BATCH_SCHEMA,
+        }, request_options={"timeout": timeout})
+
+        for r in json.loads(response.text):
+            if not (isinstance(r, dict) and isinstance(r.get('index'), int) and 0 <= r['index'] < len(items)):
+                continue
+            try:
+                by_index[r['index']] = {k: v for k, v in _validate(r, PRONUNCIATION_FIELDS).items() if k != 'index'}
+            except (TypeError, ValueError) as e:
+                # 形式のおかしい項目は、下で個別に判定し直す
+                print(f"Batch pronunciation item {r['index']} invalid: {e}")
+    except RateLimitTimeout as e:
+        # 混雑時に1件ずつ送り直すとさらに混むので、まとめてエラーにする
+        return [{"error": str(e)} for _ in items]
+    except Exception as e:
+        print(f"Batch pronunciation failed, evaluating {len(items)} items one by one: {e!r}")
+
+    if by_index and len(by_index) < len(items):
+        print(f"Batch pronunciation returned {len(by_index)}/{len(items)} valid items; evaluating the rest one by one")
+    results = []
+    for i, item in enumerate(items):
+        result = by_index.get(i)
+        if result is None:
+            # まとめての判定で欠けた分は個別に判定する
+            mime_type = item[2] if len(item) > 2 else "audio/wav"
+            result = evaluate_pronunciation(item[0], item[1], api_key, model_name, timeout=timeout, mime_type=mime_type)
+        results.append(result)
+    return results
+
+# --- 関数: Geminiによる意味判定 (日本語回答) ---
+def evaluate_meaning_jp(audio_bytes, target_word, target_meaning, api_key, model_name, timeout=EVAL_TIMEOUT, mime_type="audio/wav", on_partial=None):
+    try:
+        prompt = f"""
+        Role: Supportive Teacher.
+        Task: 
+        1. Transcribe the user's Japanese audio accurately.
+        2. Check if the meaning matches the English word "{target_word}".
+        
+        Expected Meaning: "{target_meaning}"
+        Criteria: 
+        - Transcription: Strict and accurate.
+        - Meaning Evaluation: Lenient. If the meaning is generally correct, mark it as correct even if the wording is different.
+        
+        Output JSON only:
+        {{
+            "transcription": "The exact transcription of what the user said",
+            "is_correct": boolean,
+            "comment": "Brief encouragement and feedback in Japanese (max 1-2 sentences)."
+        }}
+        """
+
+        return _evaluate_audio(prompt, audio_bytes, api_key, model_name, timeout, mime_type,
+                               MEANING_FIELDS, on_partial)
+        
+    except Exception as e:
+        return {"error": str(e)}
+
+# --- 関数: Geminiによる英英定義判定 (英語回答) ---
+def evaluate_meaning_en(audio_bytes, target_word, target_def_en, api_key, model_name, timeout=EVAL_TIMEOUT, mime_type="audio/wav", on_partial=None):
+    try:
+        prompt = f"""
+        Role: Supportive Teacher.
+        Task: 
+        1. Transcribe the user's English audio accurately.
+        2. Check if the explanation matches the meaning of "{target_word}".
+        
+        Definition: "{target_def_en}"
+        Criteria: 
+        - Transcription: Strict and accurate.
+        - Meaning Evaluation: Lenient. Accept simple explanations or keywords if the core idea is conveyed.
+        
+        Output JSON only:
+        {{
+            "transcription": "The exact transcription of what the user said",
+            "is_correct": boolean,
+            "comment": "Brief encouragement and feedback in Japanese (max 2 sentences)."
+        }}
+        """
+
+        return _evaluate_audio(prompt, audio_bytes, api_key, model_name, timeout, mime_type,
+                               MEANING_FIELDS, on_partial)
+        
+    except Exception as e:
+        return {"error": str(e)}
+
+
+# --- 関数: AIヒント生成 ---
+@functools.lru_cache(maxsize=1024)
+def generate_ai_hint(target_word, target_def, api_key, model_name):
+    try:
+        prompt = f"""
+        Word: "{target_word}"
+        Definition: "{target_def}"
+        
+        Task: Provide 3 simple English keywords or concepts that are related to this word, to help someone explain it. 
+        Do not use the word itself or its direct derivatives.
+        For example, if the word is 'Apple', keywords could be 'Fruit, Red, Pie'.
+        Output format: Keyword1, Keyword2, Keyword3
+        """
+        
+        response = generate(api_key, model_name, prompt, priority=PRIORITY_BACKGROUND)
+
+        return response.text.strip()
+    except Exception as e:
+        return "Hint not available"
+
+# --- 関数: 関連語の取得 (AI) ---
+@functools.lru_cache(maxsize=1024)
+def get_related_words_ai(target_word, api_key, model_name):
+    """
+    指定された単語の類義語・反意語をAIにリストアップさせる。
+    返り値: リスト ["word1", "word2", ...]
+    """
+    try:
+        prompt = f"""
+        Task: List 5 synonyms and 5 antonyms for the word "{target_word}".
+        Output ONLY the words, separated by commas. No labels like 'Synonyms:'.
+        Simple format: word1, word2, word3...
+        """
+        response = generate(api_key, model_name, prompt, priority=PRIORITY_BACKGROUND)
+        
+        text = response.text.strip()
+        words = [w.strip().lower() for w in text.split(',')]
+        return words
+    except:
+        return []
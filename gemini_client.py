@@ -0,0 +1,242 @@
+"""
+Gemini のモデルクライアントをモデルごとに使い回すレジストリ。
+
+呼び出しのたびに genai.configure (グローバル状態の書き換え) と GenerativeModel の生成を
+行う代わりに、APIキーが変わったときだけ設定し、モデルごとに1つ作って共有する
+(SDK の内部には触らず、公開の genai.configure / GenerativeModel だけを使う)。
+ワーカースレッドから使ってもよい。
+モデルごとの呼び出し回数・エラー数・レイテンシ・トークン数を集計する。
+
+呼び出しはすべて rate_limiter の予算 (RPM/TPM) を通し、429 や一時的なサーバーエラーは
+ジッター付きの指数バックオフで再試行する。request_options の timeout は再試行・待ち時間も
+含めた呼び出し全体の締め切りとして扱う。
+"""
+import random
+import threading
+import time
+
+import google.generativeai as genai
+
+from instrumentation import get_profiler
+from rate_limiter import ACQUIRE_TIMEOUT, PRIORITY_INTERACTIVE, get_rate_limiter
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0  # 秒
+BACKOFF_MAX = 16.0
+# 応答のトークン数の見積もり (実際の値が分かったら差分を精算する)
+OUTPUT_TOKEN_ESTIMATE = 256
+# 音声は約32トークン/秒 (16kHz・16bit の WAV なら約1000バイトで1トークン)
+AUDIO_BYTES_PER_TOKEN = 1000
+
+
+def _status_code(e):
+    """例外の HTTP ステータスコード (google.api_core の例外は code に持っている)"""
+    code = getattr(e, 'code', None)
+    code = getattr(code, 'value', code)  # HTTPStatus
+    return code if isinstance(code, int) else None
+
+
+def _is_retryable(e):
+    """クォータ超過(429)や一時的なサーバーエラーかどうか"""
+    code = _status_code(e)
+    return code == 429 or (code is not None and 500 <= code < 600)
+
+
+def _backoff(attempt):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+def _deadline(kwargs):
+    """request_options の timeout から、呼び出し全体の締め切り (monotonic) を求める"""
+    timeout = (kwargs.get('request_options') or {}).get('timeout')
+    return time.monotonic() + timeout if timeout else None
+
+
+def _attempt_kwargs(kwargs, deadline):
+    """締め切りまでの残り時間を、この試行の request_options の timeout にする"""
+    if deadline is None:
+        return kwargs
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("Gemini request deadline exceeded")
+    return dict(kwargs, request_options=dict(kwargs['request_options'], timeout=remaining))
+
+
+def estimate_tokens(contents):
+    """リクエストのトークン数のおおまかな見積もり (文字数/4 + 音声の長さ + 応答分)"""
+    if isinstance(contents, (str, dict)):
+        contents = [contents]
+    tokens = OUTPUT_TOKEN_ESTIMATE
+    for part in contents:
+        if isinstance(part, str):
+            tokens += len(part) // 4
+        elif isinstance(part, dict) and 'data' in part:
+            tokens += len(part['data']) // AUDIO_BYTES_PER_TOKEN
+    return tokens
+
+
+def _used_tokens(usage):
+    if usage is None:
+        return None
+    return (getattr(usage, 'prompt_token_count', 0) or 0) + (getattr(usage, 'candidates_token_count', 0) or 0)
+
+
+class ModelStats:
+    """1モデル分の利用状況"""
+    __slots__ = ('calls', 'errors', 'retries', 'total_latency', 'max_latency', 'prompt_tokens', 'output_tokens')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_latency": self.total_latency / self.calls if self.calls else 0.0,
+            "max_latency": self.max_latency,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+
+class GeminiRegistry:
+    """model_name -> GenerativeModel のレジストリ (APIキーはプロセスで1つ)"""
+
+    def __init__(self):
+        self._api_key = None  # genai.configure 済みのキー
+        self._models = {}  # model_name -> GenerativeModel
+        self._stats = {}  # model_name -> ModelStats
+        self._lock = threading.Lock()
+
+    def model(self, api_key, model_name):
+        """共有のモデルを返す (なければ作成)"""
+        with self._lock:
+            if api_key != self._api_key:
+                # SDK の設定はプロセス全体で1つなので、キーが変わったときだけ設定し直してモデルも作り直す
+                genai.configure(api_key=api_key)
+                self._api_key = api_key
+                self._models.clear()
+            model = self._models.get(model_name)
+            if model is None:
+                model = self._models[model_name] = genai.GenerativeModel(model_name)
+            return model
+
+    def _acquire(self, model_name, contents, priority, kwargs):
+        """レート制限の予算を予約し、見積もったトークン数を返す"""
+        tokens = estimate_tokens(contents)
+        timeout = (kwargs.get('request_options') or {}).get('timeout', ACQUIRE_TIMEOUT)
+        get_rate_limiter().acquire(model_name, tokens, priority=priority, timeout=timeout)
+        return tokens
+
+    def _retry_wait(self, model_name, attempt, e, deadline=None):
+        """再試行するなら待ってから True を返す (待つと締め切りを過ぎる場合は再試行しない)"""
+        if attempt >= MAX_RETRIES or not _is_retryable(e):
+            return False
+        delay = _backoff(attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return False
+        if _status_code(e) == 429:
+            # 他の呼び出しも含めて送信を止める
+            get_rate_limiter().penalize(model_name, delay)
+        with self._lock:
+            self._model_stats(model_name).retries += 1
+        time.sleep(delay)
+        return True
+
+    def generate(self, api_key, model_name, contents, priority=PRIORITY_INTERACTIVE, **kwargs):
+        """generate_content を呼び出し、レイテンシ・エラー・トークン数を記録する"""
+        model = self.model(api_key, model_name)
+        deadline = _deadline(kwargs)
+        for attempt in range(MAX_RETRIES + 1):
+            tokens = self._acquire(model_name, contents, priority, _attempt_kwargs(kwargs, deadline))
+            start = time.monotonic()
+            try:
+                response = model.generate_content(contents, **_attempt_kwargs(kwargs, deadline))
+            except Exception as e:
+                self._record(model_name, time.monotonic() - start, error=True)
+                if self._retry_wait(model_name, attempt, e, deadline):
+                    continue
+                raise
+            usage = getattr(response, 'usage_metadata', None)
+            get_rate_limiter().adjust(model_name, tokens, _used_tokens(usage))
+            self._record(model_name, time.monotonic() - start, usage=usage)
+            return response
+
+    def generate_stream(self, api_key, model_name, contents, priority=PRIORITY_INTERACTIVE, **kwargs):
+        """
+        generate_content(stream=True) のテキストを順に返すジェネレーター (終了時に利用状況を記録)。
+        再試行は最初のチャンクを受け取る前のエラーに限る。
+        """
+        model = self.model(api_key, model_name)
+        deadline = _deadline(kwargs)
+        for attempt in range(MAX_RETRIES + 1):
+            tokens = self._acquire(model_name, contents, priority, _attempt_kwargs(kwargs, deadline))
+            start = time.monotonic()
+            received = False
+            try:
+                response = model.generate_content(contents, stream=True, **_attempt_kwargs(kwargs, deadline))
+                for chunk in response:
+                    try:
+                        text = chunk.text
+                    except ValueError:  # テキストを含まないチャンク
+                        continue
+                    received = True
+                    yield text
+            except Exception as e:
+                self._record(model_name, time.monotonic() - start, error=True)
+                if not received and self._retry_wait(model_name, attempt, e, deadline):
+                    continue
+                raise
+            usage = getattr(response, 'usage_metadata', None)
+            get_rate_limiter().adjust(model_name, tokens, _used_tokens(usage))
+            self._record(model_name, time.monotonic() - start, usage=usage)
+            return
+
+    def _model_stats(self, model_name):
+        stats = self._stats.get(model_name)
+        if stats is None:
+            stats = self._stats[model_name] = ModelStats()
+        return stats
+
+    def _record(self, model_name, latency, error=False, usage=None):
+        get_profiler().record(f"gemini.{model_name}", latency)
+        with self._lock:
+            stats = self._model_stats(model_name)
+            stats.calls += 1
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+            if error:
+                stats.errors += 1
+            if usage is not None:
+                stats.prompt_tokens += getattr(usage, 'prompt_token_count', 0) or 0
+                stats.output_tokens += getattr(usage, 'candidates_token_count', 0) or 0
+
+    def stats(self):
+        """モデル名 -> 利用状況 の辞書"""
+        with self._lock:
+            return {name: s.as_dict() for name, s in self._stats.items()}
+
+
+_registry = GeminiRegistry()
+
+
+def get_gemini_registry():
+    return _registry
+
+
+def generate(api_key, model_name, contents, priority=PRIORITY_INTERACTIVE, **kwargs):
+    """共有レジストリ経由で generate_content を呼び出す"""
+    return _registry.generate(api_key, model_name, contents, priority=priority, **kwargs)
+
+
+def generate_stream(api_key, model_name, contents, priority=PRIORITY_INTERACTIVE, **kwargs):
+    """共有レジストリ経由でストリーミング生成する"""
+    return _registry.generate_stream(api_key, model_name, contents, priority=priority, **kwargs)
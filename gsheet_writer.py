@@ -0,0 +1,234 @@
+"""
+Google Sheets への書き込みをまとめて行うライター。
+
+プロセスごとに1つだけ常駐し、認証済みクライアントとワークシートを使い回す。
+ログはキューに積み、件数か経過時間のしきい値で append_rows によりまとめて書き込む。
+"""
+import atexit
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import gspread
+from google.oauth2.service_account import Credentials
+
+# 接続の切断・タイムアウト (requests の例外は OSError の派生だが、HTTPError などは含めない)
+try:
+    from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
+    _NETWORK_ERRORS = (ConnectionError, TimeoutError, RequestsConnectionError, RequestsTimeout)
+except ImportError:
+    _NETWORK_ERRORS = (ConnectionError, TimeoutError)
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+
+# まとめ書きのしきい値
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 2.0  # 秒
+QUEUE_MAXSIZE = 5000
+
+# 429 / 5xx 時のリトライ設定
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # 秒
+BACKOFF_MAX = 32.0
+
+# 再送用に保持する失敗行の上限 (超えたら古いものから捨てる)
+FAILED_ROWS_LIMIT = 1000
+
+
+def open_worksheet(service_account_info, sheet_name):
+    """サービスアカウントで認証し、スプレッドシートの1枚目を開く"""
+    creds = Credentials.from_service_account_info(dict(service_account_info), scopes=SCOPES)
+    client = gspread.authorize(creds)
+    return client.open(sheet_name).sheet1
+
+
+def _is_retryable(e):
+    """クォータ超過(429)・一時的なサーバーエラー・接続の切断やタイムアウトかどうか"""
+    if isinstance(e, _NETWORK_ERRORS):
+        return True
+    response = getattr(e, 'response', None)
+    code = getattr(response, 'status_code', None) or getattr(e, 'code', None)
+    return code == 429 or (isinstance(code, int) and 500 <= code < 600)
+
+
+class SheetWriter:
+    """
+    キューを1本のスレッドで消化し、まとめて append_rows するライター。
+    pending (未送信) / written (送信済み) / failed (失敗) の件数を公開する。
+    """
+
+    def __init__(self, service_account_info, sheet_name,
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 maxsize=QUEUE_MAXSIZE):
+        self.service_account_info = dict(service_account_info)
+        self.sheet_name = sheet_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._worksheet = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._in_flight = 0
+
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0  # 上限を超えて捨てた失敗行
+        # 失敗した行 (retry_failed() で再送する。最大 FAILED_ROWS_LIMIT 行)。
+        # メモリにしか持たないので再起動で消える (ローカルログには残っている)
+        self.failed_rows = deque()
+        self.last_error = None
+        # 行が送信に失敗したとき / 失敗した行を再送に回したときに、その行のリストを渡して呼ぶ
+        self.on_failure = []
+        self.on_requeue = []
+
+        self._thread = threading.Thread(target=self._run, name="SheetWriter", daemon=True)
+        self._thread.start()
+
+    # --- 公開API ---
+    @property
+    def pending(self):
+        """未送信の行数 (キュー + 送信中)"""
+        return self._queue.qsize() + self._in_flight
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "written": self.written,
+            "failed": self.failed,
+            "retryable": len(self.failed_rows),
+            "dropped": self.dropped,
+            "last_error": self.last_error,
+        }
+
+    def append(self, row):
+        """1行をキューに積む (ブロックしない)。キューが満杯ならFalse"""
+        try:
+            self._queue.put_nowait(list(row))
+            return True
+        except queue.Full:
+            self._record_failure([list(row)], "queue full")
+            return False
+
+    def pending_rows(self):
+        """キューに積まれていて、まだ送信を始めていない行のコピー"""
+        with self._queue.mutex:
+            return list(self._queue.queue)
+
+    def retry_failed(self):
+        """失敗した行をキューに戻して再送する。戻した行数を返す"""
+        requeued = []
+        with self._lock:
+            while self.failed_rows:
+                try:
+                    self._queue.put_nowait(self.failed_rows[0])
+                except queue.Full:
+                    break
+                requeued.append(self.failed_rows.popleft())
+        if requeued:
+            for callback in self.on_requeue:
+                callback(requeued)
+        return len(requeued)
+
+    def close(self, timeout=10.0):
+        """残りを書き出してスレッドを止める (書き出せなかった行数は表示する)"""
+        self._stop.set()
+        self._thread.join(timeout)
+        abandoned = self.pending if self._thread.is_alive() else 0
+        if abandoned or self.failed_rows:
+            print(f"GSheet writer closed with {abandoned} unsent rows and "
+                  f"{len(self.failed_rows)} failed rows (sheet: {self.sheet_name})")
+
+    # --- 内部処理 ---
+    def _get_worksheet(self):
+        if self._worksheet is None:
+            self._worksheet = open_worksheet(self.service_account_info, self.sheet_name)
+        return self._worksheet
+
+    def _record_failure(self, rows, error):
+        with self._lock:
+            self.failed += len(rows)
+            self.failed_rows.extend(rows)
+            overflow = len(self.failed_rows) - FAILED_ROWS_LIMIT
+            for _ in range(max(0, overflow)):
+                self.failed_rows.popleft()
+            self.dropped += max(0, overflow)
+            self.last_error = str(error)
+        print(f"GSheet save failed ({len(rows)} rows): {error}")
+        for callback in self.on_failure:
+            callback(rows)
+
+    def _drain(self, first, limit):
+        """first に続けて、キューから最大 limit 件まで取り出す"""
+        batch = [first]
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                self._get_worksheet().append_rows(rows)
+                with self._lock:
+                    self.written += len(rows)
+                return
+            except Exception as e:
+                if attempt < MAX_RETRIES and _is_retryable(e):
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+                    time.sleep(delay * (0.5 + random.random() / 2))
+                    continue
+                # 認証切れ等に備えてハンドルを作り直す
+                self._worksheet = None
+                self._record_failure(rows, e)
+                return
+
+    def _run(self):
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            # しきい値 (件数 or 時間) に達するまで溜める
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    first = self._queue.get(timeout=min(timeout, 0.5))
+                    batch.extend(self._drain(first, self.batch_size - len(batch)))
+                    self._in_flight = len(batch)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        break
+            if batch:
+                self._write(batch)
+                self._in_flight = 0
+            if self._stop.is_set() and self._queue.empty():
+                return
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_sheet_writer(service_account_info, sheet_name):
+    """プロセス内で共有するライターを返す (なければ作成)"""
+    key = (service_account_info.get("client_email"), sheet_name)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = SheetWriter(service_account_info, sheet_name)
+        return writer
+
+
+@atexit.register
+def _flush_all():
+    """プロセス終了時に未送信分を書き出す"""
+    for writer in list(_writers.values()):
+        writer.close()
@@ -0,0 +1,182 @@
+"""
+ユーザーごとの学習履歴の集計 (History タブ用) と、全ユーザーの一覧 (サイドバー用)。
+
+初回だけ DataFrame からまとめて集計し、以降はイベントが1件増えるたびに差分で更新する。
+- 単語ごとの最新の自己評価 (Easy / Hard) と、その件数 (覚えた / 不安)
+- 日付ごとの活動量
+- 発音スコアの推移
+グラフ用の DataFrame は内容が変わったときだけ作り直す。
+"""
+import bisect
+from collections import Counter
+from datetime import datetime
+
+import pandas as pd
+
+
+def _parse_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        ts = pd.to_datetime(value, errors='coerce')
+        return None if pd.isna(ts) else ts
+
+
+def _parse_score(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class UserAnalytics:
+    """1ユーザー分の集計"""
+
+    def __init__(self):
+        self.events = 0
+        self.latest_rating = {}  # word -> (timestamp, detail)
+        self.rating_counts = Counter()  # detail -> 単語数 (最新の自己評価のみ)
+        self.daily = Counter()  # date -> 件数
+        self.scores = []  # (timestamp, score) 時刻順
+        self._version = 0
+        self._frames = {}  # name -> (version, DataFrame)
+
+    @classmethod
+    def from_frame(cls, df):
+        """履歴 DataFrame (history_schema の形式) からまとめて集計する"""
+        a = cls()
+        if df is None or df.empty:
+            return a
+        ts = pd.to_datetime(df['timestamp'], errors='coerce')
+        a.events = len(df)
+        a.daily.update(ts.dropna().dt.date.value_counts().to_dict())
+
+        action = df['action'].astype(object)
+        rated = df[action == 'SelfRating'].assign(_ts=ts).dropna(subset=['_ts'])
+        if not rated.empty:
+            # 時刻順 (同時刻は後に記録された方) で最後のものが最新
+            latest = rated.sort_values('_ts', kind='stable').drop_duplicates('word', keep='last')
+            for word, t, detail in zip(latest['word'].astype(object), latest['_ts'], latest['detail']):
+                a.latest_rating[word] = (t, detail)
+            a.rating_counts.update(latest['detail'].tolist())
+
+        pron = df[action == 'Pronunciation'].assign(_ts=ts).dropna(subset=['_ts'])
+        if not pron.empty:
+            pron = pron.sort_values('_ts', kind='stable')
+            a.scores = list(zip(pron['_ts'], pd.to_numeric(pron['score'], errors='coerce').fillna(0).astype(int)))
+        return a
+
+    def add(self, record):
+        """イベント1件を反映する (O(1)。発音スコアが時刻順でなく届いた場合のみ O(log N) の挿入)"""
+        ts = _parse_timestamp(record.get('timestamp'))
+        self.events += 1
+        self._version += 1
+        if ts is None:
+            return
+        self.daily[ts.date()] += 1
+        action = record.get('action')
+        if action == 'SelfRating':
+            word, detail = record.get('word'), record.get('detail')
+            previous = self.latest_rating.get(word)
+            if previous is None or ts >= previous[0]:
+                if previous is not None:
+                    self.rating_counts[previous[1]] -= 1
+                self.latest_rating[word] = (ts, detail)
+                self.rating_counts[detail] += 1
+        elif action == 'Pronunciation':
+            entry = (ts, _parse_score(record.get('score')))
+            if not self.scores or ts >= self.scores[-1][0]:
+                self.scores.append(entry)
+            else:
+                bisect.insort(self.scores, entry)
+
+    # --- 参照 ---
+    @property
+    def mastered(self):
+        return self.rating_counts['Easy']
+
+    @property
+    def review(self):
+        return self.rating_counts['Hard']
+
+    def _cached(self, name, build):
+        version, frame = self._frames.get(name, (None, None))
+        if version != self._version:
+            frame = build()
+            self._frames[name] = (self._version, frame)
+        return frame
+
+    def daily_frame(self):
+        """日付ごとの活動量 (date, count)"""
+        return self._cached('daily', lambda: pd.DataFrame(
+            sorted(self.daily.items()), columns=['date', 'count']))
+
+    def score_frame(self):
+        """発音スコアの推移 (timestamp, score)"""
+        return self._cached('scores', lambda: pd.DataFrame(self.scores, columns=['timestamp', 'score']))
+
+
+class UserDirectory:
+    """
+    全ユーザーの一覧 (ユーザー -> 最終アクティビティ時刻, 件数)。
+    履歴の読み込み時にまとめて作り、以降はイベントが1件増えるたびに差分で更新する。
+    """
+
+    def __init__(self):
+        self.entries = {}  # user -> [最終アクティビティ時刻 (不明なら None), 件数]。初出順
+        self._ordered = None  # 最終アクティビティが新しい順のユーザー名 (変わるまで使い回す)
+
+    @classmethod
+    def from_frame(cls, df):
+        """履歴 DataFrame (history_schema の形式) からまとめて作る"""
+        d = cls()
+        if df is None or df.empty:
+            return d
+        stats = df.groupby('user', sort=False, observed=True)['timestamp'].agg(['max', 'size'])
+        for user, last, count in zip(stats.index, stats['max'], stats['size']):
+            if _is_user(user):
+                d.entries[user] = [None if pd.isna(last) else last, int(count)]
+        return d
+
+    def add(self, record):
+        """イベント1件を反映する (O(1))"""
+        user = record.get('user')
+        if not _is_user(user):
+            return
+        ts = _parse_timestamp(record.get('timestamp'))
+        entry = self.entries.get(user)
+        if entry is None:
+            self.entries[user] = [ts, 1]
+            self._ordered = None
+            return
+        entry[1] += 1
+        if ts is not None and (entry[0] is None or ts > entry[0]):
+            entry[0] = ts
+            self._ordered = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def last_active(self, user):
+        entry = self.entries.get(user)
+        return entry[0] if entry else None
+
+    def event_count(self, user):
+        entry = self.entries.get(user)
+        return entry[1] if entry else 0
+
+    def users_by_last_active(self):
+        """最終アクティビティが新しい順のユーザー名リスト (時刻不明は最後、同時刻は初出順)"""
+        if self._ordered is None:
+            self._ordered = sorted(self.entries, key=lambda u: _sort_key(self.entries[u][0]), reverse=True)
+        return list(self._ordered)
+
+
+def _is_user(user):
+    return user is not None and user == user and user != ''
+
+
+def _sort_key(ts):
+    return pd.Timestamp.min if ts is None else pd.Timestamp(ts)
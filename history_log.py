@@ -0,0 +1,199 @@
+"""
+ローカル履歴の追記専用ログ (JSON Lines)。
+
+1イベント = 1行で追記するため、保存コストは履歴の量に関係なく一定。
+fsync は件数/時間でまとめて行い、読み込みはファイルオフセットから差分だけ読む。
+全件の読み込み時に壊れた行・末尾の書きかけの行 (書き込み中に落ちた等) が見つかれば、
+ログを書き直して取り除く。
+
+使い方 (手動でのコンパクション):
+    python history_log.py [history.jsonl]
+ファイルを置き換えるので、アプリを止めている間だけ実行すること
+(動いているアプリは置き換え前のファイルに追記し続け、その分が失われる)。
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+HISTORY_LOG_FILE = 'history.jsonl'
+LEGACY_HISTORY_FILE = 'history.json'
+
+# fsync をまとめるしきい値
+FSYNC_EVERY = 20
+FSYNC_INTERVAL = 1.0  # 秒
+
+
+class HistoryLog:
+    """
+    追記専用のイベントログ。
+    append() で1行追記し、read_since(offset) で offset 以降の完全な行だけを読む。
+    """
+
+    def __init__(self, path=HISTORY_LOG_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fp = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.invalid_lines = 0  # 直近の読み込みで見つかった壊れた行の数
+        self.torn_tail = False  # 直近の読み込みで末尾が書きかけの行だったか
+
+    # --- 書き込み ---
+    def _open(self):
+        if self._fp is None:
+            self._fp = open(self.path, 'a', encoding='utf-8')
+            # 前回が書きかけの行で終わっていれば、その続きに書かないよう改行を足す
+            # (書きかけの行は壊れた行として読み飛ばされ、次のコンパクションで消える)
+            if not _ends_with_newline(self.path):
+                self._fp.write('\n')
+        return self._fp
+
+    def append(self, record):
+        """1件追記する"""
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            fp = self._open()
+            fp.write(line)
+            fp.flush()
+            self._unsynced += 1
+            if self._unsynced >= FSYNC_EVERY or time.monotonic() - self._last_sync >= FSYNC_INTERVAL:
+                self._sync()
+
+    def _sync(self):
+        if self._fp is not None and self._unsynced:
+            os.fsync(self._fp.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+    # --- 読み込み ---
+    def read_since(self, offset=0):
+        """offset 以降の完全な行をパースして (records, 新しいoffset) を返す"""
+        if not os.path.exists(self.path):
+            return [], 0
+        records = []
+        invalid = 0
+        torn = False
+        with open(self.path, 'rb') as f:
+            if offset > os.fstat(f.fileno()).st_size:
+                # コンパクション等でファイルが縮んだ場合は先頭から読み直す
+                offset = 0
+            start = offset
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    torn = True
+                    break  # 書き込み途中の行は次回に回す
+                offset += len(raw)
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    invalid += 1
+                    continue
+                if isinstance(record, dict):
+                    records.append(record)
+                else:
+                    invalid += 1
+        self.invalid_lines = invalid if start == 0 else self.invalid_lines + invalid
+        self.torn_tail = torn
+        return records, offset
+
+    def load_all(self):
+        """
+        全レコードと読み終えた offset を返す。
+        壊れた行・末尾の書きかけの行があればログを書き直してから返す (起動時に呼ぶ想定)。
+        """
+        records, offset = self.read_since(0)
+        if self.invalid_lines or self.torn_tail:
+            print(f"History log has {self.invalid_lines} broken lines"
+                  f"{' and a torn last line' if self.torn_tail else ''}; compacting {self.path}")
+            records, offset = self.compact()
+        return records, offset
+
+    # --- メンテナンス ---
+    def compact(self):
+        """
+        壊れた行・末尾の書きかけの行を取り除いてログを書き直し、(records, offset) を返す。
+        同じ内容の行も別々のイベントとして残す (同じ秒に同じ操作を2回記録することがあるため)。
+        一時ファイルに書いてから置き換えるので、途中で落ちても元のログは残る。
+        """
+        with self._lock:
+            self._sync()
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+            records, _ = self.read_since(0)
+
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for r in records:
+                    f.write(json.dumps(r, ensure_ascii=False, default=str) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+                offset = f.tell()
+            os.replace(tmp_path, self.path)
+            self.invalid_lines = 0
+            self.torn_tail = False
+            return records, offset
+
+    def import_legacy(self, legacy_path=LEGACY_HISTORY_FILE):
+        """旧形式 (history.json の全量ダンプ) をログに取り込む。ログが既にあれば何もしない"""
+        if os.path.exists(self.path) or not os.path.exists(legacy_path):
+            return 0
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except ValueError:
+            return 0
+        for r in records:
+            self.append(r)
+        self.close()
+        return len(records)
+
+
+def _ends_with_newline(path):
+    """空のファイル、または最後の1バイトが改行なら True"""
+    with open(path, 'rb') as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_history_log(path=HISTORY_LOG_FILE):
+    """プロセス内で共有するログを返す"""
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = HistoryLog(path)
+            _log.import_legacy()
+        return _log
+
+
+@atexit.register
+def _close_log():
+    if _log is not None:
+        _log.close()
+
+
+if __name__ == "__main__":
+    # アプリが動いている間に実行しないこと (モジュールの docstring を参照)
+    log = HistoryLog(sys.argv[1] if len(sys.argv) > 1 else HISTORY_LOG_FILE)
+    if not os.path.exists(log.path):
+        sys.exit(f"{log.path} not found")
+    before = os.path.getsize(log.path)
+    kept, size = log.compact()
+    print(f"{len(kept)} records kept ({before} -> {size} bytes): {log.path}")
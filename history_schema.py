@@ -0,0 +1,92 @@
+"""
+学習履歴の列定義と型変換。
+
+user/word/action はカテゴリ型、score は int8、is_correct は bool、
+timestamp は datetime64、detail はインターンした文字列で持つ。
+"""
+import sys
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+HISTORY_COLUMNS = ["timestamp", "user", "word", "action", "score", "is_correct", "detail"]
+CATEGORY_COLUMNS = ["user", "word", "action"]
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_TRUE_STRINGS = {'true', '1', 'yes'}
+
+
+def parse_bool(value):
+    """"TRUE"/"FALSE" などの文字列も含めて真偽値に変換する ("FALSE" を真とみなさない)"""
+    if isinstance(value, str):
+        return value.strip().lower() in _TRUE_STRINGS
+    if value is None:
+        return False
+    try:
+        if pd.isna(value):
+            return False
+    except (TypeError, ValueError):
+        pass
+    return bool(value)
+
+
+def _intern(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    return sys.intern(str(value))
+
+
+def _parse_timestamps(values):
+    col = pd.Series(values, dtype=object)
+    ts = pd.to_datetime(col, format=TIMESTAMP_FORMAT, errors='coerce')
+    # 旧形式 (ISO形式など) が混ざっていれば個別に解析する
+    retry = ts.isna() & col.notna() & (col != '')
+    if retry.any():
+        ts[retry] = pd.to_datetime(col[retry], format='mixed', errors='coerce')
+    return ts
+
+
+def _build_frame(columns):
+    """列ごとの値リストから型付きの DataFrame を作る"""
+    score = pd.to_numeric(pd.Series(columns['score'], dtype=object), errors='coerce').fillna(0)
+    return pd.DataFrame({
+        'timestamp': _parse_timestamps(columns['timestamp']),
+        'user': pd.Categorical(columns['user']),
+        'word': pd.Categorical(columns['word']),
+        'action': pd.Categorical(columns['action']),
+        'score': score.clip(-128, 127).astype('int8'),
+        'is_correct': pd.Series([parse_bool(v) for v in columns['is_correct']], dtype=bool),
+        'detail': pd.Series([_intern(v) for v in columns['detail']], dtype=object),
+    })
+
+
+def frame_from_rows(rows):
+    """シートの行 (列順のリスト) を直接、型付きの DataFrame に変換する"""
+    width = len(HISTORY_COLUMNS)
+    padded = [(list(row) + [''] * width)[:width] for row in rows]
+    if not padded:
+        return empty_history_frame()
+    return _build_frame(dict(zip(HISTORY_COLUMNS, map(list, zip(*padded)))))
+
+
+def to_history_frame(records):
+    """レコード (dictのリスト) を型付きの DataFrame に変換する"""
+    if not records:
+        return empty_history_frame()
+    return _build_frame({c: [r.get(c) for r in records] for c in HISTORY_COLUMNS})
+
+
+def empty_history_frame():
+    return _build_frame({c: [] for c in HISTORY_COLUMNS})
+
+
+def concat_history_frames(a, b):
+    """カテゴリ型を保ったまま2つの履歴を連結する"""
+    if a.empty:
+        return b
+    if b.empty:
+        return a
+    df = pd.concat([a, b], ignore_index=True)
+    for c in CATEGORY_COLUMNS:
+        df[c] = union_categoricals([a[c], b[c]], ignore_order=True)
+    return df
@@ -0,0 +1,380 @@
+"""
+プロセス全体で共有する学習履歴ストア。
+
+Streamlitのセッションごとに履歴を丸ごと読み込む代わりに、プロセスで1回だけ読み込み、
+以降は差分ポーリング (GSheetは行カーソル、ローカルログはファイルオフセット) で最新に保つ。
+GSheet の差分はバックグラウンドのスレッドで取得し、次の再実行でマージする。
+データはユーザーごとに分割して持ち、各セッションにはそのユーザーの DataFrame をコピーせずに渡す。
+"""
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from gsheet_writer import get_sheet_writer, open_worksheet
+from history_analytics import UserAnalytics, UserDirectory
+from history_log import get_history_log
+from history_schema import (HISTORY_COLUMNS, concat_history_frames, empty_history_frame,
+                            frame_from_rows, to_history_frame)
+from instrumentation import timed
+
+# GSheet / ローカルログを差分ポーリングする間隔 (秒)
+POLL_INTERVAL = 30.0
+
+
+def _record_key(record):
+    """自プロセスで追加したイベントを、ポーリングで読み戻した時に照合するためのキー"""
+    return (str(record.get('timestamp')), record.get('user'), record.get('word'),
+            record.get('action'), str(record.get('detail')))
+
+
+def _pad_row(row):
+    """Sheets API は末尾の空セルを省略するので列数を揃える"""
+    row = list(row)[:len(HISTORY_COLUMNS)]
+    return row + [''] * (len(HISTORY_COLUMNS) - len(row))
+
+
+def _rows_to_records(rows):
+    return [dict(zip(HISTORY_COLUMNS, _pad_row(row))) for row in rows if any(row)]
+
+
+class _Partition:
+    """
+    1ユーザー分の履歴。追加分はまとめて DataFrame に反映する。
+    集計 (analytics) は初回参照時に作り、以降は add() のたびに差分で更新する。
+    """
+    __slots__ = ('frame', 'pending', 'analytics', '_newest_first')
+
+    def __init__(self, frame=None):
+        self.frame = frame if frame is not None else empty_history_frame()
+        self.pending = []
+        self.analytics = None
+        self._newest_first = (None, None)  # (frame, 新しい順の行位置)
+
+    def add(self, record):
+        self.pending.append(record)
+        if self.analytics is not None:
+            self.analytics.add(record)
+
+    def __len__(self):
+        return len(self.frame) + len(self.pending)
+
+    def view(self):
+        if self.pending:
+            # 既存の DataFrame は書き換えず、新しいものに差し替える (参照中のセッションに影響しない)
+            self.frame = concat_history_frames(self.frame, to_history_frame(self.pending))
+            self.pending = []
+        return self.frame
+
+    def get_analytics(self):
+        if self.analytics is None:
+            self.analytics = UserAnalytics.from_frame(self.view())
+        return self.analytics
+
+    def newest_first(self):
+        """新しい順の行位置 (DataFrame が変わったときだけ並べ直す)"""
+        frame = self.view()
+        cached, order = self._newest_first
+        if cached is not frame:
+            # 古い順 (時刻不明は先頭、同時刻は記録順) に並べて逆順にする
+            ts = frame['timestamp'].to_numpy()
+            order = np.lexsort((np.arange(len(frame)), ts, ~np.isnat(ts)))[::-1]
+            self._newest_first = (frame, order)
+        return order
+
+
+class HistoryStore:
+    """
+    全ユーザーの履歴をユーザー単位で保持するストア。
+    返す DataFrame は共有物なので、呼び出し側で書き換えないこと。
+    """
+
+    def __init__(self, service_account_info=None, sheet_name=None, local_log=None):
+        self.service_account_info = dict(service_account_info) if service_account_info else None
+        self.sheet_name = sheet_name
+        self.local_log = local_log or get_history_log()
+
+        self.source = None  # 'gsheet' or 'local'
+        self.last_error = None
+        self.loaded_at = None
+        self._partitions = {}
+        self._users = UserDirectory()  # ユーザー一覧 (サイドバー用)。追加のたびに差分で更新する
+        self._own = Counter()  # 自プロセスで追加し、まだ読み戻していないイベント
+        self._writer = None  # 自プロセスの行をシートに書き込むライター (attach_writer で設定)
+        self._log_offset = 0
+
+        # GSheet の差分同期用カーソル
+        self._worksheet = None
+        self._sheet_rows = 0  # 読み込み済みの行数 (ヘッダー含む)
+        self._sheet_first = None  # 1行目 (ヘッダー変更の検知用)
+        self._sheet_last = None  # 最終行 (行の削除・書き換えの検知用)
+        self._last_poll = 0.0
+        self._poll_thread = None  # シートの差分を取得するバックグラウンドのスレッド
+        self._polled = None  # (generation, 既読の行数, 取得結果)。次の refresh() でマージする
+        self._generation = 0  # 全件を読み込み直すたびに増える
+        self._version = 0  # 内容が変わるたびに増える
+        self._bytes = (None, None)  # (version, memory_bytes() の結果)
+        self._lock = threading.RLock()
+
+    # --- 読み込み ---
+    def _get_worksheet(self):
+        if self._worksheet is None:
+            self._worksheet = open_worksheet(self.service_account_info, self.sheet_name)
+        return self._worksheet
+
+    def _fetch_sheet(self, all_values=None):
+        """
+        シートを全件取得し (all_values を渡せば取得済みの値を使う)、行のまま返す。
+        差分同期用のカーソルも記録する。
+        シートが設定されていない・開けない場合は None (空のシートなら空のリスト)。
+        """
+        if not self.service_account_info:
+            return None
+        if all_values is None:
+            try:
+                all_values = self._get_worksheet().get_all_values()
+            except Exception as e:
+                # シートがない、設定されていない場合はローカルにフォールバック
+                self._worksheet = None
+                self.last_error = str(e)
+                return None
+        self._sheet_rows = len(all_values)
+        if not all_values:
+            # 空のシート: 最初の行が書き込まれたら _poll_sheet で先頭から読む
+            self._sheet_first = self._sheet_last = None
+            return []
+        self._sheet_first = _pad_row(all_values[0])
+        self._sheet_last = _pad_row(all_values[-1])
+        # 1行目がヘッダーならスキップ
+        rows = all_values[1:] if self._sheet_first == HISTORY_COLUMNS else all_values
+        return [row for row in rows if any(row)]
+
+    @timed("history.poll.sheet")
+    def _poll_sheet(self, generation, n, first_seen, last_seen):
+        """
+        バックグラウンドのスレッドで、前回読んだ行より後ろ (A{n+1}:G) だけを取得する。
+        ヘッダーや既読の最終行が変わっていたら全件を取得する。
+        ストアはロックせずに通信だけを行い、結果は次の refresh() で _merge_polled() がマージする。
+        """
+        try:
+            worksheet = self._get_worksheet()
+            # 1行目と「既読の最終行〜末尾」を1回のリクエストで取得 (空のシートなら先頭から)
+            first, tail = worksheet.batch_get(['A1:G1', f'A{n}:G' if n else 'A1:G'])
+            first = _pad_row(first[0]) if first else None
+            last = _pad_row(tail[0]) if n and tail else None
+            if n and (first != first_seen or last != last_seen):
+                result = ("reload", worksheet.get_all_values())
+            else:
+                result = ("rows", first, list(tail[1:]) if n else list(tail))
+        except Exception as e:
+            self._worksheet = None
+            result = ("error", str(e))
+        with self._lock:
+            self._polled = (generation, n, result)
+
+    def _merge_polled(self):
+        """バックグラウンドで取得したシートの差分をマージする"""
+        polled, self._polled = self._polled, None
+        if polled is None:
+            return
+        generation, n, result = polled
+        if generation != self._generation or self.source != 'gsheet':
+            return  # 取得中に読み込み直した
+        if result[0] == "error":
+            self.last_error = result[1]
+        elif result[0] == "reload":
+            self.load(all_values=result[1])
+        else:
+            _, first, new_rows = result
+            if not n:
+                self._sheet_first = first
+            if new_rows:
+                self._sheet_rows += len(new_rows)
+                self._sheet_last = _pad_row(new_rows[-1])
+                if not n and first == HISTORY_COLUMNS:
+                    new_rows = new_rows[1:]
+                self._add_records(_rows_to_records(new_rows))
+
+    def _set_frame(self, df):
+        self._partitions = {user: _Partition(group.reset_index(drop=True))
+                            for user, group in df.groupby('user', sort=False, observed=True)}
+        self._users = UserDirectory.from_frame(df)
+
+    @timed("history.load")
+    def load(self, all_values=None):
+        """全件を読み込み直す (GSheet優先、なければローカルログ。all_values は取得済みのシートの値)"""
+        with self._lock:
+            rows = self._fetch_sheet(all_values)
+            # シートが開ければ、空でもシートを差分ポーリングする (他のインスタンスの書き込みを拾う)
+            self.source = 'gsheet' if rows is not None else 'local'
+            if rows:
+                # シートの行から直接、型付きの列に変換する
+                df = frame_from_rows(rows)
+            else:
+                # シートが空・使えない場合は、ローカルログの履歴を表示する
+                records, self._log_offset = self.local_log.load_all()
+                df = to_history_frame(records)
+            self._set_frame(df)
+            self._version += 1
+            self._generation += 1
+            self._own.clear()
+            if self.source == 'gsheet' and self._writer is not None:
+                # シートにまだ届いていない自プロセスの行は表示に残し、読み戻したときに照合する
+                # (シートを読んだ後に取るので、ここにある行は読んだシートには含まれていない)
+                for r in _rows_to_records(self._writer.pending_rows()):
+                    self._add_own(r)
+            self.loaded_at = time.time()
+            self._last_poll = time.monotonic()
+
+    def refresh(self, force=False):
+        """
+        未読み込みなら読み込み、一定間隔ごとに差分をポーリングする。
+        シートの差分の取得はバックグラウンドで行い、ここでは取得済みの結果をマージするだけ
+        (再実行のたびにシートの応答を待たない)。
+        """
+        with self._lock:
+            if force or self.loaded_at is None:
+                self.load()
+                return
+            self._merge_polled()
+            if time.monotonic() - self._last_poll >= POLL_INTERVAL:
+                self._poll()
+
+    @timed("history.poll")
+    def _poll(self):
+        self._last_poll = time.monotonic()
+        if self.source == 'gsheet':
+            if self._poll_thread is None or not self._poll_thread.is_alive():
+                self._poll_thread = threading.Thread(
+                    target=self._poll_sheet, name="HistoryPoll", daemon=True,
+                    args=(self._generation, self._sheet_rows, self._sheet_first, self._sheet_last))
+                self._poll_thread.start()
+        else:
+            records, self._log_offset = self.local_log.read_since(self._log_offset)
+            self._add_records(records)
+
+    def _add_records(self, records):
+        """ポーリングで得たレコードを追加する (自プロセスで追加済みのものは除く)"""
+        for r in records:
+            key = _record_key(r)
+            if self._own[key]:
+                self._discard_own(key)
+                continue
+            self._partition(r.get('user')).add(r)
+            self._users.add(r)
+            self._version += 1
+
+    def _partition(self, user):
+        part = self._partitions.get(user)
+        if part is None:
+            part = self._partitions[user] = _Partition()
+        return part
+
+    # --- 書き込み ---
+    def append(self, record):
+        """自プロセスで記録したイベントを即時反映する"""
+        with self._lock:
+            self._add_own(dict(record))
+
+    def _add_own(self, record):
+        self._own[_record_key(record)] += 1
+        self._partition(record['user']).add(record)
+        self._users.add(record)
+        self._version += 1
+
+    def attach_writer(self, writer):
+        """
+        自プロセスの行を書き込むライターを登録する。
+        送信に失敗した行は読み戻されないので照合用のキーから外し、再送に回した行は戻す。
+        """
+        with self._lock:
+            self._writer = writer
+        writer.on_failure.append(self._forget_rows)
+        writer.on_requeue.append(self._expect_rows)
+
+    def _forget_rows(self, rows):
+        with self._lock:
+            if self.source != 'gsheet':
+                return  # ローカルログから読み戻すので、シートの失敗は関係ない
+            for r in _rows_to_records(rows):
+                self._discard_own(_record_key(r))
+
+    def _discard_own(self, key):
+        """照合用のキーを1件減らす (0件になったキーは残さない)"""
+        if self._own[key] > 1:
+            self._own[key] -= 1
+        else:
+            self._own.pop(key, None)
+
+    def _expect_rows(self, rows):
+        with self._lock:
+            if self.source == 'gsheet':
+                self._own.update(_record_key(r) for r in _rows_to_records(rows))
+
+    # --- 参照 ---
+    def user_view(self, user_name):
+        """指定ユーザーの履歴 (共有 DataFrame、コピーしない)"""
+        with self._lock:
+            part = self._partitions.get(user_name)
+            return part.view() if part else empty_history_frame()
+
+    def user_analytics(self, user_name):
+        """指定ユーザーの集計 (覚えた・不安な単語数、日ごとの活動量、発音スコアの推移)"""
+        with self._lock:
+            part = self._partitions.get(user_name)
+            return part.get_analytics() if part else UserAnalytics()
+
+    def user_page(self, user_name, page, page_size):
+        """
+        指定ユーザーの履歴を新しい順に並べた page 番目 (0始まり) の行と、全体の行数を返す。
+        並べ替えは履歴が増えたときだけで、毎回は必要な行だけを切り出す。
+        """
+        with self._lock:
+            part = self._partitions.get(user_name)
+            if part is None:
+                return empty_history_frame(), 0
+            order = part.newest_first()
+            frame = part.frame
+        start = page * page_size
+        return frame.iloc[order[start:start + page_size]], len(order)
+
+    def users_by_last_active(self):
+        """最終アクティビティが新しい順のユーザー名リスト (履歴は走査せず、ユーザー一覧から返す)"""
+        with self._lock:
+            return self._users.users_by_last_active()
+
+    def memory_usage(self):
+        """保持しているユーザー数と行数 (ユーザー数に比例するだけなので毎回呼んでよい)"""
+        with self._lock:
+            return {"users": len(self._partitions),
+                    "rows": sum(len(part) for part in self._partitions.values())}
+
+    def memory_bytes(self):
+        """
+        全ユーザーの DataFrame のメモリ使用量 (bytes)。全件を走査するので、必要なときだけ呼ぶこと。
+        内容が変わるまで結果を使い回す。
+        """
+        with self._lock:
+            version, usage = self._bytes
+            if version != self._version:
+                usage = int(sum(part.view().memory_usage(deep=True).sum() for part in self._partitions.values()))
+                self._bytes = (self._version, usage)
+            return usage
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_history_store(service_account_info, sheet_name):
+    """プロセス内で共有するストアを返す (初回のみ読み込み)"""
+    key = ((service_account_info or {}).get("client_email"), sheet_name)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = HistoryStore(service_account_info, sheet_name)
+            if service_account_info:
+                store.attach_writer(get_sheet_writer(service_account_info, sheet_name))
+    store.refresh()
+    return store
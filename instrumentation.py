@@ -0,0 +1,220 @@
+"""
+処理時間の計測 (スパン)。
+
+主な処理 (履歴の読み込み、出題順の並べ替え、Gemini 呼び出し、gTTS、画面の再実行など) を
+名前付きのスパンで囲み、スパンごとに直近 RING_SIZE 件の所要時間をリングバッファに持つ。
+p50/p95/p99 はリングバッファから、件数・合計は起動からの累計で求める。
+
+無効のときは span() が共有の何もしないコンテキストを返すだけなので、ほとんどコストがかからない。
+有効化: 環境変数 COACH_PROFILE=1、または get_profiler().enabled = True (ADMIN_PASSWORD で認証した管理者パネルから切り替え)。
+環境変数 COACH_METRICS_PORT を指定すると、/metrics (Prometheus テキスト形式) と
+/metrics.json を返す HTTP サーバーをバックグラウンドで起動する。
+
+使い方:
+    with span("history.load"):
+        ...
+
+    @timed("tts.synthesize")
+    def synthesize(...): ...
+"""
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# スパンごとに保持する直近の件数
+RING_SIZE = 1024
+PERCENTILES = (50, 95, 99)
+METRIC_NAME = "coach_span_seconds"
+
+
+class _SpanStats:
+    """1スパン分の集計 (直近 RING_SIZE 件のリングバッファ + 累計)"""
+    __slots__ = ('ring', 'pos', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.ring = np.zeros(RING_SIZE, dtype=np.float64)
+        self.pos = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.ring[self.pos] = seconds
+        self.pos = (self.pos + 1) % RING_SIZE
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self):
+        recent = self.ring[:min(self.count, RING_SIZE)]
+        p = np.percentile(recent, PERCENTILES) if len(recent) else [0.0] * len(PERCENTILES)
+        result = {"count": self.count, "total_s": round(self.total, 6),
+                  "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+                  "max_ms": round(self.max * 1000, 3)}
+        result.update({f"p{q}_ms": round(v * 1000, 3) for q, v in zip(PERCENTILES, p)})
+        return result
+
+
+class _NullSpan:
+    """無効時に返す、何もしないコンテキスト"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('_profiler', '_name', '_start')
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        # 例外で抜けた場合も所要時間は記録する
+        self._profiler.record(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class Profiler:
+    """スパン名 -> 集計 のレジストリ。ワーカースレッドから記録してもよい"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._spans = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def timed(self, name):
+        """関数の呼び出しをスパンとして計測するデコレーター (無効時は判定1回のみ)"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def record(self, name, seconds):
+        """計測済みの所要時間 (秒) を記録する (無効時は何もしない)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = _SpanStats()
+            stats.add(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self.started_at = time.time()
+
+    # --- 出力 ---
+    def summary(self):
+        """スパン名 -> {count, total_s, mean_ms, max_ms, p50_ms, p95_ms, p99_ms} (名前順)"""
+        with self._lock:
+            return {name: self._spans[name].summary() for name in sorted(self._spans)}
+
+    def to_json(self):
+        return json.dumps({"enabled": self.enabled, "started_at": self.started_at,
+                           "spans": self.summary()}, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """Prometheus のテキスト形式 (summary 型。quantile は直近 RING_SIZE 件から)"""
+        lines = [f"# HELP {METRIC_NAME} Duration of instrumented spans in seconds.",
+                 f"# TYPE {METRIC_NAME} summary"]
+        for name, s in self.summary().items():
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            for q in PERCENTILES:
+                lines.append(f'{METRIC_NAME}{{span="{label}",quantile="{q / 100}"}} {s[f"p{q}_ms"] / 1000:.6f}')
+            lines.append(f'{METRIC_NAME}_sum{{span="{label}"}} {s["total_s"]:.6f}')
+            lines.append(f'{METRIC_NAME}_count{{span="{label}"}} {s["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+_profiler = Profiler(enabled=os.environ.get("COACH_PROFILE", "") not in ("", "0", "false"))
+
+
+def get_profiler():
+    return _profiler
+
+
+def span(name):
+    """共有プロファイラのスパン"""
+    return _profiler.span(name)
+
+
+def timed(name):
+    """共有プロファイラで関数の呼び出しを計測するデコレーター"""
+    return _profiler.timed(name)
+
+
+# --- エクスポート用の HTTP サーバー ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            body, content_type = _profiler.to_prometheus(), 'text/plain; version=0.0.4'
+        elif path == '/metrics.json':
+            body, content_type = _profiler.to_json(), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host='127.0.0.1'):
+    """
+    /metrics と /metrics.json を返す HTTP サーバーを起動する (プロセスで1回だけ)。
+    port を省略すると環境変数 COACH_METRICS_PORT を使い、どちらもなければ起動しない。
+    """
+    global _server
+    port = port or os.environ.get("COACH_METRICS_PORT")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            except OSError as e:
+                print(f"Metrics server start failed: {e}")
+                _server = False  # 再実行のたびに起動を試みない
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics-server").start()
+        return _server or None
@@ -0,0 +1,111 @@
+"""
+ストリーミング応答向けの、寛容なインクリメンタル JSON パーサー。
+
+モデルの出力を少しずつ feed() し、トップレベルのオブジェクトのフィールドが
+1つ完成するたびに取り出せるようにする。```json のフェンスや前後の説明文は無視する。
+"""
+import json
+
+
+class IncrementalJSONParser:
+    """
+    トップレベルの JSON オブジェクトを1文字ずつ走査し、完成したフィールドを fields に入れる。
+    feed() は新しく完成したフィールドがあれば True を返す。
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.fields = {}
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = None
+        self._token_start = None  # 現在のキー/値の開始位置
+        self._expect = 'key'  # 'key' -> 'colon' -> 'value'
+
+    def feed(self, text):
+        self.buffer += text
+        found = False
+        buf = self.buffer
+        while self._pos < len(buf) and not self.done:
+            ch = buf[self._pos]
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == 'key':
+                        self._key = self._parse(buf[self._token_start:self._pos + 1])
+                        self._expect = 'colon'
+                self._pos += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect == 'key':
+                    self._token_start = self._pos
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    found |= self._finish_value(buf, self._pos)
+                    self.done = True
+            elif ch == ':' and self._depth == 1 and self._expect == 'colon':
+                self._expect = 'value'
+                self._token_start = self._pos + 1
+            elif ch == ',' and self._depth == 1:
+                found |= self._finish_value(buf, self._pos)
+            self._pos += 1
+        return found
+
+    def _finish_value(self, buf, end):
+        """depth 1 の値が終わった位置で、キーと値を確定する"""
+        found = False
+        if self._expect == 'value' and self._key is not None:
+            value = self._parse(buf[self._token_start:end].strip())
+            if value is not _INVALID:
+                self.fields[self._key] = value
+                found = True
+        self._key = None
+        self._expect = 'key'
+        return found
+
+    @staticmethod
+    def _parse(text):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return _INVALID
+
+    def result(self):
+        """最終結果。全体が正しい JSON ならそれを、そうでなければ取り出せたフィールドを返す"""
+        start = self.buffer.find('{')
+        end = self.buffer.rfind('}')
+        if start != -1 and end > start:
+            value = self._parse(self.buffer[start:end + 1])
+            if isinstance(value, dict):
+                return value
+        return dict(self.fields)
+
+
+_INVALID = object()
+
+
+def parse_json_object(text):
+    """フェンスや説明文が混ざったテキストから JSON オブジェクトを取り出す"""
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    return parser.result()
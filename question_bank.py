@@ -0,0 +1,261 @@
+"""
+プロセス全体で共有する、読み取り専用の問題バンク。
+
+questions.json はプロセス内で1回だけ読み込み、全セッションで共有する。
+各セッションは出題順 (バンク内の位置の配列) だけを持ち、問題の dict をコピーしない。
+
+問題の文字列は1つの文字列テーブル (UTF-8) にまとめ、(開始位置, 長さ) の配列で引く。
+項目は参照されたときに初めてデコードする。
+同じ形式をバイナリのスナップショット (questions.snapshot) として保存しておけば、
+次回からは JSON を解析せずに読み込める。スナップショットは元ファイルの
+サイズ・更新時刻が変わっていれば SHA-1 で照合し、内容が違えば作り直す。
+
+使い方 (スナップショットの事前作成):
+    python question_bank.py [questions.json]
+"""
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+
+from instrumentation import timed
+
+QUESTIONS_FILE = 'questions.json'
+SNAPSHOT_SUFFIX = '.snapshot'
+SNAPSHOT_MAGIC = b'QBNK'
+SNAPSHOT_VERSION = 1
+
+# ファイルがない、または読み込み失敗時のデフォルト問題
+DEFAULT_QUESTIONS = [
+    {
+        "word": "Photography",
+        "word_jp": "写真撮影",
+        "word_en": "the art or practice of taking and processing photographs",
+        "en": "I am interested in photography.",
+        "jp": "私は写真に興味があります。"
+    },
+    {
+        "word": "Appointment",
+        "word_jp": "予約",
+        "word_en": "an arrangement to meet someone at a particular time and place",
+        "en": "I'd like to make an appointment.",
+        "jp": "予約を取りたいのですが。"
+    }
+]
+
+
+class Question(Mapping):
+    """バンク内の1問の読み取り専用ビュー (dict と同じように q['en'] / q.get('word_jp') で読める)"""
+    __slots__ = ('_bank', 'index')
+
+    def __init__(self, bank, index):
+        self._bank = bank
+        self.index = index
+
+    def __getitem__(self, field):
+        return self._bank.field(self.index, field)
+
+    def __iter__(self):
+        return (f for f in self._bank.fields if self._bank.has_field(self.index, f))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Question({dict(self)!r})"
+
+
+class QuestionBank:
+    """
+    文字列テーブル + (問題数, 項目数, 2) の int32 配列 (開始位置, 長さ。項目がなければ長さ -1)。
+    """
+
+    def __init__(self, fields, offsets, table, source=None):
+        self.fields = tuple(fields)
+        self._field_pos = {f: i for i, f in enumerate(self.fields)}
+        self._offsets = offsets
+        self._table = table
+        self.source = source or {}
+        self.load_error = None
+        # 出題・検索で毎回使う単語だけは先にデコードしておく
+        self.words = [self.field(i, 'word') for i in range(len(self))]
+        self._positions = {w: i for i, w in enumerate(self.words)}
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return Question(self, index % len(self))
+
+    def __iter__(self):
+        return (Question(self, i) for i in range(len(self)))
+
+    def has_field(self, index, field):
+        f = self._field_pos.get(field)
+        return f is not None and self._offsets[index, f, 1] >= 0
+
+    def field(self, index, field):
+        f = self._field_pos.get(field)
+        if f is None:
+            raise KeyError(field)
+        start, length = self._offsets[index, f]
+        if length < 0:
+            raise KeyError(field)
+        return self._table[start:start + length].decode('utf-8')
+
+    def position(self, word):
+        """単語 -> バンク内の位置 (なければ None)"""
+        return self._positions.get(word)
+
+    # --- 作成・保存 ---
+    @classmethod
+    def from_questions(cls, questions, source=None):
+        fields = []
+        for q in questions:
+            for key in q:
+                if key not in fields:
+                    fields.append(key)
+        offsets = np.full((len(questions), len(fields), 2), -1, dtype=np.int32)
+        parts = []
+        pos = 0
+        for i, q in enumerate(questions):
+            for f, key in enumerate(fields):
+                value = q.get(key)
+                if value is None:
+                    continue
+                data = str(value).encode('utf-8')
+                offsets[i, f] = (pos, len(data))
+                parts.append(data)
+                pos += len(data)
+        return cls(fields, offsets, b''.join(parts), source)
+
+    @classmethod
+    def from_json(cls, path=QUESTIONS_FILE):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        # 英文(en)が入っているデータのみを抽出
+        questions = [q for q in json.loads(raw) if q.get('en') and q.get('word')]
+        return cls.from_questions(questions, _source_info(path, raw))
+
+    def save_snapshot(self, path):
+        header = json.dumps({
+            "source": self.source,
+            "fields": list(self.fields),
+            "count": len(self),
+            "table_bytes": len(self._table),
+        }).encode('utf-8')
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC + struct.pack('<II', SNAPSHOT_VERSION, len(header)))
+            f.write(header)
+            f.write(self._offsets.astype('<i4').tobytes())
+            f.write(self._table)
+        os.replace(tmp, path)
+
+    @classmethod
+    def from_snapshot(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:4] != SNAPSHOT_MAGIC:
+            raise ValueError("not a question bank snapshot")
+        version, header_len = struct.unpack_from('<II', data, 4)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version: {version}")
+        start = 12 + header_len
+        header = json.loads(data[12:start])
+        n, n_fields = header['count'], len(header['fields'])
+        offsets = np.frombuffer(data, dtype='<i4', count=n * n_fields * 2, offset=start).reshape(n, n_fields, 2)
+        table_start = start + offsets.nbytes
+        table = data[table_start:table_start + header['table_bytes']]
+        if len(table) != header['table_bytes']:
+            raise ValueError("truncated snapshot")
+        return cls(header['fields'], offsets, table, header['source'])
+
+
+def _source_info(path, raw=None):
+    st = os.stat(path)
+    info = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if raw is not None:
+        info["sha1"] = hashlib.sha1(raw).hexdigest()
+    return info
+
+
+def _snapshot_status(bank, path):
+    """
+    スナップショットが元ファイルと同じ内容から作られたか。
+    "fresh": サイズ・更新時刻が一致、"touched": 更新時刻等だけが変わり内容は同じ、"stale": 内容が違う
+    """
+    source = bank.source
+    info = _source_info(path)
+    if source.get("size") == info["size"] and source.get("mtime_ns") == info["mtime_ns"]:
+        return "fresh"
+    # 更新時刻だけが変わった (チェックアウトし直した等) 場合は内容で確認する
+    with open(path, 'rb') as f:
+        return "touched" if source.get("sha1") == hashlib.sha1(f.read()).hexdigest() else "stale"
+
+
+@timed("questions.load")
+def load_question_bank(path=QUESTIONS_FILE, use_snapshot=True):
+    """スナップショットが新しければそれを、なければ JSON を読み込む (スナップショットは作り直す)"""
+    snapshot = path + SNAPSHOT_SUFFIX
+    if use_snapshot and os.path.exists(snapshot):
+        try:
+            bank = QuestionBank.from_snapshot(snapshot)
+            status = _snapshot_status(bank, path)
+            if status == "touched":
+                # 次回からハッシュを計算しなくて済むよう、新しいサイズ・更新時刻で保存し直す
+                bank.source.update(_source_info(path))
+                try:
+                    bank.save_snapshot(snapshot)
+                except OSError as e:
+                    print(f"Question snapshot save failed: {e}")
+            if status != "stale":
+                return bank
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Question snapshot load failed: {e}")
+    bank = QuestionBank.from_json(path)
+    if use_snapshot:
+        try:
+            bank.save_snapshot(snapshot)
+        except OSError as e:
+            print(f"Question snapshot save failed: {e}")
+    return bank
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+
+def get_question_bank(path=QUESTIONS_FILE):
+    """
+    プロセス内で共有する問題バンクを返す。
+    ファイルがない、または読み込みに失敗した場合はデフォルト問題 (失敗時は load_error にエラー内容)。
+    """
+    global _bank
+    with _bank_lock:
+        if _bank is None:
+            bank, error = None, None
+            if os.path.exists(path):
+                try:
+                    bank = load_question_bank(path)
+                except Exception as e:
+                    error = str(e)
+            if bank is None or len(bank) == 0:
+                bank = QuestionBank.from_questions(DEFAULT_QUESTIONS)
+                bank.load_error = error
+            _bank = bank
+        return _bank
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else QUESTIONS_FILE
+    b = QuestionBank.from_json(src)
+    b.save_snapshot(src + SNAPSHOT_SUFFIX)
+    print(f"{len(b)} questions -> {src + SNAPSHOT_SUFFIX}")
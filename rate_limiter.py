@@ -0,0 +1,171 @@
+"""
+Gemini 呼び出しのプロセス全体のレート制限。
+
+モデルごとに RPM (1分あたりのリクエスト数) と TPM (1分あたりのトークン数) の
+トークンバケットを持ち、空きが出るまで呼び出しを待たせる。
+待っている呼び出しは優先度順 (録音の判定 > ヒント・関連語などのバックグラウンド処理) に通す。
+授業の開始時のように多数の生徒が同じ API キーで一斉に呼び出しても、クォータを超えにくくする。
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+
+# 優先度 (小さいほど先に通す)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# モデルごとの上限 (環境変数 GEMINI_RPM / GEMINI_TPM で既定値を上書きできる)
+DEFAULT_RPM = int(os.environ.get("GEMINI_RPM", 60))
+DEFAULT_TPM = int(os.environ.get("GEMINI_TPM", 1_000_000))
+MODEL_LIMITS = {
+    # model_name: (rpm, tpm)
+}
+
+# 空きを待つ最大時間 (秒)
+ACQUIRE_TIMEOUT = 60
+
+
+class RateLimitTimeout(Exception):
+    """レート制限の空きを待ちきれなかった"""
+
+
+class TokenBucket:
+    """1分あたり per_minute 個まで補充されるトークンバケット (バースト上限も per_minute)"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """amount 個を取り出せるまでの秒数 (0 ならすぐ取り出せる)"""
+        self._refill(now)
+        # バケットより大きい要求は、満杯になれば通す
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= amount
+
+
+class _ModelBudget:
+    __slots__ = ('rpm', 'tpm', 'waiters', 'granted', 'throttled')
+
+    def __init__(self, rpm, tpm):
+        self.rpm = TokenBucket(rpm)
+        self.tpm = TokenBucket(tpm)
+        self.waiters = []  # (priority, seq, tokens)
+        self.granted = 0
+        self.throttled = 0  # 待たされた回数
+
+
+class RateLimiter:
+    """モデルごとの RPM/TPM 予算と優先度付きの待ち行列"""
+
+    def __init__(self, limits=None, default_rpm=DEFAULT_RPM, default_tpm=DEFAULT_TPM):
+        self.limits = dict(MODEL_LIMITS if limits is None else limits)
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self._budgets = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _budget(self, model_name):
+        budget = self._budgets.get(model_name)
+        if budget is None:
+            rpm, tpm = self.limits.get(model_name, (self.default_rpm, self.default_tpm))
+            budget = self._budgets[model_name] = _ModelBudget(rpm, tpm)
+        return budget
+
+    def acquire(self, model_name, tokens=1, priority=PRIORITY_INTERACTIVE, timeout=ACQUIRE_TIMEOUT):
+        """
+        リクエスト1回分と推定トークン数を予約する。
+        自分より優先度の高い (または先に並んだ) 呼び出しがいる間は待つ。
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            budget = self._budget(model_name)
+            entry = (priority, next(self._seq), tokens)
+            heapq.heappush(budget.waiters, entry)
+            waited = False
+            try:
+                while True:
+                    now = time.monotonic()
+                    if budget.waiters[0] is entry:
+                        delay = max(budget.rpm.wait_time(1, now), budget.tpm.wait_time(tokens, now))
+                        if delay == 0:
+                            heapq.heappop(budget.waiters)
+                            budget.rpm.take(1)
+                            budget.tpm.take(tokens)
+                            budget.granted += 1
+                            budget.throttled += waited
+                            # 次の先頭に順番を知らせる
+                            self._cond.notify_all()
+                            return
+                    else:
+                        delay = None
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise RateLimitTimeout(
+                            f"{model_name}: 利用上限のため混み合っています。しばらくしてからもう一度お試しください。")
+                    waited = True
+                    self._cond.wait(remaining if delay is None else min(delay, remaining))
+            except BaseException:
+                if entry in budget.waiters:
+                    budget.waiters.remove(entry)
+                    heapq.heapify(budget.waiters)
+                    self._cond.notify_all()
+                raise
+
+    def adjust(self, model_name, estimated, actual):
+        """実際のトークン数が分かったら、予約との差をバケットに反映する"""
+        if actual is None:
+            return
+        with self._cond:
+            self._budget(model_name).tpm.take(actual - estimated)
+
+    def penalize(self, model_name, seconds):
+        """429 を受けたら、その分だけ全体の送信を止める (RPM バケットを空にする)"""
+        with self._cond:
+            bucket = self._budget(model_name).rpm
+            bucket._refill(time.monotonic())
+            bucket.tokens = min(bucket.tokens, -seconds * bucket.rate)
+
+    def queue_depth(self):
+        """モデル名 -> 待っている呼び出しの数"""
+        with self._cond:
+            return {name: len(b.waiters) for name, b in self._budgets.items()}
+
+    def stats(self):
+        """モデル名 -> 待ち行列の長さ (優先度別)・通過数・待たされた回数・残りの予算"""
+        now = time.monotonic()
+        with self._cond:
+            result = {}
+            for name, b in self._budgets.items():
+                b.rpm._refill(now)
+                b.tpm._refill(now)
+                interactive = sum(1 for w in b.waiters if w[0] <= PRIORITY_INTERACTIVE)
+                result[name] = {
+                    "queued": len(b.waiters),
+                    "queued_interactive": interactive,
+                    "queued_background": len(b.waiters) - interactive,
+                    "granted": b.granted,
+                    "throttled": b.throttled,
+                    "rpm_available": max(0, int(b.rpm.tokens)),
+                    "tpm_available": max(0, int(b.tpm.tokens)),
+                }
+            return result
+
+
+_limiter = RateLimiter()
+
+
+def get_rate_limiter():
+    return _limiter
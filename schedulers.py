@@ -0,0 +1,227 @@
+"""
+復習スケジュールのアルゴリズム (差し替え可能)。
+
+- ladder: 従来の固定間隔 (連続正解数に応じて 0/1/3/7/14/30 日)
+- sm2:    SM-2 (単語ごとの易しさ係数 ease と間隔)
+- fsrs:   FSRS-4.5 (単語ごとの記憶の安定度 stability と難しさ difficulty)
+
+どのアルゴリズムも、履歴1件を共通の評点 (grade: 0-5、3 以上が合格) に変換してから使う。
+評点は発音スコアの高さ (80-89 点は Hard、95 点以上は Easy)・自己評価の Easy/Hard も反映する。
+各アルゴリズムの review() は単語の状態を1件分だけ更新して次回の期限 (秒) を返すので、
+ログが1件増えるたびに差分で更新できる。
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from history_schema import parse_bool
+
+_DAY_SECONDS = 86400
+
+# streak -> 復習間隔（日数）
+INTERVAL_DAYS = [0, 1, 3, 7, 14, 30]
+
+# 評点 (SM-2 の quality と同じ 0-5)。PASS_GRADE 以上を合格とする
+PASS_GRADE = 3
+GRADE_EASY = 5
+GRADE_GOOD = 4
+GRADE_HARD = 3  # 合格だが発音スコアがぎりぎり (80-89点)
+GRADE_NEAR_MISS = 2  # 発音が惜しかった (50点以上)
+GRADE_AGAIN = 1
+
+
+def interval_days(streak):
+    """連続正解数から次回までの間隔（日数）を返す"""
+    return INTERVAL_DAYS[min(streak, len(INTERVAL_DAYS) - 1)]
+
+
+def is_pass(action, score, is_correct, detail):
+    """1件の履歴が「合格」扱いかどうか"""
+    # 自己評価や発音スコアの考慮
+    if action == 'Pronunciation' and score < 80:
+        return False
+    if action == 'SelfRating' and detail == 'Hard':
+        return False
+    # シート由来の "FALSE" などの文字列を真とみなさない
+    return parse_bool(is_correct)
+
+
+def review_grade(action, score, is_correct, detail):
+    """履歴1件の評点 (0-5)。合格かどうかは is_pass と同じ"""
+    if not is_pass(action, score, is_correct, detail):
+        return GRADE_NEAR_MISS if action == 'Pronunciation' and score >= 50 else GRADE_AGAIN
+    if (action == 'SelfRating' and detail == 'Easy') or (action == 'Pronunciation' and score >= 95):
+        return GRADE_EASY
+    if action == 'Pronunciation' and score < 90:
+        return GRADE_HARD
+    return GRADE_GOOD
+
+
+def pass_mask(df):
+    """is_pass() を DataFrame の全行にまとめて適用した bool 配列"""
+    action = df['action'].astype(object)
+    score = pd.to_numeric(df['score'], errors='coerce')
+    is_correct = df['is_correct']
+    if is_correct.dtype != bool:
+        is_correct = is_correct.map(parse_bool).astype(bool)
+    failed = ((action == 'Pronunciation') & (score < 80)) | ((action == 'SelfRating') & (df['detail'] == 'Hard'))
+    return (is_correct & ~failed).to_numpy(dtype=bool)
+
+
+def grade_array(df):
+    """review_grade() を DataFrame の全行にまとめて適用した int8 配列"""
+    passed = pass_mask(df)
+    action = df['action'].astype(object)
+    score = pd.to_numeric(df['score'], errors='coerce').to_numpy(dtype=np.float64)
+    pron = (action == 'Pronunciation').to_numpy(dtype=bool)
+    easy = ((action == 'SelfRating') & (df['detail'] == 'Easy')).to_numpy(dtype=bool) | (pron & (score >= 95))
+    hard = pron & (score < 90)
+    near = pron & (score >= 50)
+    return np.where(passed, np.where(easy, GRADE_EASY, np.where(hard, GRADE_HARD, GRADE_GOOD)),
+                    np.where(near, GRADE_NEAR_MISS, GRADE_AGAIN)).astype(np.int8)
+
+
+class Scheduler:
+    """
+    スケジューラの共通インターフェース。
+    new_params() で単語ごとの状態を作り、review(state, seconds, grade) で更新して次回の期限 (秒) を返す。
+    state は srs.WordState (streak / params などを持つ)。streak はエンジン側で更新済み。
+    """
+    name = None
+    label = None
+
+    def new_params(self):
+        return None
+
+    def review(self, state, seconds, grade):
+        raise NotImplementedError
+
+
+class LadderScheduler(Scheduler):
+    """従来の固定間隔 (連続正解数だけで決まる)"""
+    name = "ladder"
+    label = "固定間隔 (0/1/3/7/14/30日)"
+
+    def review(self, state, seconds, grade):
+        return seconds + interval_days(state.streak) * _DAY_SECONDS
+
+
+class SM2Params:
+    __slots__ = ('reps', 'ease', 'interval', 'last')
+
+    def __init__(self):
+        self.reps = 0
+        self.ease = SM2Scheduler.INITIAL_EASE
+        self.interval = 0.0  # 日
+        self.last = None  # 前回の復習 (秒)
+
+
+class SM2Scheduler(Scheduler):
+    """
+    SM-2。正解を重ねるほど ease 倍で間隔が伸び、不正解で最初に戻る。
+    予定より遅れて正解した場合は、実際に空いた日数を元に次の間隔を決める。
+    同じ日のうちの2回目以降の正解 (1問の中の複数の判定) では間隔を伸ばさない。
+    """
+    name = "sm2"
+    label = "SM-2"
+    INITIAL_EASE = 2.5
+    MIN_EASE = 1.3
+
+    def new_params(self):
+        return SM2Params()
+
+    def review(self, state, seconds, grade):
+        p = state.params
+        elapsed = (seconds - p.last) / _DAY_SECONDS if p.last is not None else None
+        p.last = seconds
+        if grade < PASS_GRADE:
+            p.reps = 0
+            p.interval = 0.0
+        elif elapsed is not None and elapsed < 1 and p.reps > 0:
+            pass
+        else:
+            if p.reps == 0:
+                p.interval = 1.0
+            elif p.reps == 1:
+                p.interval = 6.0
+            else:
+                p.interval = max(p.interval, elapsed or 0.0) * p.ease
+            p.reps += 1
+            p.ease = max(self.MIN_EASE, p.ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+        return seconds + p.interval * _DAY_SECONDS
+
+
+class FSRSParams:
+    __slots__ = ('stability', 'difficulty', 'last')
+
+    def __init__(self):
+        self.stability = None  # 日 (初回の復習で決まる)
+        self.difficulty = None
+        self.last = None  # 前回の復習 (秒)
+
+
+class FSRSScheduler(Scheduler):
+    """
+    FSRS-4.5。想起率 R が desired_retention まで下がる日を次回の期限にする。
+    経過日数 (遅れ) と評点から stability / difficulty を更新する。
+    """
+    name = "fsrs"
+    label = "FSRS"
+    # FSRS-4.5 の既定パラメータ
+    W = (0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+         0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755)
+    DECAY = -0.5
+    FACTOR = 19 / 81
+    MAX_INTERVAL = 365.0  # 日
+
+    def __init__(self, desired_retention=0.9):
+        self.desired_retention = desired_retention
+        self._interval_ratio = (desired_retention ** (1 / self.DECAY) - 1) / self.FACTOR
+
+    def new_params(self):
+        return FSRSParams()
+
+    @staticmethod
+    def rating(grade):
+        """評点 (0-5) -> FSRS の評価 (1: Again, 2: Hard, 3: Good, 4: Easy)"""
+        if grade < PASS_GRADE:
+            return 1
+        return {GRADE_HARD: 2, GRADE_GOOD: 3}.get(grade, 4)
+
+    def _init_difficulty(self, rating):
+        return self.W[4] - (rating - 3) * self.W[5]
+
+    def review(self, state, seconds, grade):
+        w = self.W
+        p = state.params
+        g = self.rating(grade)
+        if p.stability is None:
+            p.stability = w[g - 1]
+            p.difficulty = min(10.0, max(1.0, self._init_difficulty(g)))
+        else:
+            elapsed = max(0.0, (seconds - p.last) / _DAY_SECONDS)
+            s, d = p.stability, p.difficulty
+            r = (1 + self.FACTOR * elapsed / s) ** self.DECAY
+            if g == 1:
+                s = w[11] * d ** -w[12] * ((s + 1) ** w[13] - 1) * math.exp(w[14] * (1 - r))
+            else:
+                hard = w[15] if g == 2 else 1.0
+                easy = w[16] if g == 4 else 1.0
+                s = s * (math.exp(w[8]) * (11 - d) * s ** -w[9] * (math.exp(w[10] * (1 - r)) - 1) * hard * easy + 1)
+            d = d - w[6] * (g - 3)
+            d = w[7] * self._init_difficulty(3) + (1 - w[7]) * d
+            p.stability = max(0.01, s)
+            p.difficulty = min(10.0, max(1.0, d))
+        p.last = seconds
+        interval = 0.0 if g == 1 else min(self.MAX_INTERVAL, p.stability * self._interval_ratio)
+        return seconds + interval * _DAY_SECONDS
+
+
+SCHEDULERS = {s.name: s for s in (LadderScheduler(), SM2Scheduler(), FSRSScheduler())}
+DEFAULT_SCHEDULER = "ladder"
+
+
+def get_scheduler(name=None):
+    """名前からスケジューラを返す (不明な名前・None は既定の固定間隔)"""
+    return SCHEDULERS.get(name or DEFAULT_SCHEDULER, SCHEDULERS[DEFAULT_SCHEDULER])
@@ -0,0 +1,137 @@
+"""
+問題バンクの単語どうしの字面の近さ (ネットワーク不要の類似度インデックス)。
+
+word / word_en / en の文字 3-gram を TF-IDF で重み付けしたベクトル (特徴ハッシング) にし、
+コサイン類似度の上位 k 件を全単語について事前に求めておく。
+結果は questions.json のハッシュ付きの .npy にキャッシュするので、2回目以降は読み込むだけで、
+近い単語の検索は配列の1行を引くだけで済む。
+"""
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+import numpy as np
+
+SIMILARITY_CACHE_DIR = '.sim_cache'
+# 単語ごとに保持する近い単語の数
+TOP_K = 10
+# 特徴ハッシングの次元数
+N_FEATURES = 2 ** 12
+NGRAM = 3
+# 項目ごとの重み (単語そのものの字面を一番重く見る)
+FIELD_WEIGHTS = {"word": 2.0, "word_en": 1.0, "en": 0.5}
+# 類似度の計算を分ける行数 (メモリを抑えるため)
+CHUNK_ROWS = 512
+
+
+def _ngrams(text):
+    text = f" {text.lower()} "
+    return [text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)]
+
+
+def vectorize(questions, n_features=N_FEATURES):
+    """問題ごとの L2 正規化済み TF-IDF ベクトル (行列) を返す"""
+    tf = np.zeros((len(questions), n_features), dtype=np.float32)
+    for row, q in enumerate(questions):
+        for field, weight in FIELD_WEIGHTS.items():
+            grams = _ngrams(q.get(field) or '')
+            if grams:
+                cols = np.fromiter((zlib.crc32(g.encode('utf-8')) % n_features for g in grams),
+                                   dtype=np.int64, count=len(grams))
+                np.add.at(tf[row], cols, weight)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((1 + len(questions)) / (1 + df)).astype(np.float32) + 1
+    # 長い英文に引っ張られないよう、出現回数は対数で抑える
+    vectors = np.log1p(tf) * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def top_k_neighbors(vectors, k=TOP_K):
+    """各行について、自分以外でコサイン類似度が高い k 行の位置 (n, k) を返す"""
+    n = len(vectors)
+    k = min(k, max(n - 1, 0))
+    neighbors = np.empty((n, k), dtype=np.int32)
+    if k == 0:
+        return neighbors
+    for start in range(0, n, CHUNK_ROWS):
+        sims = vectors[start:start + CHUNK_ROWS] @ vectors.T
+        rows = np.arange(len(sims))
+        sims[rows, rows + start] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1)
+        neighbors[start:start + len(sims)] = np.take_along_axis(top, order, axis=1)
+    return neighbors
+
+
+class SimilarityIndex:
+    """単語 -> 字面の近い単語 (類似度の高い順) の読み取り専用インデックス"""
+
+    def __init__(self, words, neighbors):
+        self.words = list(words)
+        self.neighbors = neighbors
+        self._positions = {w: i for i, w in enumerate(self.words)}
+
+    def __len__(self):
+        return len(self.words)
+
+    def similar_words(self, word, k=TOP_K):
+        i = self._positions.get(word)
+        if i is None:
+            return []
+        words = self.words
+        return [words[j] for j in self.neighbors[i, :k]]
+
+    @classmethod
+    def build(cls, questions, k=TOP_K):
+        questions = [q for q in questions if q.get('word')]
+        return cls([q['word'] for q in questions], top_k_neighbors(vectorize(questions), k))
+
+    @classmethod
+    def load_or_build(cls, questions_path='questions.json', cache_dir=SIMILARITY_CACHE_DIR, k=TOP_K):
+        """
+        questions.json の内容 (と設定) に対応するキャッシュがあれば読み込み、なければ作って保存する。
+        問題ファイルが変われば別のファイル名になるので、古いキャッシュは使われない。
+        """
+        with open(questions_path, 'rb') as f:
+            raw = f.read()
+        questions = [q for q in json.loads(raw) if q.get('word')]
+        settings = f"{k}:{N_FEATURES}:{NGRAM}:{sorted(FIELD_WEIGHTS.items())}".encode('utf-8')
+        digest = hashlib.sha1(raw + settings).hexdigest()[:16]
+        path = os.path.join(cache_dir, f"neighbors_{digest}.npy")
+        words = [q['word'] for q in questions]
+        try:
+            neighbors = np.load(path)
+            if neighbors.shape[0] == len(words):
+                return cls(words, neighbors)
+        except (OSError, ValueError):
+            pass
+        index = cls(words, top_k_neighbors(vectorize(questions), k))
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = path + '.tmp.npy'
+            np.save(tmp, index.neighbors)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Similarity cache save failed: {e}")
+        return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_similarity_index(questions_path='questions.json'):
+    """プロセス内で共有するインデックスを返す (問題ファイルがなければ空)"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = SimilarityIndex.load_or_build(questions_path)
+            except (OSError, ValueError) as e:
+                print(f"Similarity index build failed: {e}")
+                _index = SimilarityIndex([], np.empty((0, 0), dtype=np.int32))
+        return _index
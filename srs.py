@@ -0,0 +1,223 @@
+"""
+SRS (間隔反復) の状態管理。
+
+ユーザーごとに単語の streak / last_review / due (とスケジューラ固有の状態) を保持し、
+ログが1件追加されるたびにその単語だけを更新する。
+次回の期限の計算は schedulers のアルゴリズム (既定は固定間隔) に任せる。
+次に出題する単語は due 時刻のヒープから O(log N) で取り出す。
+"""
+import heapq
+import random
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from schedulers import INTERVAL_DAYS, PASS_GRADE, LadderScheduler, get_scheduler, grade_array, review_grade
+
+# 未学習単語の優先度（おすすめ単語よりは下、復習待ちよりは上）
+UNLEARNED_PRIORITY = 1000
+# 関連語チェインでおすすめされた単語の優先度 (最優先)
+RECOMMENDED_PRIORITY = 999999
+
+_EPOCH = datetime(1970, 1, 1)
+_DAY_SECONDS = 86400
+
+
+def _to_seconds(ts):
+    """datetime を固定エポックからの秒数に変換する (ヒープのキー用)"""
+    return (ts - _EPOCH).total_seconds()
+
+
+class WordState:
+    """1単語分のSRS状態"""
+    __slots__ = ('streak', 'last_review', 'due', 'version', 'params')
+
+    def __init__(self, params=None):
+        self.streak = 0
+        self.last_review = None
+        self.due = None  # 固定エポックからの秒数
+        self.version = 0
+        self.params = params  # スケジューラ固有の状態 (SM-2 の ease など)
+
+
+class SRSEngine:
+    """
+    1ユーザー分のSRS状態ストア。
+    record() で1件ずつ更新し、next_word() で最も優先度の高い単語を返す。
+    """
+
+    def __init__(self, user_name, scheduler=None):
+        self.user_name = user_name
+        self.scheduler = scheduler or get_scheduler()
+        self._states = {}
+        self._active = set()  # 出題対象としてヒープに載せる単語
+        self._heap = []  # (due秒, version, word)
+
+    # --- 構築 ---
+    @classmethod
+    @timed("srs.rebuild")
+    def from_history(cls, history_df, user_name, scheduler=None):
+        """
+        履歴DataFrameから状態を構築する。
+        単語・時刻順に並べ、各単語の末尾の連続合格数 (streak)・最終復習時刻を配列で求める。
+        固定間隔なら次回期限も配列で求め (Python のループは単語数だけ)、
+        それ以外のスケジューラは並べた配列を単語ごとに1回ずつ流して状態を更新する。
+        """
+        engine = cls(user_name, scheduler)
+        if history_df is None or history_df.empty or 'user' not in history_df.columns:
+            return engine
+
+        user_history = history_df[history_df['user'] == user_name]
+        if user_history.empty:
+            return engine
+
+        ts = pd.to_datetime(user_history['timestamp'], errors='coerce')
+        valid = ts.notna().to_numpy()
+        if not valid.any():
+            return engine
+        user_history, ts = user_history[valid], ts[valid]
+        seconds = ((ts - pd.Timestamp(_EPOCH)) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
+        grades = grade_array(user_history)
+        codes, words = pd.factorize(user_history['word'].astype(object))
+
+        # 単語 -> 時刻 の順。同時刻の場合は先に記録された方を「新しい」とみなす (従来の降順安定ソートと同じ)
+        n = len(codes)
+        order = np.lexsort((-np.arange(n), seconds, codes))
+        codes, seconds, grades = codes[order], seconds[order], grades[order]
+        passed = grades >= PASS_GRADE
+        stamps = ts.to_numpy()[order]
+
+        # 単語ごとの区切り (先頭・末尾の位置)
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], n] - 1
+        # 各位置までで最後に不合格だった位置 (単語をまたがないよう先頭-1 で下限を取る)
+        last_fail = np.maximum.accumulate(np.where(passed, -1, np.arange(n)))[ends]
+        streaks = ends - np.maximum(last_fail, starts - 1)
+        counts = ends - starts + 1
+        last_reviews = pd.DatetimeIndex(stamps[ends])
+
+        scheduler = engine.scheduler
+        if isinstance(scheduler, LadderScheduler):
+            intervals = np.asarray(INTERVAL_DAYS)[np.minimum(streaks, len(INTERVAL_DAYS) - 1)]
+            dues = (seconds[ends] + intervals * _DAY_SECONDS).tolist()
+        else:
+            dues = [None] * len(starts)
+        seconds_list, grades_list = seconds.tolist(), grades.tolist()
+
+        states = engine._states
+        for g, (word, streak, last_review, count) in enumerate(zip(
+                words[codes[starts]], streaks.tolist(), last_reviews, counts.tolist())):
+            state = states[word] = engine._new_state()
+            if dues[g] is None:
+                review = scheduler.review
+                for j in range(starts[g], ends[g] + 1):
+                    state.streak = state.streak + 1 if grades_list[j] >= PASS_GRADE else 0
+                    dues[g] = review(state, seconds_list[j], grades_list[j])
+            state.streak = streak
+            state.last_review = last_review
+            state.due = dues[g]
+            state.version = count
+        return engine
+
+    def _new_state(self):
+        return WordState(self.scheduler.new_params())
+
+    def register_words(self, words):
+        """出題対象の単語を登録する（未学習の単語はランダムな優先度でヒープに入る）"""
+        now = _to_seconds(datetime.now())
+        for word in words:
+            if word in self._active:
+                continue
+            self._active.add(word)
+            if word not in self._states:
+                state = self._new_state()
+                state.due = now - (UNLEARNED_PRIORITY + random.random()) * _DAY_SECONDS
+                self._states[word] = state
+            self._push(word)
+
+    # --- 更新 ---
+    def _apply(self, word, ts, grade):
+        state = self._states.get(word)
+        if state is None:
+            state = self._states[word] = self._new_state()
+        state.streak = state.streak + 1 if grade >= PASS_GRADE else 0
+        state.last_review = ts
+        state.due = self.scheduler.review(state, _to_seconds(ts), grade)
+        state.version += 1
+        return state
+
+    def _push(self, word):
+        state = self._states[word]
+        heapq.heappush(self._heap, (state.due, state.version, word))
+
+    def record(self, word, action, score, is_correct, detail, timestamp=None):
+        """ログ1件を反映する (O(log N))"""
+        ts = timestamp or datetime.now()
+        self._apply(word, ts, review_grade(action, score, is_correct, detail))
+        if word in self._active:
+            self._push(word)
+
+    # --- 参照 ---
+    def state(self, word):
+        return self._states.get(word)
+
+    def next_word(self, recommended=None):
+        """次に出題する単語を返す（古くなったヒープ要素は読み捨てる）"""
+        if recommended and recommended in self._active:
+            return recommended
+        heap = self._heap
+        while heap:
+            due, version, word = heap[0]
+            if self._states[word].version == version:
+                return word
+            heapq.heappop(heap)
+        return None
+
+    def pick_recommended(self, candidates, now=None):
+        """候補 (関連語など) のうち、問題バンクにあって復習期限が来ている最初の単語を返す"""
+        now_sec = _to_seconds(now or datetime.now())
+        for word in candidates:
+            if word in self._active and self._states[word].due <= now_sec:
+                return word
+        return None
+
+    def upcoming(self, k):
+        """優先度の高い順に最大 k 単語を返す (ヒープは元に戻す。O(k log N))"""
+        heap = self._heap
+        taken = []
+        while heap and len(taken) < k:
+            entry = heapq.heappop(heap)
+            if self._states[entry[2]].version == entry[1]:
+                taken.append(entry)
+        for entry in taken:
+            heapq.heappush(heap, entry)
+        return [word for _, _, word in taken]
+
+    def due_count(self, now=None):
+        """復習期限が来ている (学習済みの) 単語数"""
+        now_sec = _to_seconds(now or datetime.now())
+        return sum(1 for s in self._states.values() if s.last_review is not None and s.due <= now_sec)
+
+    def intervals(self):
+        """学習済みの単語ごとの、最終復習から次回期限までの日数"""
+        return [(s.due - _to_seconds(s.last_review)) / _DAY_SECONDS
+                for s in self._states.values() if s.last_review is not None]
+
+    @timed("srs.order")
+    def order(self, words, next_recommended_word=None):
+        """
+        単語リストを優先度の高い順に並べた位置 (words 内のインデックス) の配列を返す。
+        おすすめ単語 (関連語チェイン) があれば最優先にする。
+        """
+        words = list(words)
+        self.register_words(words)
+        states = self._states
+        dues = np.fromiter((states[w].due for w in words), dtype=np.float64, count=len(words))
+        priorities = (_to_seconds(datetime.now()) - dues) / _DAY_SECONDS
+        if next_recommended_word:
+            recommended = next_recommended_word.lower()
+            priorities[[i for i, w in enumerate(words) if w.lower() == recommended]] = RECOMMENDED_PRIORITY
+        # 優先度が高い順にソート (同じ優先度なら元の順)
+        return np.argsort(-priorities, kind='stable')
@@ -0,0 +1,109 @@
+"""
+履歴ログ (history.jsonl) を先頭から1回だけ流し読みして、全ユーザーのSRS状態を組み立て直すCLI。
+
+ファイル全体をメモリに載せず、1行ずつ読んでそのまま各ユーザーのエンジンに反映する。
+スケジューラごとに処理速度 (件/秒) と、現時点で復習期限が来ている単語数などを表示する。
+
+使い方:
+    python srs_replay.py                          # すべてのスケジューラで比較
+    python srs_replay.py --scheduler fsrs         # FSRS だけ
+    python srs_replay.py --log history.jsonl --json
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+from history_log import HISTORY_LOG_FILE
+from schedulers import SCHEDULERS, get_scheduler
+from srs import SRSEngine
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_events(path):
+    """ログを1行ずつ読み、(timestamp, record) を返す (壊れた行・時刻のない行は読み飛ばす)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            ts = _parse_timestamp(record.get('timestamp'))
+            if ts is not None:
+                yield ts, record
+
+
+def replay(events, scheduler):
+    """イベントを順に反映し、ユーザー名 -> SRSEngine を返す"""
+    engines = {}
+    for ts, r in events:
+        user = r.get('user')
+        engine = engines.get(user)
+        if engine is None:
+            engine = engines[user] = SRSEngine(user, scheduler)
+        score = r.get('score')
+        engine.record(r.get('word'), r.get('action'), score if score is not None else 0,
+                      r.get('is_correct'), r.get('detail'), timestamp=ts)
+    return engines
+
+
+def summarize(engines, now=None):
+    """復習期限が来ている単語数と、次回までの間隔 (日) の中央値"""
+    now = now or datetime.now()
+    intervals = sorted(i for engine in engines.values() for i in engine.intervals())
+    return {
+        "users": len(engines),
+        "words": len(intervals),
+        "due_now": sum(engine.due_count(now) for engine in engines.values()),
+        "median_interval_days": round(intervals[len(intervals) // 2], 2) if intervals else None,
+    }
+
+
+def run(path, scheduler_names, log=print):
+    results = []
+    for name in scheduler_names:
+        start = time.perf_counter()
+        counter = [0]
+
+        def counted(events):
+            for event in events:
+                counter[0] += 1
+                yield event
+
+        engines = replay(counted(iter_events(path)), get_scheduler(name))
+        elapsed = time.perf_counter() - start
+        result = {"scheduler": name, "events": counter[0], "seconds": round(elapsed, 3),
+                  "events_per_sec": round(counter[0] / elapsed) if elapsed > 0 else None}
+        result.update(summarize(engines))
+        results.append(result)
+        log(f"{name:>6}: {result['events']} events in {result['seconds']:.2f}s "
+            f"({result['events_per_sec']}/s), {result['users']} users, {result['words']} words, "
+            f"{result['due_now']} due now, median interval {result['median_interval_days']} days")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="履歴ログからSRS状態を再構築して速度を計測する")
+    parser.add_argument("--log", default=HISTORY_LOG_FILE)
+    parser.add_argument("--scheduler", choices=sorted(SCHEDULERS) + ["all"], default="all")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    args = parser.parse_args(argv)
+
+    names = sorted(SCHEDULERS) if args.scheduler == "all" else [args.scheduler]
+    results = run(args.log, names, log=(lambda *a: None) if args.json else print)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
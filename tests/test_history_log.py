@@ -0,0 +1,38 @@
+"""
+HistoryLog の書きかけの行 (書き込み中に落ちた等) の扱いの確認。
+"""
+from history_log import HistoryLog
+
+
+def write_torn_log(path):
+    """1件書いたあと、2件目の途中で落ちたログ"""
+    log = HistoryLog(str(path))
+    log.append({"a": 1})
+    log.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"a": 2, "b"')
+
+
+def test_append_after_torn_tail_keeps_new_record(tmp_path):
+    path = tmp_path / "history.jsonl"
+    write_torn_log(path)
+    log = HistoryLog(str(path))
+    log.append({"a": 3})
+    log.close()
+    records, _ = log.read_since(0)
+    assert records == [{"a": 1}, {"a": 3}]
+    assert log.invalid_lines == 1
+
+
+def test_load_all_compacts_torn_tail(tmp_path):
+    path = tmp_path / "history.jsonl"
+    write_torn_log(path)
+    log = HistoryLog(str(path))
+    records, offset = log.load_all()
+    assert records == [{"a": 1}]
+    assert offset == path.stat().st_size
+    assert path.read_bytes().endswith(b'\n')
+    log.append({"a": 3})
+    log.close()
+    assert log.read_since(0)[0] == [{"a": 1}, {"a": 3}]
+    assert log.read_since(offset)[0] == [{"a": 3}]
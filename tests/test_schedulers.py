@@ -0,0 +1,48 @@
+"""
+履歴1件 -> 評点 -> FSRS の評価 (Again / Hard / Good / Easy) の対応の確認。
+"""
+import pandas as pd
+import pytest
+
+from schedulers import FSRSScheduler, grade_array, review_grade
+from srs import WordState
+
+DAY = 86400
+
+# (action, score, is_correct, detail) -> FSRS の評価
+CASES = [
+    (("Pronunciation", 30, False, ""), 1),        # Again
+    (("Pronunciation", 70, False, ""), 1),        # Again (惜しい)
+    (("SelfRating", 0, False, "Hard"), 1),        # Again
+    (("Pronunciation", 85, True, ""), 2),         # Hard
+    (("Pronunciation", 92, True, ""), 3),         # Good
+    (("Japanese Meaning", 0, True, ""), 3),       # Good
+    (("Pronunciation", 97, True, ""), 4),         # Easy
+    (("SelfRating", 0, True, "Easy"), 4),         # Easy
+]
+
+
+@pytest.mark.parametrize("event, rating", CASES)
+def test_fsrs_rating(event, rating):
+    assert FSRSScheduler.rating(review_grade(*event)) == rating
+
+
+def test_grade_array_matches_review_grade():
+    df = pd.DataFrame([event for event, _ in CASES], columns=['action', 'score', 'is_correct', 'detail'])
+    assert grade_array(df).tolist() == [review_grade(*event) for event, _ in CASES]
+
+
+def review_interval(event):
+    """Good で1回復習したあと、10日後に event で復習したときの次回までの日数"""
+    scheduler = FSRSScheduler()
+    state = WordState(scheduler.new_params())
+    scheduler.review(state, 0, review_grade("Japanese Meaning", 0, True, ""))
+    return (scheduler.review(state, 10 * DAY, review_grade(*event)) - 10 * DAY) / DAY
+
+
+def test_fsrs_intervals_increase_with_rating():
+    again, hard, good, easy = (review_interval(event) for event in (
+        ("Pronunciation", 30, False, ""), ("Pronunciation", 85, True, ""),
+        ("Pronunciation", 92, True, ""), ("Pronunciation", 97, True, "")))
+    assert again == 0
+    assert 0 < hard < good < easy
@@ -0,0 +1,131 @@
+"""
+SRSEngine の出題順が、従来の smart_sort_questions (1問ずつ履歴を走査する実装) と一致することの確認。
+"""
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from history_schema import to_history_frame
+from srs import SRSEngine
+
+ACTIONS = ["Pronunciation", "Japanese Meaning", "English Definition", "SelfRating"]
+
+
+def legacy_smart_sort_questions(questions, history_df, user_name, next_recommended_word=None):
+    """従来の実装 (app.py にあったもの) をそのまま移したもの。比較の基準にする"""
+    now = datetime.now()
+    scored_questions = []
+
+    word_history_map = {}
+    if not history_df.empty and 'user' in history_df.columns:
+        user_history = history_df[history_df['user'] == user_name]
+        for record in user_history.to_dict('records'):
+            word_history_map.setdefault(record['word'], []).append(record)
+
+    for q in questions:
+        word = q['word']
+        if next_recommended_word and word.lower() == next_recommended_word.lower():
+            priority = 999999
+        else:
+            records = word_history_map.get(word, [])
+            streak = 0
+            last_review = None
+            valid_records = [r for r in records if isinstance(r['timestamp'], datetime)]
+            valid_records.sort(key=lambda x: x['timestamp'], reverse=True)
+            if valid_records:
+                last_review = valid_records[0]['timestamp']
+                for row in valid_records:
+                    is_pass = row['is_correct']
+                    if row['action'] == 'Pronunciation' and row['score'] < 80:
+                        is_pass = False
+                    if row['action'] == 'SelfRating' and row['detail'] == 'Hard':
+                        is_pass = False
+                    if is_pass:
+                        streak += 1
+                    else:
+                        break
+            interval = [0, 1, 3, 7, 14, 30][min(streak, 5)]
+            if last_review is None:
+                priority = 1000 + random.random()
+            else:
+                priority = (now - last_review).total_seconds() / 86400 - interval
+        q['priority'] = priority
+        scored_questions.append(q)
+
+    scored_questions.sort(key=lambda x: x['priority'], reverse=True)
+    return scored_questions
+
+
+def random_history(seed, n_events, n_words, users=("alice", "bob")):
+    """時刻の重複しない (並びが一意に決まる) ランダムな履歴"""
+    rnd = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    offsets = rnd.sample(range(1, 90 * 86400), n_events)
+    records = []
+    for offset in offsets:
+        action = rnd.choice(ACTIONS)
+        records.append({
+            "timestamp": (now - timedelta(seconds=offset)).strftime('%Y-%m-%d %H:%M:%S'),
+            "user": rnd.choice(users),
+            "word": f"word{rnd.randrange(n_words)}",
+            "action": action,
+            "score": rnd.choice([0, 50, 79, 80, 95, 100]) if action == "Pronunciation" else 0,
+            "is_correct": rnd.random() < 0.7,
+            "detail": rnd.choice(["Easy", "Hard"]) if action == "SelfRating" else "",
+        })
+    return records
+
+
+def legacy_order(words, df, user, seed, recommended=None):
+    random.seed(seed)
+    return [q['word'] for q in legacy_smart_sort_questions([{"word": w} for w in words], df, user, recommended)]
+
+
+def engine_order(engine, words, seed, recommended=None):
+    random.seed(seed)
+    return [words[i] for i in engine.order(words, recommended)]
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_order_matches_legacy(seed):
+    # 問題バンクには、一度も出題していない単語も含める
+    words = [f"word{i}" for i in range(60)]
+    df = to_history_frame(random_history(seed, 400, 50))
+    engine = SRSEngine.from_history(df, "alice")
+    assert engine_order(engine, words, seed) == legacy_order(words, df, "alice", seed)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_next_word_is_first_in_legacy_order(seed):
+    words = [f"word{i}" for i in range(40)]
+    df = to_history_frame(random_history(seed, 300, 40))
+    engine = SRSEngine.from_history(df, "alice")
+    engine_order(engine, words, seed)
+    assert engine.next_word() == legacy_order(words, df, "alice", seed)[0]
+
+
+def test_recommended_word_first():
+    words = [f"word{i}" for i in range(30)]
+    records = random_history(1, 200, 30)
+    df = to_history_frame(records)
+    recommended = next(r['word'] for r in records if r['user'] == "alice").upper()
+    engine = SRSEngine.from_history(df, "alice")
+    expected = legacy_order(words, df, "alice", 1, recommended)
+    assert expected[0].lower() == recommended.lower()
+    assert engine_order(engine, words, 1, recommended) == expected
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_incremental_record_matches_rebuild(seed):
+    """履歴の前半から作ったエンジンに後半を record() で足した結果が、全件で作り直した順と一致する"""
+    words = [f"word{i}" for i in range(40)]
+    records = sorted(random_history(seed, 300, 40, users=("alice",)), key=lambda r: r['timestamp'])
+    head, tail = records[:200], records[200:]
+    engine = SRSEngine.from_history(to_history_frame(head), "alice")
+    for r in tail:
+        engine.record(r['word'], r['action'], r['score'], r['is_correct'], r['detail'],
+                      pd.Timestamp(r['timestamp']).to_pydatetime())
+    df = to_history_frame(records)
+    assert engine_order(engine, words, seed) == legacy_order(words, df, "alice", seed)
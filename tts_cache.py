@@ -0,0 +1,194 @@
+"""
+ディスク上のTTS音声キャッシュ (コンテンツアドレス方式)。
+
+テキストと言語のハッシュをキーに MP3 を保存し、再起動後もそのまま再生できるようにする。
+合計サイズが上限を超えたら、最後に使われたのが古いものから削除する (LRU)。
+"""
+import hashlib
+import io
+import os
+import queue
+import threading
+import time
+
+from gtts import gTTS
+
+from instrumentation import timed
+
+TTS_CACHE_DIR = '.tts_cache'
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+
+# gTTS への外部呼び出しは最低この間隔を空ける (秒)
+MIN_SYNTH_INTERVAL = 0.5
+
+# 先読み (pre-warm) する問題数
+PREWARM_COUNT = 5
+
+
+def cache_key(text, lang='en'):
+    return hashlib.sha256(f"{lang}\0{text}".encode('utf-8')).hexdigest()
+
+
+@timed("tts.synthesize")
+def synthesize_gtts(text, lang='en'):
+    """gTTSで音声を生成してMP3のバイト列を返す"""
+    tts = gTTS(text, lang=lang)
+    mp3_fp = io.BytesIO()
+    tts.write_to_fp(mp3_fp)
+    return mp3_fp.getvalue()
+
+
+class TTSCache:
+    """
+    テキスト -> MP3 のディスクキャッシュ。
+    get() はキャッシュになければ合成して保存する。prewarm() はバックグラウンドで合成する。
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=MAX_CACHE_BYTES,
+                 synthesize=synthesize_gtts, min_interval=MIN_SYNTH_INTERVAL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.synthesize = synthesize
+        self.min_interval = min_interval
+
+        self._lock = threading.Lock()
+        self._synth_lock = threading.Lock()
+        self._last_synth = 0.0
+        self._total_bytes = None  # 初回の書き込み時に集計する
+
+        self.hits = 0
+        self.misses = 0
+
+        self._prewarm_queue = queue.Queue()
+        self._prewarm_thread = None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.mp3')
+
+    # --- 読み書き ---
+    def lookup(self, text, lang='en'):
+        """キャッシュにあればバイト列を返す (なければNone)"""
+        path = self._path(cache_key(text, lang))
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # LRU のために最終使用時刻を更新
+        except OSError:
+            pass
+        return data
+
+    def get(self, text, lang='en'):
+        """音声を返す。キャッシュになければ合成して保存する"""
+        if not text:
+            return None
+        data = self.lookup(text, lang)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        data = self._synthesize_limited(text, lang)
+        self._store(cache_key(text, lang), data)
+        return data
+
+    def _synthesize_limited(self, text, lang):
+        # 外部呼び出しのレートを抑える
+        with self._synth_lock:
+            wait = self._last_synth + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return self.synthesize(text, lang)
+            finally:
+                self._last_synth = time.monotonic()
+
+    def _store(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.mp3'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _evict(self):
+        """上限の9割まで、最終使用時刻が古いものから削除する"""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    # --- 先読み ---
+    def prewarm(self, texts, lang='en'):
+        """未キャッシュのテキストをバックグラウンドで合成しておく (事前生成ストアにあるものは除く)"""
+        store = _audio_store()
+        for text in texts:
+            if text and not (store and store.contains(text, lang)):
+                self._prewarm_queue.put((text, lang))
+        with self._lock:
+            if self._prewarm_thread is None or not self._prewarm_thread.is_alive():
+                self._prewarm_thread = threading.Thread(target=self._prewarm_worker, name="TTSPrewarm", daemon=True)
+                self._prewarm_thread.start()
+
+    def _prewarm_worker(self):
+        while True:
+            try:
+                text, lang = self._prewarm_queue.get(timeout=5.0)
+            except queue.Empty:
+                return
+            if os.path.exists(self._path(cache_key(text, lang))):
+                continue
+            store = _audio_store()
+            if store and store.contains(text, lang):
+                continue
+            try:
+                self._store(cache_key(text, lang), self._synthesize_limited(text, lang))
+            except Exception as e:
+                print(f"TTS prewarm failed: {e}")
+
+
+def _audio_store():
+    # audio_store は cache_key をこのモジュールから読み込むので、使うときに読み込む
+    from audio_store import get_audio_store
+    return get_audio_store()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """プロセス内で共有するTTSキャッシュを返す"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TTSCache()
+        return _cache
@@ -0,0 +1,132 @@
+"""
+questions.json の英文 (と単語) の音声をまとめて事前生成し、パック形式のストアに書き込むCLI。
+
+使い方:
+    python tts_pregen.py                      # gTTS で英文を生成
+    python tts_pregen.py --words --workers 8  # 単語の音声も生成
+    python tts_pregen.py --synth fake --store /tmp/fake_store  # ネットワークなしの代替合成器 (テスト用)
+
+--synth fake の出力は音声ではないので、アプリが読む既定のストアには書き込まない (--store が必須)。
+
+途中で止めても、もう一度実行すれば未生成の分だけを続きから生成する。
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from audio_store import AUDIO_STORE_PREFIX, AudioStoreWriter
+from tts_cache import cache_key, synthesize_gtts
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 2.0  # 秒
+
+
+def synthesize_fake(text, lang='en'):
+    """ネットワークを使わない代替合成器 (テキストから決まるダミーのバイト列)"""
+    return b'FAKE' + hashlib.sha256(f"{lang}\0{text}".encode('utf-8')).digest() * 8
+
+
+SYNTHESIZERS = {
+    "gtts": synthesize_gtts,
+    "fake": synthesize_fake,
+}
+
+
+class RateLimiter:
+    """全ワーカー共通で、1秒あたりの呼び出し回数を抑える"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def collect_texts(questions_path, include_words=False):
+    """生成対象のテキストを重複なく集める"""
+    with open(questions_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    texts = []
+    seen = set()
+    for q in data:
+        for field in (('en', 'word') if include_words else ('en',)):
+            text = q.get(field)
+            if text and text not in seen:
+                seen.add(text)
+                texts.append(text)
+    return texts
+
+
+def synthesize_with_retry(synthesize, limiter, text, lang):
+    """レート制限を守りつつ、失敗時は指数バックオフで再試行する"""
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.wait()
+        try:
+            return synthesize(text, lang)
+        except Exception:
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(BACKOFF_BASE * (2 ** attempt) * (0.5 + random.random() / 2))
+
+
+def pregenerate(texts, prefix=AUDIO_STORE_PREFIX, synthesize=synthesize_gtts,
+                lang='en', workers=4, rate=2.0, log=print):
+    """未生成のテキストを並列に合成してストアに追記する。(生成数, 失敗数) を返す"""
+    limiter = RateLimiter(rate)
+    done = failed = 0
+    with AudioStoreWriter(prefix) as writer:
+        todo = [t for t in texts if cache_key(t, lang) not in writer]
+        log(f"{len(texts)} texts, {len(texts) - len(todo)} already stored, {len(todo)} to generate")
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(synthesize_with_retry, synthesize, limiter, t, lang): t for t in todo}
+            for future in as_completed(futures):
+                text = futures[future]
+                try:
+                    # 書き込みはメインスレッドだけで行う
+                    writer.add(cache_key(text, lang), future.result())
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    log(f"failed: {text!r}: {e}")
+                if (done + failed) % 100 == 0:
+                    log(f"{done + failed}/{len(todo)} ({time.monotonic() - start:.1f}s)")
+    return done, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="questions.json の音声を事前生成する")
+    parser.add_argument("--questions", default="questions.json")
+    parser.add_argument("--store", help=f"出力先 (<store>.bin / <store>.idx、既定: {AUDIO_STORE_PREFIX})")
+    parser.add_argument("--words", action="store_true", help="単語 (word) の音声も生成する")
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0, help="1秒あたりの合成リクエスト数の上限")
+    parser.add_argument("--synth", choices=sorted(SYNTHESIZERS), default="gtts")
+    args = parser.parse_args(argv)
+    if args.store is None:
+        if args.synth == "fake":
+            parser.error("--synth fake では --store で出力先を指定してください (アプリの音声ストアに擬似データを書かないため)")
+        args.store = AUDIO_STORE_PREFIX
+
+    texts = collect_texts(args.questions, include_words=args.words)
+    done, failed = pregenerate(texts, prefix=args.store, synthesize=SYNTHESIZERS[args.synth],
+                               lang=args.lang, workers=args.workers, rate=args.rate)
+    print(f"generated: {done}, failed: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+問題バンク全体のヒント・関連語 (類義語・反意語) を事前計算したインデックス。
+
+word_index_pregen.py で生成し、アプリは読み込むだけ (LLM は呼ばない)。
+関連語は「単語 -> questions.json 内の位置」の対応表で問題に解決済みのリスト (chain) として持つので、
+関連語チェイン (次に出す単語の推薦) は辞書を1回引くだけで済む。
+
+ファイル形式 (JSON):
+    {"version": 1, "questions_sha1": ..., "words": [questions.json の順の単語],
+     "hints": {word: hint}, "related": {word: [関連語]}, "chain": {word: [words 内の位置]}}
+"""
+import hashlib
+import json
+import os
+import threading
+
+WORD_INDEX_FILE = 'word_index.json'
+WORD_INDEX_VERSION = 1
+
+
+def questions_sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def resolve_chain(words, related):
+    """関連語のうち問題バンクにあるものを、words 内の位置のリストにする"""
+    positions = {w.lower(): i for i, w in enumerate(words)}
+    chain = {}
+    for word, candidates in related.items():
+        own = positions.get(word.lower())
+        idx = []
+        for r in candidates:
+            i = positions.get(r.lower())
+            if i is not None and i != own and i not in idx:
+                idx.append(i)
+        if idx:
+            chain[word] = idx
+    return chain
+
+
+class WordIndex:
+    """ヒントと関連語の読み取り専用インデックス"""
+
+    def __init__(self, words=(), hints=None, related=None, chain=None):
+        self.words = list(words)
+        self.hints = hints or {}
+        self.related = related or {}
+        if chain is None:
+            chain = resolve_chain(self.words, self.related)
+        self._chain = chain
+
+    def __len__(self):
+        return len(self.related)
+
+    def hint(self, word):
+        return self.hints.get(word)
+
+    def related_words(self, word):
+        """問題バンクにある関連語 (推薦の候補) を返す"""
+        words = self.words
+        return [words[i] for i in self._chain.get(word, ())]
+
+    @classmethod
+    def load(cls, path=WORD_INDEX_FILE, questions_path='questions.json'):
+        """
+        インデックスを読み込む。questions.json が生成時から変わっていれば、
+        関連語の位置だけを現在の問題バンクで解決し直す。
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != WORD_INDEX_VERSION:
+            raise ValueError(f"unsupported word index version: {data.get('version')}")
+        words, chain = data['words'], data.get('chain')
+        if os.path.exists(questions_path) and questions_sha1(questions_path) != data.get('questions_sha1'):
+            with open(questions_path, 'r', encoding='utf-8') as f:
+                words = [q['word'] for q in json.load(f) if q.get('word')]
+            chain = None
+        if chain is not None:
+            chain = {w: list(idx) for w, idx in chain.items()}
+        return cls(words, data.get('hints'), data.get('related'), chain)
+
+    def save(self, path=WORD_INDEX_FILE, questions_path='questions.json'):
+        """一時ファイルに書いてから置き換える (途中で止まっても壊れない)"""
+        data = {
+            "version": WORD_INDEX_VERSION,
+            "questions_sha1": questions_sha1(questions_path) if os.path.exists(questions_path) else None,
+            "words": self.words,
+            "hints": self.hints,
+            "related": self.related,
+            "chain": self._chain,
+        }
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, path)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_word_index(path=WORD_INDEX_FILE):
+    """プロセス内で共有するインデックスを返す (生成されていなければ空のインデックス)"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = WordIndex.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                if os.path.exists(path):
+                    print(f"Word index load failed: {e}")
+                _index = WordIndex()
+        return _index
@@ -0,0 +1,106 @@
+"""
+questions.json の全単語のヒントと関連語 (類義語・反意語) を Gemini でまとめて生成し、
+word_index.json に書き込むCLI。
+
+使い方:
+    GEMINI_API_KEY=... python word_index_pregen.py
+    python word_index_pregen.py --model gemini-2.5-flash --workers 4 --rpm 30
+
+途中で止めても、もう一度実行すれば未生成の単語だけを続きから生成する。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from evaluators import generate_ai_hint, get_related_words_ai
+from rate_limiter import DEFAULT_TPM, get_rate_limiter
+from word_index import WORD_INDEX_FILE, WordIndex
+
+# 途中経過を保存する間隔 (単語数)
+SAVE_EVERY = 50
+# generate_ai_hint が失敗時に返す値
+HINT_UNAVAILABLE = "Hint not available"
+
+
+def load_entries(questions_path):
+    with open(questions_path, 'r', encoding='utf-8') as f:
+        return [q for q in json.load(f) if q.get('word')]
+
+
+def generate_entry(q, api_key, model_name):
+    """1単語分の (ヒント, 関連語) を生成する。どちらかが失敗したら例外"""
+    word = q['word']
+    hint = generate_ai_hint(word, q.get('word_en') or q.get('word_jp') or '', api_key, model_name)
+    if hint == HINT_UNAVAILABLE:
+        raise RuntimeError("hint generation failed")
+    related = get_related_words_ai(word, api_key, model_name)
+    if not related:
+        raise RuntimeError("related word generation failed")
+    seen = {word.lower()}
+    unique = []
+    for r in related:
+        if r and r not in seen:
+            seen.add(r)
+            unique.append(r)
+    return hint, unique
+
+
+def pregenerate(questions_path, out_path, api_key, model_name, workers=4, log=print):
+    """未生成の単語を並列に生成してインデックスに追記する。(生成数, 失敗数) を返す"""
+    entries = load_entries(questions_path)
+    try:
+        previous = WordIndex.load(out_path, questions_path)
+        hints, related = dict(previous.hints), dict(previous.related)
+    except (OSError, ValueError, KeyError):
+        hints, related = {}, {}
+    words = [q['word'] for q in entries]
+
+    def save():
+        WordIndex(words, hints, related).save(out_path, questions_path)
+
+    todo = [q for q in entries if q['word'] not in related]
+    log(f"{len(entries)} words, {len(entries) - len(todo)} already indexed, {len(todo)} to generate")
+    done = failed = 0
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(generate_entry, q, api_key, model_name): q['word'] for q in todo}
+        for future in as_completed(futures):
+            word = futures[future]
+            try:
+                # 書き込みはメインスレッドだけで行う
+                hints[word], related[word] = future.result()
+                done += 1
+            except Exception as e:
+                failed += 1
+                log(f"failed: {word!r}: {e}")
+            if (done + failed) % SAVE_EVERY == 0:
+                save()
+                log(f"{done + failed}/{len(todo)} ({time.monotonic() - start:.1f}s)")
+    save()
+    return done, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="questions.json のヒントと関連語を事前生成する")
+    parser.add_argument("--questions", default="questions.json")
+    parser.add_argument("--out", default=WORD_INDEX_FILE)
+    parser.add_argument("--model", default="gemini-2.5-flash-lite")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rpm", type=int, default=None, help="1分あたりのリクエスト数の上限")
+    args = parser.parse_args(argv)
+    if not args.api_key:
+        parser.error("--api-key か環境変数 GEMINI_API_KEY が必要です")
+    if args.rpm:
+        get_rate_limiter().limits[args.model] = (args.rpm, DEFAULT_TPM)
+
+    done, failed = pregenerate(args.questions, args.out, args.api_key, args.model, workers=args.workers)
+    print(f"generated: {done}, failed: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())